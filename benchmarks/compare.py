@@ -0,0 +1,29 @@
+'''Prints JSON reports written by load_generator.py side by side:
+
+    python benchmarks/compare.py threaded.json asyncio.json
+'''
+import json
+import sys
+
+
+COLUMNS = [("ops/s", lambda r: r["ops_per_sec"]), ("p50 ms", lambda r: r["latency_ms"]["p50"]),
+           ("p99 ms", lambda r: r["latency_ms"]["p99"]), ("p999 ms", lambda r: r["latency_ms"]["p999"]),
+           ("hit rate", lambda r: r["get_hits"] / r["gets"] if r["gets"] else 0.0)]
+
+
+def compare(paths: list[str]) -> str:
+    reports = []
+    for path in paths:
+        with open(path) as f:
+            reports.append(json.load(f))
+
+    name_width = max(len(path) for path in paths)
+    lines = ["  ".join([f"{'run':<{name_width}}", "commit  "] + [f"{name:>10}" for name, _ in COLUMNS])]
+    for path, report in zip(paths, reports):
+        values = [f"{column(report):>10.3f}" for _, column in COLUMNS]
+        lines.append("  ".join([f"{path:<{name_width}}", f"{report['commit'] or '-':<8}"] + values))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(compare(sys.argv[1:]))
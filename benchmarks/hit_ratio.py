@@ -0,0 +1,89 @@
+'''Trace-driven hit ratio comparison of the eviction policies.
+
+Replays a trace of key accesses against one table per policy, cache-aside style (a get, and a
+set of the key after a miss), under the same memory limit. The trace is either a file with one
+key per line or generated: zipf-distributed requests for a working set, interrupted every
+--scan_every requests by a scan of --scan_length keys that are never requested again, like a
+batch job walking a catalog:
+
+    python benchmarks/hit_ratio.py --key_space 10000 --scan_every 20000 --scan_length 5000
+    python benchmarks/hit_ratio.py --trace production_keys.txt --memory_limit 1048576
+'''
+import argparse
+import json
+import os
+import random
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.load_generator import build_key_sampler
+from memcached.hash_table import Command
+from memcached.server import EVICTION_POLICIES
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description='Compare eviction policy hit ratios on a trace')
+    parser.add_argument('--trace', type=str, default=None, help="file with one key per line")
+    parser.add_argument('--requests', type=int, default=200000, help="length of a generated trace")
+    parser.add_argument('--key_space', type=int, default=10000)
+    parser.add_argument('--zipf_exponent', type=float, default=0.9)
+    parser.add_argument('--scan_every', type=int, default=20000, help="requests between scans, 0 for none")
+    parser.add_argument('--scan_length', type=int, default=5000)
+    parser.add_argument('--value_size', type=int, default=100)
+    parser.add_argument('--memory_limit', type=int, default=256 * 1024, help="bytes the cache may hold")
+    parser.add_argument('--policies', type=str, nargs="+", choices=list(EVICTION_POLICIES),
+                        default=list(EVICTION_POLICIES))
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def generate_trace(requests: int, key_space: int, zipf_exponent: float, scan_every: int, scan_length: int,
+                   seed: int) -> list[str]:
+    rng = random.Random(seed)
+    sample_key = build_key_sampler(key_space, "zipf", zipf_exponent, rng)
+    trace, scans = [], 0
+    while len(trace) < requests:
+        if scan_every and len(trace) % scan_every == scan_every - 1:
+            trace += [f"scan{scans}:{i}" for i in range(scan_length)]
+            scans += 1
+        trace.append(f"key{sample_key()}")
+    return trace[:requests]
+
+
+def read_trace(path: str) -> list[str]:
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def replay(table, trace: list[str], value: bytes) -> dict:
+    hits = 0
+    for key in trace:
+        if table.get(key) is not None:
+            hits += 1
+        else:
+            table.insert(key, value, 0, len(value), 0, Command.SET)
+    return {"hits": hits, "misses": len(trace) - hits, "hit_ratio": round(hits / len(trace), 4) if trace else 0.0,
+            "evictions": table.get_evictions()}
+
+
+def compare_policies(trace: list[str], memory_limit: int, value_size: int, policies: list[str]) -> dict:
+    value = b"x" * value_size
+    return {policy: replay(EVICTION_POLICIES[policy](1024, memory_limit), trace, value) for policy in policies}
+
+
+def main(argv=None):
+    config = get_args(argv)
+    if config.trace is not None:
+        trace = read_trace(config.trace)
+    else:
+        trace = generate_trace(config.requests, config.key_space, config.zipf_exponent, config.scan_every,
+                               config.scan_length, config.seed)
+    report = {"config": vars(config), "requests": len(trace),
+              "policies": compare_policies(trace, config.memory_limit, config.value_size, config.policies)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
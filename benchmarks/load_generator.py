@@ -0,0 +1,205 @@
+'''memtier-style load generator for the memcached server.
+
+Spawns main.py (or targets a running server with --no_spawn), drives it from one or more worker
+processes each holding many connections, and prints throughput and latency percentiles as JSON:
+
+    python benchmarks/load_generator.py --connections 50 --requests 2000 --ratio 1:9 \
+        --distribution zipf --pipeline 8 --server_args="--engine asyncio" --output asyncio.json
+'''
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import time
+from bisect import bisect
+from itertools import accumulate
+
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_PORT = 11311
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark a memcached server')
+    parser.add_argument('--host', type=str, default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--no_spawn', action="store_true", help="benchmark a server that is already running")
+    parser.add_argument('--server_args', type=str, default="", help="extra arguments for main.py")
+    parser.add_argument('--processes', type=int, default=1, help="worker processes generating load")
+    parser.add_argument('--connections', type=int, default=10, help="connections per worker process")
+    parser.add_argument('--requests', type=int, default=1000, help="requests per connection")
+    parser.add_argument('--duration', type=float, default=None, help="stop each connection after this many seconds")
+    parser.add_argument('--key_space', type=int, default=10000)
+    parser.add_argument('--distribution', type=str, choices=["uniform", "zipf"], default="uniform")
+    parser.add_argument('--zipf_exponent', type=float, default=1.0)
+    parser.add_argument('--value_size', type=int, default=100)
+    parser.add_argument('--ratio', type=str, default="1:10", help="set:get ratio")
+    parser.add_argument('--pipeline', type=int, default=1, help="requests sent per round trip")
+    parser.add_argument('--no_prefill', action="store_true", help="skip storing every key before the run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None, help="also write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+def build_key_sampler(key_space: int, distribution: str, zipf_exponent: float, rng: random.Random):
+    '''Returns a function drawing key indexes; with zipf, index 0 is the most popular key'''
+    if distribution == "uniform":
+        return lambda: rng.randrange(key_space)
+    cum_weights = list(accumulate(1 / (rank ** zipf_exponent) for rank in range(1, key_space + 1)))
+    total = cum_weights[-1]
+    return lambda: min(bisect(cum_weights, rng.random() * total), key_space - 1)
+
+
+def parse_ratio(ratio: str) -> float:
+    '''Returns the fraction of requests that are gets for a set:get ratio such as 1:10'''
+    sets, gets = (int(part) for part in ratio.split(":"))
+    return gets / (sets + gets)
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def run_connection(config, seed: int, latencies: list[float], counts: dict):
+    rng = random.Random(seed)
+    sample_key = build_key_sampler(config.key_space, config.distribution, config.zipf_exponent, rng)
+    get_fraction = parse_ratio(config.ratio)
+    value = b"x" * config.value_size
+    deadline = time.perf_counter() + config.duration if config.duration else None
+
+    reader, writer = await asyncio.open_connection(config.host, config.port)
+    remaining = config.requests
+    while remaining > 0 and (deadline is None or time.perf_counter() < deadline):
+        batch = [rng.random() < get_fraction for _ in range(min(config.pipeline, remaining))]
+        request = []
+        for is_get in batch:
+            key = b"key:%d" % sample_key()
+            if is_get:
+                request.append(b"get %b\r\n" % key)
+            else:
+                request.append(b"set %b 0 0 %d\r\n%b\r\n" % (key, len(value), value))
+
+        start = time.perf_counter()
+        writer.write(b"".join(request))
+        await writer.drain()
+        for is_get in batch:
+            if is_get:
+                response = await reader.readuntil(b"END\r\n")
+                counts["gets"] += 1
+                counts["get_hits"] += response.startswith(b"VALUE")
+            else:
+                await reader.readline()
+                counts["sets"] += 1
+            latencies.append(time.perf_counter() - start)
+        remaining -= len(batch)
+
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_connections(config, worker_index: int):
+    latencies = []
+    counts = {"gets": 0, "sets": 0, "get_hits": 0}
+    seeds = [config.seed * 1000003 + worker_index * config.connections + i for i in range(config.connections)]
+    await asyncio.gather(*(run_connection(config, seed, latencies, counts) for seed in seeds))
+    return latencies, counts
+
+
+def run_worker(config, worker_index: int):
+    return asyncio.run(run_connections(config, worker_index))
+
+
+def prefill(config):
+    value = b"x" * config.value_size
+    with socket.create_connection((config.host, config.port)) as s:
+        for start in range(0, config.key_space, 100):
+            keys = range(start, min(start + 100, config.key_space))
+            s.sendall(b"".join(b"set key:%d 0 0 %d noreply\r\n%b\r\n" % (key, len(value), value) for key in keys))
+        # a final acknowledged set guarantees everything before it was processed
+        s.sendall(b"set key:0 0 0 %d\r\n%b\r\n" % (len(value), value))
+        s.recv(1024)
+
+
+def spawn_server(config):
+    command = [sys.executable, os.path.join(REPO_ROOT, "main.py"), f"--host={config.host}",
+               f"--port={config.port}", f"--max_threads={config.processes * config.connections + 1}",
+               "--log_level=WARNING"] + shlex.split(config.server_args)
+    process = subprocess.Popen(command)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((config.host, config.port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError("Server did not start listening")
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(config) -> dict:
+    process = None if config.no_spawn else spawn_server(config)
+    try:
+        if not config.no_prefill:
+            prefill(config)
+
+        start = time.perf_counter()
+        if config.processes == 1:
+            results = [run_worker(config, 0)]
+        else:
+            with multiprocessing.Pool(config.processes) as pool:
+                results = pool.starmap(run_worker, [(config, i) for i in range(config.processes)])
+        elapsed = time.perf_counter() - start
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    latencies = sorted(latency for worker_latencies, _ in results for latency in worker_latencies)
+    counts = {name: sum(worker_counts[name] for _, worker_counts in results) for name in results[0][1]}
+    return {
+        "commit": get_commit(),
+        "config": vars(config),
+        "operations": len(latencies),
+        "duration_s": elapsed,
+        "ops_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "mean": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+            "p50": 1000 * percentile(latencies, 0.5),
+            "p99": 1000 * percentile(latencies, 0.99),
+            "p999": 1000 * percentile(latencies, 0.999),
+            "max": 1000 * latencies[-1] if latencies else 0.0,
+        },
+        **counts,
+        "get_misses": counts["gets"] - counts["get_hits"],
+    }
+
+
+def main(argv=None):
+    config = get_args(argv)
+    report = run_benchmark(config)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if config.output:
+        with open(config.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
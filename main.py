@@ -1,19 +1,86 @@
 import argparse 
-from memcached.server import ThreadedServer, DEFAULT_HOST, DEFAULT_PORT
+import logging
+import re
+from memcached.server import (ThreadedServer, AsyncServer, PreforkServer, DEFAULT_HOST, DEFAULT_PORT, TABLE_ENGINES, 
+                              EVICTION_POLICIES)
+from memcached.shared_table import SharedHashTable
+from memcached.snapshot import Snapshotter
+from memcached.message import Message
+from memcached.compression import Compressor
+from memcached.hotkeys import HotKeyTracker
+from memcached.profiling import SlowLog
 
 
-def get_port_and_host():
+def parse_size(size):
+    '''Parses a byte count with an optional k or m suffix, as memcached's -I accepts'''
+    match = re.fullmatch(r"(\d+)([kKmM]?)", size)
+    if match is None:
+        raise argparse.ArgumentTypeError(f"invalid size {size}")
+    multiplier = {"": 1, "k": 1024, "m": 1024 * 1024}[match.group(2).lower()]
+    return int(match.group(1)) * multiplier
+
+
+def get_args():
     parser = argparse.ArgumentParser(description='Start up memcached server')
     parser.add_argument('--port', type=int, default=DEFAULT_PORT)
     parser.add_argument('--host', type=str, default=DEFAULT_HOST)
     parser.add_argument('--max_threads', type=int, default=4)
-    args = parser.parse_args()
-    return args.port, args.host, args.max_threads
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('-m', '--memory_limit', type=int, default=64, help="item memory limit in megabytes")
+    parser.add_argument('-I', '--max_item_size', type=parse_size, default=Message.MAX_ITEM_SIZE, 
+                        help="largest value in bytes, with an optional k or m suffix")
+    parser.add_argument('--compress_threshold', type=parse_size, default=None, 
+                        help="compress values of at least this many bytes with zlib")
+    parser.add_argument('--compress_level', type=int, choices=range(-1, 10), default=Compressor.DEFAULT_LEVEL, 
+                        metavar="{-1..9}", help="zlib compression level")
+    parser.add_argument('--table', type=str, choices=list(TABLE_ENGINES), default="chained")
+    parser.add_argument('--eviction', type=str, choices=list(EVICTION_POLICIES), default="lru", 
+                        help="eviction policy of the chained table")
+    parser.add_argument('--engine', type=str, choices=["threaded", "asyncio"], default="threaded")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes sharing the cache")
+    parser.add_argument('--slot_size', type=int, default=SharedHashTable.DEFAULT_VALUE_SIZE, 
+                        help="largest value in bytes when running several workers")
+    parser.add_argument('--snapshot', type=str, default=None, help="file to save the cache to periodically and on exit")
+    parser.add_argument('--snapshot_interval', type=float, default=Snapshotter.DEFAULT_INTERVAL, help="seconds between snapshots")
+    parser.add_argument('--restore', type=str, default=None, help="snapshot file to load at startup")
+    parser.add_argument('--hotkey_sample_rate', type=float, default=HotKeyTracker.DEFAULT_SAMPLE_RATE, 
+                        help="share of keys sampled for stats hotkeys, 0 to turn tracking off")
+    parser.add_argument('--slowlog_threshold', type=int, default=SlowLog.DEFAULT_THRESHOLD, 
+                        help="microseconds after which a command is logged in stats slowlog, 0 to turn it off")
+    parser.add_argument('--log_level', type=str, choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO")
+    return parser.parse_args()
 
 
 def run_server():
-    port, host, max_threads = get_port_and_host()
-    with ThreadedServer(host, port, max_threads) as server:
+    args = get_args()
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    memory_limit = args.memory_limit * 1024 * 1024
+    server_args = {"restore_path": args.restore, "snapshot_path": args.snapshot, 
+                   "snapshot_interval": args.snapshot_interval, "max_item_size": args.max_item_size, 
+                   "hotkey_sample_rate": args.hotkey_sample_rate, "slowlog_threshold": args.slowlog_threshold}
+    if args.workers > 1:
+        if args.compress_threshold is not None:
+            logging.warning("Values are not compressed when running several workers")
+        # the workers share fixed-size slots in shared memory, evicted by CLOCK 
+        if args.table != "chained":
+            logging.warning("--table %s is ignored when running several workers", args.table)
+        if args.eviction != "lru":
+            logging.warning("--eviction %s is ignored when running several workers", args.eviction)
+        shards = args.shards if args.shards > 1 else SharedHashTable.DEFAULT_SHARDS
+        server = PreforkServer(args.host, args.port, args.workers, args.max_threads, shards=shards, 
+                               memory_limit=memory_limit, value_size=args.slot_size, engine=args.engine, 
+                               **server_args)
+    elif args.engine == "asyncio":
+        server = AsyncServer(args.host, args.port, memory_limit=memory_limit, table_engine=args.table, 
+                             compress_threshold=args.compress_threshold, compress_level=args.compress_level, 
+                             eviction_policy=args.eviction, **server_args)
+    else:
+        server = ThreadedServer(args.host, args.port, args.max_threads, shards=args.shards, 
+                                memory_limit=memory_limit, table_engine=args.table, 
+                                compress_threshold=args.compress_threshold, compress_level=args.compress_level, 
+                                eviction_policy=args.eviction, **server_args)
+
+    with server:
         server.run()
 
 
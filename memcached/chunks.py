@@ -0,0 +1,92 @@
+# values larger than this are received into and stored as a chain of chunks of this size
+CHUNK_SIZE = 16 * 1024
+
+
+class ChunkedValue:
+
+    '''A large value kept as a list of fixed-size chunks, like memcached's chunked items. It is
+    never joined into one bytes object: chunks are filled as data arrives and written back to
+    clients with one scatter-gather call over the list'''
+
+    __slots__ = ("chunks", "byte_count")
+
+    def __init__(self, chunks: list[bytearray], byte_count: int):
+        self.chunks = chunks
+        self.byte_count = byte_count
+
+    def __len__(self) -> int:
+        return self.byte_count
+
+    def __bytes__(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+def value_buffers(value) -> list:
+    '''Returns the buffers to write for a stored value, without copying chunked values'''
+    if isinstance(value, ChunkedValue):
+        return value.chunks
+    return [value]
+
+
+def concat_values(first, second):
+    '''Joins two stored values. Short results are plain bytes; longer ones chain the chunks of
+    both values, so appending to a large value does not copy it'''
+    first_buffers, second_buffers = value_buffers(first), value_buffers(second)
+    buffers = first_buffers + second_buffers
+    byte_count = sum(len(buffer) for buffer in buffers)
+    if byte_count <= CHUNK_SIZE:
+        return b"".join(buffers)
+
+    # merge the two chunks at the seam if they fit in one, so repeated small appends do not
+    # leave a long chain of tiny chunks
+    seam = len(first_buffers)
+    if len(buffers[seam - 1]) + len(buffers[seam]) <= CHUNK_SIZE:
+        buffers[seam - 1:seam + 1] = [b"".join(buffers[seam - 1:seam + 1])]
+    return ChunkedValue(buffers, byte_count)
+
+
+class ChunkReceiver:
+
+    '''Collects a value of known size directly into chunks as it arrives, either copied from data
+    already read or read into the current chunk by the caller via get_buffer. With discard set the
+    bytes are counted but dropped, for values too large to store'''
+
+    def __init__(self, byte_count: int, discard: bool = False):
+        self.byte_count = byte_count
+        self.remaining = byte_count
+        self.discard = discard
+        self.chunks = []
+        self.filled = 0
+
+    def done(self) -> bool:
+        return self.remaining == 0
+
+    def get_buffer(self) -> memoryview:
+        '''Returns writable space for the next bytes of the value; follow with advance'''
+        if self.discard:
+            return memoryview(bytearray(min(self.remaining, CHUNK_SIZE)))
+        if not self.chunks or self.filled == len(self.chunks[-1]):
+            self.chunks.append(bytearray(min(self.remaining, CHUNK_SIZE)))
+            self.filled = 0
+        return memoryview(self.chunks[-1])[self.filled:]
+
+    def advance(self, received: int) -> None:
+        self.filled += received
+        self.remaining -= received
+
+    def feed(self, data: memoryview) -> int:
+        '''Copies as much of data as the value still needs and returns how many bytes were used'''
+        used = 0
+        while used < len(data) and self.remaining:
+            if self.discard:
+                received = min(len(data) - used, self.remaining)
+            else:
+                buffer = self.get_buffer()
+                received = min(len(data) - used, len(buffer))
+                buffer[:received] = data[used:used + received]
+            self.advance(received)
+            used += received
+        return used
+
+    def get_value(self) -> ChunkedValue:
+        return ChunkedValue(self.chunks, self.byte_count)
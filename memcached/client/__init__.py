@@ -0,0 +1,3 @@
+from memcached.client.client import Client, ClientError
+from memcached.client.pool import Connection, ConnectionPool
+from memcached.client.ring import HashRing
@@ -0,0 +1,146 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from memcached.client.ring import HashRing
+from memcached.client.pool import ConnectionPool, LINE_END
+
+MAX_KEY_LENGTH = 250
+
+
+class ClientError(Exception):
+
+    '''A command was refused by the server with ERROR, CLIENT_ERROR or SERVER_ERROR'''
+
+
+def _encode_key(key: str) -> bytes:
+    encoded = key.encode("utf-8")
+    if not encoded or len(encoded) > MAX_KEY_LENGTH or any(byte <= 32 or byte == 127 for byte in encoded):
+        raise ValueError(f"Invalid key {key!r}")
+    return encoded
+
+
+def _encode_value(value: bytes | str) -> bytes:
+    return value.encode("utf-8") if isinstance(value, str) else bytes(value)
+
+
+def _check_reply(line: bytes) -> bytes:
+    if line == b"ERROR" or line.startswith((b"CLIENT_ERROR", b"SERVER_ERROR")):
+        raise ClientError(line.decode("utf-8", "replace"))
+    return line
+
+
+class Client:
+
+    '''Client for several servers. Keys are spread over the servers with a ketama hash ring and 
+    each server has its own connection pool, so the client can be shared between threads. 
+    Servers are given as "host:port" strings'''
+
+    # keys per get command when get_multi pipelines a node's keys
+    BATCH_SIZE = 100
+
+    def __init__(self, servers: list[str], pool_size: int = 8, timeout: float | None = 10):
+        self.ring = HashRing(servers)
+        self.pools = {}
+        for server in servers:
+            host, port = server.rsplit(":", 1)
+            self.pools[server] = ConnectionPool(host, int(port), pool_size, timeout)
+        self.executor = ThreadPoolExecutor(max_workers=len(servers))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        self.executor.shutdown()
+        for pool in self.pools.values():
+            pool.close()
+
+    def _get_pool(self, key: str) -> ConnectionPool:
+        return self.pools[self.ring.get_node(key)]
+
+    def _call(self, key: str, request: bytes) -> bytes:
+        with self._get_pool(key).connection() as connection:
+            connection.send(request)
+            return _check_reply(connection.read_line())
+
+    def _store(self, command: str, key: str, value: bytes | str, flag: int, expire: int, 
+               cas_unique: int | None = None) -> bool:
+        value = _encode_value(value)
+        header = b"%b %b %d %d %d" % (command.encode("utf-8"), _encode_key(key), flag, expire, len(value))
+        if cas_unique is not None:
+            header += b" %d" % cas_unique
+        return self._call(key, header + LINE_END + value + LINE_END) == b"STORED"
+
+    def set(self, key: str, value: bytes | str, flag: int = 0, expire: int = 0) -> bool:
+        return self._store("set", key, value, flag, expire)
+
+    def add(self, key: str, value: bytes | str, flag: int = 0, expire: int = 0) -> bool:
+        return self._store("add", key, value, flag, expire)
+
+    def replace(self, key: str, value: bytes | str, flag: int = 0, expire: int = 0) -> bool:
+        return self._store("replace", key, value, flag, expire)
+
+    def append(self, key: str, value: bytes | str) -> bool:
+        return self._store("append", key, value, 0, 0)
+
+    def prepend(self, key: str, value: bytes | str) -> bool:
+        return self._store("prepend", key, value, 0, 0)
+
+    def cas(self, key: str, value: bytes | str, cas_unique: int, flag: int = 0, expire: int = 0) -> bool:
+        '''Stores the value only if the item is unchanged since gets returned cas_unique'''
+        return self._store("cas", key, value, flag, expire, cas_unique)
+
+    def get(self, key: str) -> bytes | None:
+        item = self._get_items("get", [key]).get(key)
+        return item[0] if item else None
+
+    def gets(self, key: str) -> tuple[bytes, int] | None:
+        '''Returns (value, cas unique) for use with cas'''
+        return self._get_items("gets", [key]).get(key)
+
+    def get_multi(self, keys: list[str]) -> dict[str, bytes]:
+        '''Gets many keys with as few round trips as possible: keys are grouped by the node that 
+        owns them, each node's get commands are all sent before any reply is read, and the nodes 
+        are queried concurrently. Missing keys are left out of the result'''
+        keys_by_node = {}
+        for key in keys:
+            keys_by_node.setdefault(self.ring.get_node(key), []).append(key)
+
+        futures = [self.executor.submit(self._get_from_node, node, "get", node_keys) 
+                   for node, node_keys in keys_by_node.items()]
+        values = {}
+        for future in futures:
+            values.update((key, item[0]) for key, item in future.result().items())
+        return values
+
+    def _get_items(self, command: str, keys: list[str]) -> dict:
+        return self._get_from_node(self.ring.get_node(keys[0]), command, keys)
+
+    def _get_from_node(self, node: str, command: str, keys: list[str]) -> dict:
+        batches = [keys[i:i + self.BATCH_SIZE] for i in range(0, len(keys), self.BATCH_SIZE)]
+        request = b"".join(b"%b %b\r\n" % (command.encode("utf-8"), b" ".join(map(_encode_key, batch))) 
+                           for batch in batches)
+        items = {}
+        with self.pools[node].connection() as connection:
+            connection.send(request)
+            for _ in batches:
+                while (line := _check_reply(connection.read_line())) != b"END":
+                    _, key, _, byte_count, *cas = line.split()
+                    value = connection.read_value(int(byte_count))
+                    items[key.decode("utf-8")] = (value, int(cas[0])) if cas else (value,)
+        return items
+
+    def delete(self, key: str) -> bool:
+        return self._call(key, b"delete %b\r\n" % _encode_key(key)) == b"DELETED"
+
+    def incr(self, key: str, delta: int = 1) -> int | None:
+        '''Returns the new value, or None if the key is missing'''
+        return self._change("incr", key, delta)
+
+    def decr(self, key: str, delta: int = 1) -> int | None:
+        return self._change("decr", key, delta)
+
+    def _change(self, command: str, key: str, delta: int) -> int | None:
+        reply = self._call(key, b"%b %b %d\r\n" % (command.encode("utf-8"), _encode_key(key), delta))
+        return None if reply == b"NOT_FOUND" else int(reply)
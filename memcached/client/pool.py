@@ -0,0 +1,86 @@
+import socket
+import threading
+from contextlib import contextmanager
+
+LINE_END = b"\r\n"
+
+
+class Connection:
+
+    '''A socket to one server with a read buffer, so replies can be read a line or a known number 
+    of bytes at a time whatever way the data arrives'''
+
+    RECV_SIZE = 64 * 1024
+
+    def __init__(self, host: str, port: int, timeout: float | None):
+        self.socket = socket.create_connection((host, port), timeout=timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = bytearray()
+
+    def send(self, data: bytes) -> None:
+        self.socket.sendall(data)
+
+    def _fill(self) -> None:
+        data = self.socket.recv(self.RECV_SIZE)
+        if not data:
+            raise ConnectionError("Server closed the connection")
+        self.buffer += data
+
+    def read_line(self) -> bytes:
+        '''Returns the next line without its line ending'''
+        while (end := self.buffer.find(LINE_END)) == -1:
+            self._fill()
+        line = bytes(self.buffer[:end])
+        del self.buffer[:end + len(LINE_END)]
+        return line
+
+    def read_value(self, byte_count: int) -> bytes:
+        '''Returns a data block of byte_count bytes, dropping the line ending after it'''
+        while len(self.buffer) < byte_count + len(LINE_END):
+            self._fill()
+        value = bytes(self.buffer[:byte_count])
+        del self.buffer[:byte_count + len(LINE_END)]
+        return value
+
+    def close(self) -> None:
+        self.socket.close()
+
+
+class ConnectionPool:
+
+    '''Thread-safe pool of connections to one server. At most max_size connections are open at 
+    once; a thread asking for one while all are in use waits until one is returned. Connections 
+    that fail while in use are closed rather than returned, since their replies may be out of step'''
+
+    def __init__(self, host: str, port: int, max_size: int = 8, timeout: float | None = 10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idle = []
+        self.lock = threading.Lock()
+        self.available = threading.BoundedSemaphore(max_size)
+
+    @contextmanager
+    def connection(self):
+        if not self.available.acquire(timeout=self.timeout if self.timeout is not None else -1):
+            raise TimeoutError(f"No free connection to {self.host}:{self.port}")
+        try:
+            with self.lock:
+                connection = self.idle.pop() if self.idle else None
+            if connection is None:
+                connection = Connection(self.host, self.port, self.timeout)
+            try:
+                yield connection
+            except BaseException:
+                connection.close()
+                raise
+            with self.lock:
+                self.idle.append(connection)
+        finally:
+            self.available.release()
+
+    def close(self) -> None:
+        with self.lock:
+            for connection in self.idle:
+                connection.close()
+            self.idle.clear()
@@ -0,0 +1,52 @@
+import bisect
+import hashlib
+
+
+def _ketama_hash(digest: bytes, offset: int = 0) -> int:
+    '''Reads one 32 bit point from an md5 digest, little endian as in libketama'''
+    return int.from_bytes(digest[offset:offset + 4], "little")
+
+
+class HashRing:
+
+    '''Ketama consistent hash ring. Every node is placed at many points on a 32 bit circle, taken 
+    from md5 digests of "host:port-i", and a key belongs to the first node point at or after the 
+    key's hash. Adding or removing a node only moves the keys next to its points'''
+
+    POINTS_PER_NODE = 160
+
+    def __init__(self, nodes: list[str] | None = None, points_per_node: int = POINTS_PER_NODE):
+        self.points_per_node = points_per_node
+        self.nodes = []
+        self.points = []
+        self.owners = []
+        for node in nodes or []:
+            self.add_node(node)
+
+    def add_node(self, node: str) -> None:
+        if node in self.nodes:
+            raise ValueError(f"Node {node} is already in the ring")
+        self.nodes.append(node)
+        self._build()
+
+    def remove_node(self, node: str) -> None:
+        self.nodes.remove(node)
+        self._build()
+
+    def _build(self) -> None:
+        ring = []
+        for node in self.nodes:
+            # each digest gives four points 
+            for i in range(self.points_per_node // 4):
+                digest = hashlib.md5(f"{node}-{i}".encode("utf-8")).digest()
+                ring.extend((_ketama_hash(digest, offset), node) for offset in range(0, 16, 4))
+        ring.sort()
+        self.points = [point for point, _ in ring]
+        self.owners = [node for _, node in ring]
+
+    def get_node(self, key: str) -> str:
+        if not self.points:
+            raise ValueError("Hash ring has no nodes")
+        point = _ketama_hash(hashlib.md5(key.encode("utf-8")).digest())
+        index = bisect.bisect_left(self.points, point)
+        return self.owners[index % len(self.points)]
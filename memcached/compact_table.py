@@ -0,0 +1,323 @@
+from array import array
+
+from memcached.hash_table import BaseTable, Node, Command, Response, combine_values, parse_counter, apply_delta
+from memcached.expiry import ServerClock, server_clock
+from memcached.compression import Compressor, stored_size
+
+
+# markers stored in the index array in place of an entry number
+EMPTY = -1
+DELETED = -2
+
+
+class CompactHashTable(BaseTable):
+
+    '''Drop-in alternative to HashTable that avoids a Python object per item. Items live in
+    parallel columns (hashes, keys, values, flags, byte counts, expiries, recency links) indexed by
+    entry number, and an open-addressing index array maps linearly probed slots to entry numbers.
+    Deleted slots become tombstones so later probes keep walking past them; freed entry numbers are
+    reused, and tombstones are purged whenever the index array is rebuilt. Expiry works as in 
+    HashTable, including the heap consumed by reap_expired, and so do flushes and compression.'''
+
+    MAX_LOAD = 0.5
+
+    def __init__(self, capacity: int, memory_limit: int | None = None, clock: ServerClock = server_clock, 
+                 compress_threshold: int | None = None, compress_level: int = Compressor.DEFAULT_LEVEL):
+        super().__init__(capacity, memory_limit, clock, compress_threshold, compress_level)
+        self.tombstones = 0
+        self.indices = array('i', [EMPTY]) * capacity
+
+        self.hashes = array('q')
+        self.keys = []
+        self.values = []
+        self.flags = array('I')
+        self.byte_counts = array('I')
+        self.expiries = array('q')
+        self.cas_uniques = array('Q')
+        # server clock time of each entry's last store or hit 
+        self.last_accesses = array('I')
+        self.free_entries = []
+
+        # recency list as entry numbers, most recently used at the head
+        self.lru_prev = array('i')
+        self.lru_next = array('i')
+        self.lru_head = EMPTY
+        self.lru_tail = EMPTY
+
+    def _lookup(self, key, key_hash: int) -> tuple[int, int]:
+        '''Returns (slot, entry) for key. If key is absent entry is EMPTY and slot is where it
+        should be inserted, preferring the first tombstone on its probe sequence'''
+        slot = key_hash % self.capacity
+        insert_slot = None
+        while True:
+            entry = self.indices[slot]
+            if entry == EMPTY:
+                return (slot if insert_slot is None else insert_slot), EMPTY
+            if entry == DELETED:
+                if insert_slot is None:
+                    insert_slot = slot
+            elif self.hashes[entry] == key_hash and self.keys[entry] == key:
+                return slot, entry
+            slot = (slot + 1) % self.capacity
+
+    def _item_size(self, entry: int) -> int:
+        return len(self.keys[entry]) + stored_size(self.values[entry], self.byte_counts[entry]) + Node.ITEM_OVERHEAD
+
+    def _lru_push_front(self, entry: int) -> None:
+        self.lru_prev[entry] = EMPTY
+        self.lru_next[entry] = self.lru_head
+        if self.lru_head != EMPTY:
+            self.lru_prev[self.lru_head] = entry
+        self.lru_head = entry
+        if self.lru_tail == EMPTY:
+            self.lru_tail = entry
+
+    def _lru_unlink(self, entry: int) -> None:
+        prev, next = self.lru_prev[entry], self.lru_next[entry]
+        if prev != EMPTY:
+            self.lru_next[prev] = next
+        else:
+            self.lru_head = next
+        if next != EMPTY:
+            self.lru_prev[next] = prev
+        else:
+            self.lru_tail = prev
+        self.lru_prev[entry] = self.lru_next[entry] = EMPTY
+
+    def _lru_bump(self, entry: int) -> None:
+        if self.lru_head != entry:
+            self._lru_unlink(entry)
+            self._lru_push_front(entry)
+
+    def _is_stale(self, entry: int) -> bool:
+        '''Whether the entry has expired or been flushed, either way to be treated as absent'''
+        return (self.clock.is_expired(self.expiries[entry]) 
+                or self.generations.is_flushed(self.keys[entry], self.cas_uniques[entry]))
+
+    def _new_entry(self, key, key_hash, value, flag, byte_count, expiry) -> int:
+        if self.free_entries:
+            entry = self.free_entries.pop()
+            self.hashes[entry] = key_hash
+            self.keys[entry] = key
+            self.values[entry] = value
+            self.flags[entry] = flag
+            self.byte_counts[entry] = byte_count
+            self.expiries[entry] = expiry
+            self.cas_uniques[entry] = self._next_cas()
+            self.last_accesses[entry] = self.clock.current_time
+        else:
+            entry = len(self.keys)
+            self.hashes.append(key_hash)
+            self.keys.append(key)
+            self.values.append(value)
+            self.flags.append(flag)
+            self.byte_counts.append(byte_count)
+            self.expiries.append(expiry)
+            self.cas_uniques.append(self._next_cas())
+            self.last_accesses.append(self.clock.current_time)
+            self.lru_prev.append(EMPTY)
+            self.lru_next.append(EMPTY)
+        return entry
+
+    def _remove_entry(self, slot: int, entry: int) -> None:
+        self.indices[slot] = DELETED
+        self.tombstones += 1
+        self.size -= 1
+        self.memory_used -= self._item_size(entry)
+        self._lru_unlink(entry)
+        self.keys[entry] = None
+        self.values[entry] = None
+        self.free_entries.append(entry)
+
+    def _evict_lru(self) -> None:
+        victim = self.lru_tail
+        slot, _ = self._lookup(self.keys[victim], self.hashes[victim])
+        self._remove_entry(slot, victim)
+        self.evictions += 1
+
+    def _evict_to_fit(self, incoming_size: int) -> None:
+        if self.memory_limit is None:
+            return
+        while self.lru_tail != EMPTY and self.memory_used + incoming_size > self.memory_limit:
+            self._evict_lru()
+
+    def _find_live(self, key, key_hash: int) -> tuple[int, int]:
+        '''_lookup that removes the item it finds if it has expired or been flushed'''
+        slot, entry = self._lookup(key, key_hash)
+        if entry != EMPTY and self._is_stale(entry):
+            self._remove_entry(slot, entry)
+            entry = EMPTY
+        return slot, entry
+
+    def insert(self, key, value, flag: int, byte_count: int, time_to_expiry: int, method: Command, 
+               cas_unique: int | None = None):
+        '''See HashTable.insert'''
+        add_to_cache, expiry = self.clock.get_expiry_time(time_to_expiry)
+        if not add_to_cache:
+            return Response.NOT_STORED.value
+
+        key_hash = self._hash_key(key)
+        slot, entry = self._find_live(key, key_hash)
+        if entry != EMPTY and method in (Command.APPEND, Command.PREPEND):
+            value = combine_values(method, self._decompress(self.values[entry]), value)
+            flag, byte_count, expiry = self.flags[entry], self.byte_counts[entry] + byte_count, self.expiries[entry]
+
+        value = self._compress(value, byte_count)
+        new_size = len(key) + stored_size(value, byte_count) + Node.ITEM_OVERHEAD
+        if self.memory_limit is not None and new_size > self.memory_limit:
+            return Response.NOT_STORED.value
+
+        if entry != EMPTY:
+            if method == Command.ADD:
+                return Response.NOT_STORED.value
+            if method == Command.CAS and self.cas_uniques[entry] != cas_unique:
+                return Response.EXISTS.value
+            self._lru_unlink(entry)
+            self._evict_to_fit(new_size - self._item_size(entry))
+            self.memory_used += new_size - self._item_size(entry)
+            self.values[entry] = value
+            self.flags[entry] = flag
+            self.byte_counts[entry] = byte_count
+            self.expiries[entry] = expiry
+            self.cas_uniques[entry] = self._next_cas()
+            self.last_accesses[entry] = self.clock.current_time
+            self._lru_push_front(entry)
+            self._schedule_expiry(expiry, key)
+            return Response.STORED.value
+
+        if method == Command.CAS:
+            return Response.NOT_FOUND.value
+        if method in (Command.REPLACE, Command.APPEND, Command.PREPEND):
+            return Response.NOT_STORED.value
+
+        if self.memory_limit is not None and self.memory_used + new_size > self.memory_limit:
+            self._evict_to_fit(new_size)
+            # evictions leave tombstones, possibly on this key's probe sequence
+            slot, _ = self._lookup(key, key_hash)
+
+        entry = self._new_entry(key, key_hash, value, flag, byte_count, expiry)
+        if self.indices[slot] == DELETED:
+            self.tombstones -= 1
+        self.indices[slot] = entry
+        self.size += 1
+        self.memory_used += new_size
+        self._lru_push_front(entry)
+        self._schedule_expiry(expiry, key)
+        self.check_and_do_resize()
+        return Response.STORED.value
+
+    def increment(self, key, delta: int, decrement: bool = False) -> int | str:
+        '''See HashTable.increment'''
+        _, entry = self._find_live(key, self._hash_key(key))
+        if entry == EMPTY:
+            return Response.NOT_FOUND.value
+
+        number = parse_counter(self._decompress(self.values[entry]))
+        if number is None:
+            return Response.NON_NUMERIC.value
+        number = apply_delta(number, delta, decrement)
+        value = b"%d" % number
+        self.memory_used -= self._item_size(entry)
+        self.values[entry] = value
+        self.byte_counts[entry] = len(value)
+        self.memory_used += self._item_size(entry)
+        self.cas_uniques[entry] = self._next_cas()
+        self.last_accesses[entry] = self.clock.current_time
+        self._lru_bump(entry)
+        return number
+
+    def get_item(self, key):
+        '''Returns (value, flag, byte_count, cas, expiry) and counts as a use of the item'''
+        slot, entry = self._lookup(key, self._hash_key(key))
+        if entry == EMPTY:
+            return None
+        if self._is_stale(entry):
+            self._remove_entry(slot, entry)
+            return None
+        self._lru_bump(entry)
+        self.last_accesses[entry] = self.clock.current_time
+        return (self._decompress(self.values[entry]), self.flags[entry], self.byte_counts[entry], 
+                self.cas_uniques[entry], self.expiries[entry])
+
+    def touch(self, key, time_to_expiry: int, with_value: bool = False):
+        '''See HashTable.touch'''
+        slot, entry = self._find_live(key, self._hash_key(key))
+        if entry == EMPTY:
+            return None
+        item = (self._decompress(self.values[entry]) if with_value else None, self.flags[entry], 
+                self.byte_counts[entry], self.cas_uniques[entry])
+        keep, expiry = self.clock.get_expiry_time(time_to_expiry)
+        if not keep:
+            expiry = self.expiries[entry]
+            self._remove_entry(slot, entry)
+            return item + (expiry,)
+        self.expiries[entry] = expiry
+        self._schedule_expiry(expiry, key)
+        self._lru_bump(entry)
+        self.last_accesses[entry] = self.clock.current_time
+        return item + (expiry,)
+
+    def delete(self, key):
+        '''See HashTable.delete'''
+        slot, entry = self._lookup(key, self._hash_key(key))
+        if entry == EMPTY:
+            return Response.END.value
+        stale = self._is_stale(entry)
+        self._remove_entry(slot, entry)
+        return Response.NOT_FOUND.value if stale else Response.DELETED.value
+
+    def _reap(self, key, expiry: int) -> int | None:
+        slot, entry = self._lookup(key, self._hash_key(key))
+        if entry == EMPTY or self.expiries[entry] != expiry:
+            return None
+        size = self._item_size(entry)
+        self._remove_entry(slot, entry)
+        return size
+
+    def _expiry_entries(self):
+        return ((self.expiries[entry], key) for entry, key in enumerate(self.keys) 
+                if key is not None and self.expiries[entry])
+
+    def _item_sizes(self):
+        return (self._item_size(entry) for entry, key in enumerate(self.keys) if key is not None)
+
+    def scan(self, cursor: int, count: int, metadata: bool = False) -> tuple[int, list[tuple]]:
+        '''See HashTable.scan. The cursor is an entry number: entries keep their number while the 
+        index array is rebuilt, so resizes cannot make the scan skip or repeat items'''
+        end = min(cursor + count, len(self.keys))
+        entries = []
+        for entry in range(cursor, end):
+            if self.keys[entry] is None:
+                continue
+            if self._is_stale(entry):
+                slot, _ = self._lookup(self.keys[entry], self.hashes[entry])
+                self._remove_entry(slot, entry)
+            else:
+                entries.append(entry)
+        if metadata:
+            items = [(self.keys[entry], self._item_size(entry), self.expiries[entry], self.last_accesses[entry], 
+                      self.cas_uniques[entry]) for entry in entries]
+        else:
+            items = [(self.keys[entry], self._decompress(self.values[entry]), self.flags[entry], 
+                      self.byte_counts[entry], self.expiries[entry]) for entry in entries]
+        return (end if end < len(self.keys) else 0), items
+
+    def check_and_do_resize(self) -> None:
+        if self.size / self.capacity >= CompactHashTable.MAX_LOAD:
+            self.resize(self.capacity * 2)
+        elif (self.size + self.tombstones) / self.capacity >= CompactHashTable.MAX_LOAD:
+            self.resize(self.capacity)
+
+    def resize(self, capacity: int) -> None:
+        '''Rebuilds the index array, dropping tombstones; entry columns are left in place'''
+        self.capacity = capacity
+        self.indices = array('i', [EMPTY]) * capacity
+        self.tombstones = 0
+        for entry, key in enumerate(self.keys):
+            if key is None:
+                continue
+            slot = self.hashes[entry] % capacity
+            while self.indices[slot] != EMPTY:
+                slot = (slot + 1) % capacity
+            self.indices[slot] = entry
+
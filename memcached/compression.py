@@ -0,0 +1,66 @@
+import time
+import zlib
+
+from memcached.chunks import value_buffers
+
+
+class CompressedValue:
+
+    '''A stored value kept zlib compressed. Tables store it in place of the value itself, which is
+    how they know to decompress it on the way out; flag and byte_count still describe the original'''
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+def stored_size(value, byte_count: int) -> int:
+    '''Returns the bytes a value takes up in a table, which is less than byte_count if compressed'''
+    return len(value.data) if isinstance(value, CompressedValue) else byte_count
+
+
+class Compressor:
+
+    '''Compresses values of at least threshold bytes with zlib at the given level, keeping them 
+    as they are if they do not shrink. Counts bytes in and out and the CPU time spent either way 
+    for stats. Each table has its own, so the counters are only updated under the table lock'''
+
+    DEFAULT_THRESHOLD = 1024
+    DEFAULT_LEVEL = 6
+
+    def __init__(self, threshold: int = DEFAULT_THRESHOLD, level: int = DEFAULT_LEVEL):
+        if not -1 <= level <= 9:
+            raise ValueError("Compression level must be between -1 and 9")
+        self.threshold = threshold
+        self.level = level
+        self.compressions = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_ns = 0
+        self.decompress_ns = 0
+
+    def compress(self, value, byte_count: int):
+        if byte_count < self.threshold or isinstance(value, CompressedValue):
+            return value
+        start = time.thread_time_ns()
+        compressor = zlib.compressobj(self.level)
+        data = b"".join([compressor.compress(buffer) for buffer in value_buffers(value)] + [compressor.flush()])
+        self.compress_ns += time.thread_time_ns() - start
+        if len(data) >= byte_count:
+            return value
+        self.compressions += 1
+        self.bytes_in += byte_count
+        self.bytes_out += len(data)
+        return CompressedValue(data)
+
+    def decompress(self, value):
+        if not isinstance(value, CompressedValue):
+            return value
+        start = time.thread_time_ns()
+        data = zlib.decompress(value.data)
+        self.decompress_ns += time.thread_time_ns() - start
+        return data
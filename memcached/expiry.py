@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class ServerClock:
+
+    '''Whole seconds since the server started. Like memcached's current_time it is only refreshed
+    by tick, once per received batch or reaper sweep, so expiry checks compare plain integers'''
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.current_time = 0
+
+    def tick(self) -> int:
+        self.current_time = int(time.monotonic() - self.started)
+        return self.current_time
+
+    def get_expiry_time(self, time_to_expiry: int) -> tuple[bool, int]:
+        '''Returns whether to store the item and its expiry time, 0 meaning it never expires'''
+        if time_to_expiry < 0:
+            return False, 0
+        if time_to_expiry == 0:
+            return True, 0
+        return True, self.current_time + time_to_expiry
+
+    def is_expired(self, expiry: int) -> bool:
+        return expiry != 0 and expiry <= self.current_time
+
+    def to_wall_time(self, expiry: int) -> int:
+        '''Converts an expiry time to unix seconds, which outlive this clock, keeping 0 as never'''
+        if expiry == 0:
+            return 0
+        return self.to_unix_time(expiry)
+
+    def to_unix_time(self, clock_time: int) -> int:
+        return round(time.time() - (time.monotonic() - self.started) + clock_time)
+
+
+server_clock = ServerClock()
+
+
+class ExpiryReaper:
+
+    '''Removes expired items that are never read again, so they stop holding memory. Every sweep
+    ticks the clock and reaps each shard in batches, taking the shard's lock once per batch.
+
+    Flushed items are not in the expiry heaps, so after a flush the sweeps also crawl every shard
+    with scan, which removes the flushed items it passes over. The crawl moves on by at most
+    CRAWL_BATCHES batches per sweep, leaving the shards' locks free in between'''
+
+    DEFAULT_INTERVAL = 1.0
+    DEFAULT_BATCH_SIZE = 100
+    CRAWL_BATCHES = 10
+
+    def __init__(self, hash_table, interval: float = DEFAULT_INTERVAL,
+                 batch_size: int = DEFAULT_BATCH_SIZE, clock: ServerClock = server_clock):
+        self.hash_table = hash_table
+        self.interval = interval
+        self.batch_size = batch_size
+        self.clock = clock
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.reclaimed_items = 0
+        self.reclaimed_bytes = 0
+        # shard a sweep cut short by max_batches resumes at, and whether one was
+        self.next_shard = 0
+        self.pending = False
+
+        self.crawl_lock = threading.Lock()
+        # clock time from which to start the next crawl, and [shard, cursor] of a crawl under way
+        self.crawl_at = None
+        self.crawl_queue = []
+
+    def schedule_crawl(self, delay: int = 0) -> None:
+        '''Has the sweeps crawl every shard once delay seconds have passed, restarting any crawl
+        under way, since it may already have passed shards with newly flushed items'''
+        with self.crawl_lock:
+            self.crawl_at = self.clock.current_time + delay
+
+    def sweep(self, max_batches: int | None = None) -> tuple[int, int]:
+        '''Reaps everything that is due and returns the items and bytes reclaimed. With max_batches
+        the sweep stops after that many batches and sets pending, so a caller that must not block
+        for long, like the asyncio engine's event loop, can sweep again soon to carry on'''
+        self.clock.tick()
+        items, byte_count = 0, 0
+        shards = self.hash_table.get_shards()
+        batches = 0
+        while self.next_shard < len(shards) and (max_batches is None or batches < max_batches):
+            shard = shards[self.next_shard]
+            with shard.lock:
+                batch_items, batch_bytes, more = shard.reap_expired(self.batch_size)
+            items += batch_items
+            byte_count += batch_bytes
+            batches += 1
+            if not more:
+                self.next_shard += 1
+        self.pending = self.next_shard < len(shards)
+        if not self.pending:
+            self.next_shard = 0
+        crawl_items, crawl_bytes = self._crawl()
+        items += crawl_items
+        byte_count += crawl_bytes
+
+        self.reclaimed_items += items
+        self.reclaimed_bytes += byte_count
+        if items:
+            logger.info("Reaper reclaimed %d items (%d bytes)", items, byte_count)
+        return items, byte_count
+
+    def _crawl(self) -> tuple[int, int]:
+        with self.crawl_lock:
+            if self.crawl_at is not None and self.crawl_at <= self.clock.current_time:
+                self.crawl_queue = [[shard, 0] for shard in self.hash_table.get_shards()]
+                self.crawl_at = None
+            queue = self.crawl_queue
+
+        items, byte_count = 0, 0
+        for _ in range(ExpiryReaper.CRAWL_BATCHES):
+            if not queue:
+                break
+            shard, cursor = queue[0]
+            with shard.lock:
+                size, memory_used = shard.get_size(), shard.get_memory_used()
+                cursor, _ = shard.scan(cursor, self.batch_size, metadata=True)
+                items += size - shard.get_size()
+                byte_count += memory_used - shard.get_memory_used()
+            if cursor == 0:
+                queue.pop(0)
+            else:
+                queue[0][1] = cursor
+        return items, byte_count
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            self.sweep()
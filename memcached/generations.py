@@ -0,0 +1,54 @@
+from memcached.expiry import ServerClock
+
+# a key's namespace is the part before the first delimiter, as in "tenant42:user:7"
+NAMESPACE_DELIMITER = ":"
+
+
+def get_namespace(key) -> str | None:
+    namespace, delimiter, _ = key.partition(NAMESPACE_DELIMITER)
+    return namespace if delimiter else None
+
+
+class Generations:
+
+    '''Invalidations of one table, recorded without touching its items. Every store stamps an item
+    with the next value of the table's cas counter, so the counter doubles as a generation number:
+    flush_all records the counter as the generation below which everything is gone, and flushing a
+    namespace records it for keys of that namespace only. Both take constant time; the tables treat
+    flushed items as absent and remove them when they next touch or scan them.
+
+    A delayed flush_all takes effect once the clock reaches its time. The first store from then on
+    records the counter before stamping its item, and until that store every item is older than
+    the flush'''
+
+    def __init__(self, clock: ServerClock):
+        self.clock = clock
+        self.flushed = 0
+        # namespace -> generation below which its items are flushed
+        self.namespaces = {}
+        self.flush_at = None
+
+    def flush(self, cas_counter: int, delay: int = 0) -> None:
+        '''Flushes everything stamped up to cas_counter, or everything stamped before the clock
+        reaches delay seconds from now. A later flush_all replaces a pending delayed one'''
+        if delay > 0:
+            self.flush_at = self.clock.current_time + delay
+        else:
+            self.flushed = cas_counter
+            self.flush_at = None
+
+    def flush_namespace(self, namespace: str, cas_counter: int) -> None:
+        self.namespaces[namespace] = cas_counter
+
+    def settle(self, cas_counter: int) -> None:
+        '''Called before stamping an item: applies a delayed flush_all whose time has come'''
+        if self.flush_at is not None and self.flush_at <= self.clock.current_time:
+            self.flush(cas_counter)
+
+    def is_flushed(self, key, cas: int) -> bool:
+        if cas <= self.flushed:
+            return True
+        if self.flush_at is not None and self.flush_at <= self.clock.current_time:
+            # nothing has been stored since the delayed flush came due, so every item predates it
+            return True
+        return bool(self.namespaces) and cas <= self.namespaces.get(get_namespace(key), 0)
@@ -1,5 +1,12 @@
+import heapq
+import threading
+import zlib
 from enum import Enum 
-from datetime import datetime, timedelta
+
+from memcached.expiry import ServerClock, server_clock
+from memcached.chunks import concat_values
+from memcached.compression import Compressor, stored_size
+from memcached.generations import Generations
 
 
 class Command(Enum):
@@ -7,7 +14,22 @@ class Command(Enum):
     REPLACE = "replace"
     ADD = "add"
     GET = "get"
+    GETS = "gets"
     DELETE = "delete"
+    STATS = "stats"
+    CAS = "cas"
+    APPEND = "append"
+    PREPEND = "prepend"
+    INCR = "incr"
+    DECR = "decr"
+    SLOWLOG = "slowlog"
+    PROFILE = "profile"
+    LRU_CRAWLER = "lru_crawler"
+    FLUSH_ALL = "flush_all"
+    FLUSH_NAMESPACE = "flush_namespace"
+    TOUCH = "touch"
+    GAT = "gat"
+    GATS = "gats"
 
 
 class Response(Enum):
@@ -16,155 +38,666 @@ class Response(Enum):
     DELETED = "DELETED"
     END = "END"
     NOT_STORED = "NOT STORED"
+    EXISTS = "EXISTS"
+    NOT_FOUND = "NOT_FOUND"
+    NON_NUMERIC = "CLIENT_ERROR cannot increment or decrement non-numeric value"
+    OK = "OK"
+    TOUCHED = "TOUCHED"
+    OUT_OF_MEMORY = "SERVER_ERROR out of memory storing object"
+
+
+# counters wrap around at 64 bits, as in memcached 
+COUNTER_LIMIT = 2 ** 64
+# client flags are unsigned 32 bit numbers, which is all the compact, slab and shared tables store 
+FLAG_LIMIT = 2 ** 32
+
+
+def combine_values(method: Command, old_value, value):
+    '''Returns the value an append or prepend stores'''
+    if method == Command.APPEND:
+        return concat_values(old_value, value)
+    return concat_values(value, old_value)
+
+
+def parse_counter(value) -> int | None:
+    '''Returns the number a value holds for incr and decr, or None if it is not a decimal number'''
+    if not isinstance(value, (bytes, bytearray)) or not value.isdigit() or len(value) > 20:
+        return None
+    number = int(value)
+    return number if number < COUNTER_LIMIT else None
+
+
+def apply_delta(number: int, delta: int, decrement: bool) -> int:
+    '''incr wraps around at 64 bits while decr stops at 0'''
+    if decrement:
+        return max(number - delta, 0)
+    return (number + delta) % COUNTER_LIMIT
 
 
 
 class Node:
 
-    def __init__(self, key, value, flag, byte_count, expiry, next=None):
+    # approximate bookkeeping cost of an item beyond its key and value, as in memcached's item header 
+    ITEM_OVERHEAD = 48
+
+    def __init__(self, key, value, flag, byte_count, expiry, next=None, key_hash=None):
         self.key = key
         self.value = value
         self.flag = flag
         self.byte_count = byte_count
         self.expiry = expiry
         self.next = next
+        self.key_hash = key_hash
+        self.cas = 0
+        # server clock time of the last store or hit, for metadumps 
+        self.last_access = 0
+        self.lru_prev = None
+        self.lru_next = None
+        # whether the item sits in TinyLFUHashTable's admission window rather than its main list 
+        self.in_window = False
+
+    def get_memory_size(self) -> int:
+        return len(self.key) + stored_size(self.value, self.byte_count) + Node.ITEM_OVERHEAD
 
 
-class HashTable:
+class BaseTable:
 
-    '''Implements hash table with time-based expiry'''
+    '''What every table engine shares, whatever its storage: the lock, clock and counters stats 
+    reads, cas uniques, flush generations, compression and the min-heap of (expiry, key) pairs that 
+    reap_expired consumes. Engines keep the items themselves and provide the hooks _reap, 
+    _expiry_entries and _item_sizes'''
 
-    def __init__(self, capacity: int):
+    def __init__(self, capacity: int, memory_limit: int | None = None, clock: ServerClock = server_clock, 
+                 compress_threshold: int | None = None, compress_level: int = Compressor.DEFAULT_LEVEL):
         self.capacity = capacity
         self.size = 0
-        self.table = [None] * capacity
+        self.lock = threading.Lock()
+        self.clock = clock
+        # (expiry, key) pairs; entries go stale when their item is updated or removed 
+        self.expiry_heap = []
+
+        self.memory_limit = memory_limit
+        self.memory_used = 0
+        self.evictions = 0
+        # source of the unique version stamped on an item whenever it is stored 
+        self.cas_counter = 0
+        self.generations = Generations(clock)
+        self.compressor = None
+        if compress_threshold is not None:
+            self.compressor = Compressor(compress_threshold, compress_level)
 
     @staticmethod 
-    def _get_expiry_time(time_to_expiry: int) -> tuple[bool, datetime.timestamp]:
-        if time_to_expiry < 0:
-            add_to_cache, expiry_time = False, None
-        elif time_to_expiry == 0:
-            add_to_cache, expiry_time = True, None
+    def _hash_key(key) -> int:
+        # str hashing is SipHash, so similar keys such as anagrams spread over the buckets 
+        return hash(key)
+
+    def _next_cas(self) -> int:
+        if self.generations.flush_at is not None:
+            self.generations.settle(self.cas_counter)
+        self.cas_counter += 1
+        return self.cas_counter
+
+    def _compress(self, value, byte_count: int):
+        return value if self.compressor is None else self.compressor.compress(value, byte_count)
+
+    def _decompress(self, value):
+        return value if self.compressor is None else self.compressor.decompress(value)
+
+    def get(self, key, with_cas: bool = False) -> tuple | None:
+        '''Returns (value, flag, byte_count), with the item's cas unique appended if with_cas'''
+        item = self.get_item(key)
+        if item is None:
+            return None
+        return item[:4] if with_cas else item[:3]
+
+    def flush(self, delay: int = 0) -> None:
+        '''flush_all: invalidates every item now, or once delay seconds have passed'''
+        self.generations.flush(self.cas_counter, delay)
+
+    def flush_namespace(self, namespace: str) -> None:
+        '''Invalidates every item whose key is in namespace (see get_namespace)'''
+        self.generations.flush_namespace(namespace, self.cas_counter)
+
+    def get_shard(self, key) -> "BaseTable":
+        '''Returns the table holding key; callers must hold its lock around any operation'''
+        return self
+
+    def get_shards(self) -> list["BaseTable"]:
+        return [self]
+
+    def get_size(self) -> int:
+        return self.size 
+
+    def get_capacity(self) -> int:
+        return self.capacity
+
+    def get_memory_used(self) -> int:
+        return self.memory_used
+
+    def get_evictions(self) -> int:
+        return self.evictions
+
+    def get_size_histogram(self, bucket_size: int) -> dict[int, int]:
+        '''Counts items by memory size rounded up to a multiple of bucket_size'''
+        histogram = {}
+        for size in self._item_sizes():
+            bucket = -(-size // bucket_size) * bucket_size
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+        return histogram
+
+    def _schedule_expiry(self, expiry_time: int, key) -> None:
+        if expiry_time:
+            heapq.heappush(self.expiry_heap, (expiry_time, key))
+
+    def reap_expired(self, max_entries: int) -> tuple[int, int, bool]:
+        '''Pops at most max_entries due heap entries, removing items that are still expired. 
+        Returns (items reclaimed, bytes reclaimed, whether due entries remain)'''
+        if len(self.expiry_heap) > 2 * self.size + max_entries:
+            self._rebuild_expiry_heap()
+
+        items, byte_count = 0, 0
+        for _ in range(max_entries):
+            if not self.expiry_heap or not self.clock.is_expired(self.expiry_heap[0][0]):
+                return items, byte_count, False
+            expiry_time, key = heapq.heappop(self.expiry_heap)
+            reclaimed = self._reap(key, expiry_time)
+            if reclaimed is not None:
+                byte_count += reclaimed
+                items += 1
+
+        more = bool(self.expiry_heap) and self.clock.is_expired(self.expiry_heap[0][0])
+        return items, byte_count, more
+
+    def _rebuild_expiry_heap(self) -> None:
+        '''Drops stale entries left behind by updates and deletes'''
+        self.expiry_heap = list(self._expiry_entries())
+        heapq.heapify(self.expiry_heap)
+
+    def _reap(self, key, expiry_time: int) -> int | None:
+        '''Removes key's item if its expiry is still expiry_time, returning the bytes reclaimed, 
+        or None if the heap entry was stale'''
+        raise NotImplementedError
+
+    def _expiry_entries(self):
+        '''Yields (expiry, key) for every item that has an expiry'''
+        raise NotImplementedError
+
+    def _item_sizes(self):
+        '''Yields the memory size of every item'''
+        raise NotImplementedError
+
+
+class HashTable(BaseTable):
+
+    '''Implements hash table with time-based expiry, measured in whole seconds of the server clock.
+    Items with a TTL are also queued on a min-heap by expiry time so reap_expired can remove them 
+    without waiting for a read. If a memory limit is given, the least 
+    recently used items are evicted on insert to keep the stored bytes within it. 
+
+    Growing is incremental: resize allocates the doubled bucket array and every later operation 
+    migrates a few buckets from the old one, so no single request pays for rebuilding the table. 
+
+    With a compress_threshold, values of at least that many bytes are stored zlib compressed and 
+    decompressed again whenever they are read, so clients see exactly the bytes they stored'''
+
+    # buckets migrated per operation while rehashing, and empty buckets that may be skipped per bucket 
+    REHASH_STEP = 8
+    REHASH_EMPTY_VISITS = 10
+    # scan walks base_capacity buckets at a time, so a larger table starts as a smaller base doubled 
+    MAX_BASE_CAPACITY = 1024
+
+    def __init__(self, capacity: int, memory_limit: int | None = None, clock: ServerClock = server_clock, 
+                 compress_threshold: int | None = None, compress_level: int = Compressor.DEFAULT_LEVEL):
+        # every bucket array is base_capacity times a power of two, which scan relies on 
+        self.base_capacity = capacity
+        doublings = 0
+        while self.base_capacity > HashTable.MAX_BASE_CAPACITY:
+            self.base_capacity = -(-self.base_capacity // 2)
+            doublings += 1
+        super().__init__(self.base_capacity << doublings, memory_limit, clock, compress_threshold, compress_level)
+        self.table = [None] * self.capacity
+
+        # while rehashing, new items go to rehash_table and buckets below rehash_index have moved 
+        self.rehash_table = None
+        self.rehash_index = 0
+
+        # doubly linked recency list threaded through the nodes, most recently used at the head 
+        self.lru_head = None
+        self.lru_tail = None
+
+    def _find(self, key, key_hash: int):
+        '''Returns (bucket table, index, previous node, node) for key; node is None if absent'''
+        tables = [self.table] if self.rehash_table is None else [self.table, self.rehash_table]
+        for table in tables:
+            index = key_hash % len(table)
+            prev, node = None, table[index]
+            while node:
+                if node.key == key:
+                    return table, index, prev, node
+                prev, node = node, node.next
+        return None, None, None, None
+
+    def _lru_push_front(self, node: Node) -> None:
+        node.lru_prev = None
+        node.lru_next = self.lru_head
+        if self.lru_head:
+            self.lru_head.lru_prev = node
+        self.lru_head = node
+        if self.lru_tail is None:
+            self.lru_tail = node
+
+    def _lru_unlink(self, node: Node) -> None:
+        if node.lru_prev:
+            node.lru_prev.lru_next = node.lru_next
+        else:
+            self.lru_head = node.lru_next
+        if node.lru_next:
+            node.lru_next.lru_prev = node.lru_prev
         else:
-            add_to_cache = True
-            expiry_time = datetime.now() + timedelta(seconds=time_to_expiry)
-        return add_to_cache, expiry_time
+            self.lru_tail = node.lru_prev
+        node.lru_prev = node.lru_next = None
 
-    @staticmethod 
-    def _is_expired(expiry_time: datetime.timestamp) -> bool:
-        if expiry_time is None or expiry_time > datetime.now():
-            return False 
-        return True 
+    def _lru_bump(self, node: Node) -> None:
+        if self.lru_head is not node:
+            self._lru_unlink(node)
+            self._lru_push_front(node)
+
+    def _is_stale(self, node: Node) -> bool:
+        '''Whether the item has expired or been flushed, either way to be treated as absent'''
+        return self.clock.is_expired(node.expiry) or self.generations.is_flushed(node.key, node.cas)
 
-    def _hash_key(self, key) -> int:
-        val = 0
-        for k in str(key):
-            val += ord(k)
-        return val % self.capacity
+    def _add_node(self, node: Node) -> None:
+        node.cas = self._next_cas()
+        node.last_access = self.clock.current_time
+        table = self.table if self.rehash_table is None else self.rehash_table
+        index = node.key_hash % len(table)
+        node.next = table[index]
+        table[index] = node
+        self.size += 1
+        self.memory_used += node.get_memory_size()
+        self._lru_push_front(node)
+
+    def _remove_node(self, table: list, index: int, prev: Node | None, node: Node) -> None:
+        if prev:
+            prev.next = node.next
+        else:
+            table[index] = node.next
+        self.size -= 1
+        self.memory_used -= node.get_memory_size()
+        self._lru_unlink(node)
+
+    def _evict(self, victim: Node) -> None:
+        table, index, prev, _ = self._find(victim.key, victim.key_hash)
+        self._remove_node(table, index, prev, victim)
+        self.evictions += 1
+
+    def _evict_to_fit(self, incoming_size: int) -> None:
+        if self.memory_limit is None:
+            return
+        while self.lru_tail and self.memory_used + incoming_size > self.memory_limit:
+            self._evict(self.lru_tail)
+
+    def _iter_nodes(self):
+        '''Yields every item, most recently used first'''
+        node = self.lru_head
+        while node:
+            yield node
+            node = node.lru_next
 
     def update_node(self, node, value, flag, byte_count, expiry_time):
+        self.memory_used -= node.get_memory_size()
         node.value = value
         node.flag = flag
         node.byte_count = byte_count
-        node.expiry_time = expiry_time
+        node.expiry = expiry_time
+        node.cas = self._next_cas()
+        node.last_access = self.clock.current_time
+        self.memory_used += node.get_memory_size()
+        self._lru_bump(node)
 
-    def insert(self, key: int, value: int, flag: int, byte_count: int, time_to_expiry: int, method: Command):
-        add_to_cache, expiry_time = HashTable._get_expiry_time(time_to_expiry)
+    def insert(self, key: int, value: int, flag: int, byte_count: int, time_to_expiry: int, method: Command, 
+               cas_unique: int | None = None):
+        '''Stores an item for set, add, replace, cas (which only stores if the item's cas unique is 
+        still cas_unique), append and prepend (which keep the item's flag and expiry)'''
+        add_to_cache, expiry_time = self.clock.get_expiry_time(time_to_expiry)
         if not add_to_cache:
-            return Response.NOT_STORED
-        
-        hash_key = self._hash_key(key)
-        node = self.table[hash_key]
-        if node is None:
-            if method == Command.REPLACE:
+            return Response.NOT_STORED.value
+
+        self._rehash_step()
+        key_hash = HashTable._hash_key(key)
+        table, index, prev, node = self._find(key, key_hash)
+        if node and self._is_stale(node):
+            self._remove_node(table, index, prev, node)
+            node = None
+
+        if node and method in (Command.APPEND, Command.PREPEND):
+            value = combine_values(method, self._decompress(node.value), value)
+            flag, byte_count, expiry_time = node.flag, node.byte_count + byte_count, node.expiry
+
+        value = self._compress(value, byte_count)
+        new_size = len(key) + stored_size(value, byte_count) + Node.ITEM_OVERHEAD
+        if self.memory_limit is not None and new_size > self.memory_limit:
+            return Response.NOT_STORED.value
+
+        if node:
+            if method == Command.ADD:
                 return Response.NOT_STORED.value
-            else:
-                self.table[hash_key] = Node(key, value, flag, byte_count, expiry_time)
-                self.size += 1
-                self.check_and_do_resize()
-                return Response.STORED.value
-             
-        else:
-            prev = None
-            while node:
-                if node.key == key:
-                    if method == Command.ADD:
-                        return Response.NOT_STORED.value
-                    else:
-                        self.update_node(node, value, flag, byte_count, expiry_time)
-                        return Response.STORED.value
-                prev, node = node, node.next
+            if method == Command.CAS and node.cas != cas_unique:
+                return Response.EXISTS.value
+            # take the item out of the recency list so it cannot evict itself 
+            self._lru_unlink(node)
+            self._evict_to_fit(new_size - node.get_memory_size())
+            self._lru_push_front(node)
+            self.update_node(node, value, flag, byte_count, expiry_time)
+            self._schedule_expiry(expiry_time, key)
+            return Response.STORED.value
 
-            if method == Command.REPLACE:
-                return Response.NOT_STORED
-            
-            else:
-                prev.next = Node(key, value, flag, byte_count, expiry_time)
-                self.size += 1
-                self.check_and_do_resize()
-                return Response.STORED.value
+        if method == Command.CAS:
+            return Response.NOT_FOUND.value
+        if method in (Command.REPLACE, Command.APPEND, Command.PREPEND):
+            return Response.NOT_STORED.value
 
+        self._evict_to_fit(new_size)
+        self._add_node(Node(key, value, flag, byte_count, expiry_time, key_hash=key_hash))
+        self._schedule_expiry(expiry_time, key)
+        self.check_and_do_resize()
+        return Response.STORED.value
 
-    def get(self, key: int) -> int | str:
-        index = self._hash_key(key)
-        node = self.table[index]
-        while node:
-            if node.key == key:
-                if not HashTable._is_expired(node.expiry):
-                    return node.value, node.flag, node.byte_count
-                else:
-                    return None 
-            node = node.next 
+    def increment(self, key, delta: int, decrement: bool = False) -> int | str:
+        '''Adds delta to a decimal value in place for incr, or subtracts it for decr. Returns the 
+        new number, or the NOT_FOUND or NON_NUMERIC response'''
+        self._rehash_step()
+        table, index, prev, node = self._find(key, HashTable._hash_key(key))
+        if node and self._is_stale(node):
+            self._remove_node(table, index, prev, node)
+            node = None
+        if node is None:
+            return Response.NOT_FOUND.value
 
-        return None
-            
-    def delete(self, key: int) -> bool:
-        index = self._hash_key(key)
-        node = self.table[index]
-        prev = None 
-        while node:
-            if node.key == key:
-                if prev:
-                    prev.next = node.next
-                else:
-                    self.table[index] = node.next 
+        number = parse_counter(self._decompress(node.value))
+        if number is None:
+            return Response.NON_NUMERIC.value
+        number = apply_delta(number, delta, decrement)
+        value = b"%d" % number
+        self.update_node(node, value, node.flag, len(value), node.expiry)
+        return number
 
-                self.size -= 1
-                return Response.DELETED.value
-            prev, node = node, node.next
+    def get_item(self, key) -> tuple | None:
+        '''Returns (value, flag, byte_count, cas, expiry) and counts as a use of the item'''
+        self._rehash_step()
+        table, index, prev, node = self._find(key, HashTable._hash_key(key))
+        if node is None:
+            return None
+        if self._is_stale(node):
+            self._remove_node(table, index, prev, node)
+            return None
+        self._lru_bump(node)
+        node.last_access = self.clock.current_time
+        return self._decompress(node.value), node.flag, node.byte_count, node.cas, node.expiry
 
-        return Response.END.value
+    def touch(self, key, time_to_expiry: int, with_value: bool = False) -> tuple | None:
+        '''Gives the item a new expiry without rewriting it, for touch, gat and gats, and counts as 
+        a use of it; the cas unique is kept. Returns None if the item is absent and otherwise 
+        (value, flag, byte_count, cas, expiry) as get_item does, value being None unless with_value. 
+        A negative time_to_expiry expires the item right away'''
+        self._rehash_step()
+        table, index, prev, node = self._find(key, HashTable._hash_key(key))
+        if node is None:
+            return None
+        if self._is_stale(node):
+            self._remove_node(table, index, prev, node)
+            return None
+        value = self._decompress(node.value) if with_value else None
+        keep, expiry = self.clock.get_expiry_time(time_to_expiry)
+        if not keep:
+            self._remove_node(table, index, prev, node)
+            return value, node.flag, node.byte_count, node.cas, node.expiry
+        # the entry already queued for the old expiry no longer matches and is skipped by the reaper 
+        node.expiry = expiry
+        self._schedule_expiry(expiry, key)
+        self._lru_bump(node)
+        node.last_access = self.clock.current_time
+        return value, node.flag, node.byte_count, node.cas, expiry
             
+    def delete(self, key: int) -> str:
+        '''Removes the item. Returns DELETED, END if there is no item, or NOT_FOUND if it has expired 
+        or been flushed and so was gone for get already, though not reaped yet'''
+        self._rehash_step()
+        table, index, prev, node = self._find(key, HashTable._hash_key(key))
+        if node is None:
+            return Response.END.value
+        stale = self._is_stale(node)
+        self._remove_node(table, index, prev, node)
+        return Response.NOT_FOUND.value if stale else Response.DELETED.value
 
-    def get_size(self) -> int:
-        return self.size 
+    def is_rehashing(self) -> bool:
+        return self.rehash_table is not None
 
-    def get_capacity(self) -> int:
-        return self.capacity
+    def _reap(self, key, expiry_time: int) -> int | None:
+        table, index, prev, node = self._find(key, HashTable._hash_key(key))
+        if node is None or node.expiry != expiry_time:
+            return None
+        self._remove_node(table, index, prev, node)
+        return node.get_memory_size()
+
+    def _expiry_entries(self):
+        return ((node.expiry, node.key) for node in self._iter_nodes() if node.expiry)
+
+    def _item_sizes(self):
+        return (node.get_memory_size() for node in self._iter_nodes())
 
     def check_and_do_resize(self) -> None:
-        if self.size / self.capacity >= 0.5:
+        if self.size / self.capacity >= 0.5 and not self.is_rehashing():
             self.resize()
 
     def resize(self) -> None:
+        '''Starts migrating into a table of double the capacity; see _rehash_step'''
         self.capacity = self.capacity * 2
-        new_table = [None] * self.capacity 
+        self.rehash_table = [None] * self.capacity 
+        self.rehash_index = 0
+        self._rehash_step()
+
+    def finish_rehash(self) -> None:
+        while self.is_rehashing():
+            self._rehash_step()
 
-        for node in self.table:
+    def _rehash_step(self) -> None:
+        if not self.is_rehashing():
+            return
+
+        moved, empty_visits = 0, 0
+        while moved < HashTable.REHASH_STEP and self.rehash_index < len(self.table):
+            node = self.table[self.rehash_index]
+            if node is None:
+                empty_visits += 1
+                self.rehash_index += 1
+                if empty_visits >= HashTable.REHASH_STEP * HashTable.REHASH_EMPTY_VISITS:
+                    return
+                continue
+
+            # nodes are relinked rather than copied so the recency list stays valid 
             while node:
-                if HashTable._is_expired(node.expiry):
-                    continue 
-        
-                index = self._hash_key(node.key)
-                if new_table[index] is None:
-                    new_table[index] = Node(node.key, node.value, node.flag, node.byte_count, node.expiry)
+                next_node = node.next
+                if self._is_stale(node):
+                    self.size -= 1
+                    self.memory_used -= node.get_memory_size()
+                    self._lru_unlink(node)
+                else:
+                    index = node.key_hash % self.capacity
+                    node.next = self.rehash_table[index]
+                    self.rehash_table[index] = node
+                node = next_node
+            self.table[self.rehash_index] = None
+            self.rehash_index += 1
+            moved += 1
 
+        if self.rehash_index >= len(self.table):
+            self.table = self.rehash_table
+            self.rehash_table = None
+            self.rehash_index = 0
+
+    def scan(self, cursor: int, count: int, metadata: bool = False) -> tuple[int, list[tuple]]:
+        '''Returns the next cursor, 0 once the scan is complete, and the (key, value, flag, 
+        byte_count, expiry) of unexpired items in roughly count buckets starting at cursor. With 
+        metadata, items are (key, size, expiry, last_access, cas) instead and values are not read. 
+        Expired and flushed items the scan passes over are removed. 
+
+        As in Redis, a bucket's index is split into its remainder modulo base_capacity and its 
+        quotient, and the cursor walks the quotients in reverse binary order. Doubling the table 
+        splits each bucket into two that share the reversed prefix, so items present for the whole 
+        scan are returned at least once even if the table grows or rehashes between calls'''
+        items = []
+        visited = 0
+        while True:
+            if self.rehash_table is None:
+                mask = len(self.table) // self.base_capacity - 1
+                visited += self._scan_buckets(self.table, cursor & mask, items, metadata)
+                cursor = _next_cursor(cursor, mask)
+            else:
+                # visit the old bucket and every bucket of the new table that it expands into 
+                small_mask = len(self.table) // self.base_capacity - 1
+                large_mask = len(self.rehash_table) // self.base_capacity - 1
+                visited += self._scan_buckets(self.table, cursor & small_mask, items, metadata)
+                while True:
+                    visited += self._scan_buckets(self.rehash_table, cursor & large_mask, items, metadata)
+                    cursor = _next_cursor(cursor, large_mask)
+                    if not cursor & (small_mask ^ large_mask):
+                        break
+            if cursor == 0 or visited >= count:
+                return cursor, items
+
+    def _scan_buckets(self, table: list, quotient: int, items: list, metadata: bool) -> int:
+        start = quotient * self.base_capacity
+        for index in range(start, start + self.base_capacity):
+            prev, node = None, table[index]
+            while node:
+                next_node = node.next
+                if self._is_stale(node):
+                    self._remove_node(table, index, prev, node)
+                elif metadata:
+                    items.append((node.key, node.get_memory_size(), node.expiry, node.last_access, node.cas))
+                    prev = node
                 else:
-                    new_node = new_table[index]
-                    while new_node.next:
-                        new_node = new_node.next
-                    new_node.next = Node(node.key, node.value, node.flag, node.byte_count, node.expiry)
-                
-                node = node.next
-
-        self.table = new_table 
+                    items.append((node.key, self._decompress(node.value), node.flag, node.byte_count, node.expiry))
+                    prev = node
+                node = next_node
+        return self.base_capacity
+
+    def get_chain_report(self) -> dict:
+        '''Summarizes bucket chain lengths across both tables, to spot poor key distribution'''
+        tables = [self.table] if self.rehash_table is None else [self.table, self.rehash_table]
+        histogram = {}
+        for table in tables:
+            for node in table:
+                length = 0
+                while node:
+                    length, node = length + 1, node.next
+                histogram[length] = histogram.get(length, 0) + 1
+
+        buckets = sum(histogram.values())
+        used_buckets = buckets - histogram.get(0, 0)
+        return {
+            "buckets": buckets,
+            "used_buckets": used_buckets,
+            "max_chain": max(histogram),
+            "mean_chain": self.size / used_buckets if used_buckets else 0,
+            "histogram": dict(sorted(histogram.items())),
+        }
+
+
+def _next_cursor(cursor: int, mask: int) -> int:
+    '''Increments the bits of cursor under mask in reverse order, wrapping around to 0'''
+    bits = mask.bit_length()
+    if bits == 0:
+        return 0
+    reversed_cursor = int(f"{cursor & mask:0{bits}b}"[::-1], 2) + 1
+    if reversed_cursor > mask:
+        return 0
+    return int(f"{reversed_cursor:0{bits}b}"[::-1], 2)
+
+
+class BaseShardedTable:
+
+    '''Routes each operation to the shard holding its key, under that shard's lock, and sums the 
+    shards' counters. Subclasses create self.shards'''
+
+    def get_shard(self, key):
+        # crc32 rather than the bucket hash so keys of one shard still spread over all its buckets
+        return self.shards[zlib.crc32(str(key).encode("utf-8", "surrogateescape")) % len(self.shards)]
+
+    def get_shards(self) -> list:
+        return self.shards
+
+    def insert(self, key, value, flag: int, byte_count: int, time_to_expiry: int, method: Command, 
+               cas_unique: int | None = None):
+        shard = self.get_shard(key)
+        with shard.lock:
+            return shard.insert(key, value, flag, byte_count, time_to_expiry, method, cas_unique)
+
+    def increment(self, key, delta: int, decrement: bool = False):
+        shard = self.get_shard(key)
+        with shard.lock:
+            return shard.increment(key, delta, decrement)
+
+    def get(self, key, with_cas: bool = False):
+        shard = self.get_shard(key)
+        with shard.lock:
+            return shard.get(key, with_cas)
+
+    def get_item(self, key):
+        shard = self.get_shard(key)
+        with shard.lock:
+            return shard.get_item(key)
+
+    def touch(self, key, time_to_expiry: int, with_value: bool = False):
+        shard = self.get_shard(key)
+        with shard.lock:
+            return shard.touch(key, time_to_expiry, with_value)
+
+    def delete(self, key):
+        shard = self.get_shard(key)
+        with shard.lock:
+            return shard.delete(key)
+
+    def get_size(self) -> int:
+        return sum(shard.get_size() for shard in self.shards)
+
+    def get_capacity(self) -> int:
+        return sum(shard.get_capacity() for shard in self.shards)
+
+    def get_memory_used(self) -> int:
+        return sum(shard.get_memory_used() for shard in self.shards)
+
+    def get_evictions(self) -> int:
+        return sum(shard.get_evictions() for shard in self.shards)
+
+
+class ShardedHashTable(BaseShardedTable):
+
+    '''Partitions keys across independent HashTable shards, each guarded by its own lock, 
+    so operations (and resizes) on one shard never wait on another'''
+
+    def __init__(self, capacity: int, num_shards: int, memory_limit: int | None = None, 
+                 table_class: type = HashTable, clock: ServerClock = server_clock, 
+                 compress_threshold: int | None = None, compress_level: int = Compressor.DEFAULT_LEVEL):
+        if num_shards < 1:
+            raise ValueError("Must have at least one shard")
+        shard_capacity = max(1, capacity // num_shards)
+        shard_memory_limit = memory_limit // num_shards if memory_limit is not None else None
+        self.shards = [table_class(shard_capacity, shard_memory_limit, clock, compress_threshold, compress_level) 
+                       for _ in range(num_shards)]
+
+    def get_chain_report(self) -> dict:
+        reports = [shard.get_chain_report() for shard in self.shards]
+        histogram = {}
+        for report in reports:
+            for length, count in report["histogram"].items():
+                histogram[length] = histogram.get(length, 0) + count
+        used_buckets = sum(report["used_buckets"] for report in reports)
+        return {
+            "buckets": sum(report["buckets"] for report in reports),
+            "used_buckets": used_buckets,
+            "max_chain": max(report["max_chain"] for report in reports),
+            "mean_chain": self.get_size() / used_buckets if used_buckets else 0,
+            "histogram": dict(sorted(histogram.items())),
+        }
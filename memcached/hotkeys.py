@@ -0,0 +1,120 @@
+import math
+import random
+import threading
+import time
+from array import array
+
+
+class CountMinSketch:
+
+    '''Estimates how often each key was seen in fixed memory: depth rows of width counters, each
+    row indexed by a different hash of the key. Estimates never undercount; with conservative
+    update only the counters at the current minimum grow, which keeps overcounting small'''
+
+    def __init__(self, width: int, depth: int):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('I', [0]) * width for _ in range(depth)]
+
+    def _indexes(self, key) -> list[int]:
+        # double hashing: row i uses h1 + i * h2, which behaves like independent hashes
+        key_hash = hash(key)
+        step = (key_hash >> 32) | 1
+        return [(key_hash + row * step) % self.width for row in range(self.depth)]
+
+    def add(self, key, count: int = 1) -> int:
+        '''Counts key and returns its new estimate'''
+        indexes = self._indexes(key)
+        estimate = min(row[index] for row, index in zip(self.rows, indexes)) + count
+        for row, index in zip(self.rows, indexes):
+            if row[index] < estimate:
+                row[index] = estimate
+        return estimate
+
+    def estimate(self, key) -> int:
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+    def decay(self) -> None:
+        '''Halves every counter, so old traffic weighs less than recent traffic'''
+        for row in self.rows:
+            for index in range(self.width):
+                row[index] >>= 1
+
+
+class HeavyHitters:
+
+    '''The k keys with the highest estimates offered so far. A key outside the top k replaces the
+    current minimum once its estimate is higher, as in the Space-Saving algorithm'''
+
+    def __init__(self, k: int):
+        self.k = k
+        self.counts = {}
+
+    def offer(self, key, estimate: int) -> None:
+        if key in self.counts or len(self.counts) < self.k:
+            self.counts[key] = estimate
+            return
+        min_key = min(self.counts, key=self.counts.get)
+        if estimate > self.counts[min_key]:
+            del self.counts[min_key]
+            self.counts[key] = estimate
+
+    def decay(self) -> None:
+        self.counts = {key: count >> 1 for key, count in self.counts.items() if count > 1}
+
+    def top(self) -> list[tuple[object, int]]:
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+
+
+class HotKeyTracker:
+
+    '''Finds the most requested keys from a sample of operations. Each connection picks which of
+    its keys to sample (see next_gap), so the shared sketch and top-k, guarded by one lock, only
+    see about sample_rate of the traffic. Counts are halved every decay_interval seconds, making
+    the ranking reflect recent load rather than the whole uptime'''
+
+    DEFAULT_SAMPLE_RATE = 0.01
+    DEFAULT_TOP_K = 20
+    DEFAULT_DECAY_INTERVAL = 60.0
+    SKETCH_WIDTH = 4096
+    SKETCH_DEPTH = 4
+
+    def __init__(self, sample_rate: float = DEFAULT_SAMPLE_RATE, k: int = DEFAULT_TOP_K,
+                 decay_interval: float = DEFAULT_DECAY_INTERVAL):
+        if not 0 < sample_rate <= 1:
+            raise ValueError("Sample rate must be greater than 0 and at most 1")
+        self.sample_rate = sample_rate
+        self.decay_interval = decay_interval
+        self.sketch = CountMinSketch(HotKeyTracker.SKETCH_WIDTH, HotKeyTracker.SKETCH_DEPTH)
+        self.heavy_hitters = HeavyHitters(k)
+        self.lock = threading.Lock()
+        self.sampled = 0
+        self.last_decay = time.monotonic()
+        # rate of the exponential distribution whose whole part is the geometric gap
+        self.gap_rate = -math.log1p(-sample_rate) if sample_rate < 1 else None
+
+    def next_gap(self) -> int:
+        '''Returns how many keys to skip until the next sample. Gaps are geometric, so keys are
+        sampled independently at sample_rate while drawing one random number per sample'''
+        if self.gap_rate is None:
+            return 1
+        return int(random.expovariate(self.gap_rate)) + 1
+
+    def record(self, key) -> None:
+        with self.lock:
+            self._decay_if_due()
+            self.sampled += 1
+            self.heavy_hitters.offer(key, self.sketch.add(key))
+
+    def _decay_if_due(self) -> None:
+        now = time.monotonic()
+        if now - self.last_decay >= self.decay_interval:
+            self.sketch.decay()
+            self.heavy_hitters.decay()
+            self.last_decay = now
+
+    def report(self) -> list[tuple[object, int]]:
+        '''Returns the hottest keys with their estimated operation counts, scaled up from samples'''
+        with self.lock:
+            self._decay_if_due()
+            return [(key, round(count / self.sample_rate)) for key, count in self.heavy_hitters.top()]
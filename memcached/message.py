@@ -1,138 +1,607 @@
+import logging
 import threading 
+import time
 from datetime import datetime 
-from memcached.hash_table import HashTable, Command, Response
+from urllib.parse import quote
+from memcached.hash_table import HashTable, Command, Response, FLAG_LIMIT
+from memcached.expiry import server_clock
+from memcached.meta import MetaCommand, META_COMMANDS, parse_meta_header, perform_meta_operation
+from memcached.stats import ServerStats, TimedLock
+from memcached.chunks import CHUNK_SIZE, ChunkReceiver, value_buffers
 
 
-hash_table_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+
+LINE_END = b"\r\n"
+ENCODED_RESPONSES = {response.value: response.value.encode("utf-8") + LINE_END for response in Response}
+TOO_LARGE = b"SERVER_ERROR object too large for cache" + LINE_END
+UNKNOWN_COMMAND = b"ERROR" + LINE_END
+BAD_FLAGS = b"CLIENT_ERROR flags must be an unsigned 32 bit integer" + LINE_END
+
+# commands followed by a data block; cas also carries the unique to compare against 
+STORAGE_COMMANDS = [Command.SET.value, Command.ADD.value, Command.REPLACE.value, Command.APPEND.value, 
+                    Command.PREPEND.value, Command.CAS.value]
+# plain strings for checks made on every command, since looking up an Enum member's value is slow; 
+# commands taking several keys, mapped to the position of the first one 
+MULTI_KEY_COMMANDS = {Command.GET.value: 0, Command.GETS.value: 0, Command.GAT.value: 1, Command.GATS.value: 1}
+# commands whose arguments are not keys 
+ADMIN_COMMANDS = {Command.STATS.value, Command.SLOWLOG.value, Command.PROFILE.value, Command.LRU_CRAWLER.value, 
+                  Command.FLUSH_ALL.value, Command.FLUSH_NAMESPACE.value}
+CAS_STATS = {Response.STORED.value: "cas_hits", Response.NOT_FOUND.value: "cas_misses", 
+             Response.EXISTS.value: "cas_badval"}
+
+
+class ProtocolError(ValueError):
+    '''Input the connection cannot recover from, like a data block that does not match its declared 
+    length. Other ValueErrors raised by a command are answered with CLIENT_ERROR and the connection 
+    is kept, but this one closes it'''
+
+
+class UnknownCommandError(ValueError):
+    '''A command the server does not know, answered with ERROR as in memcached'''
 
 
 class Message:
 
-    DATA_SIZE = 1024
+    DATA_SIZE = 16 * 1024
+    # largest value a setter may store, memcached's -I 
+    MAX_ITEM_SIZE = 1024 * 1024
+    # responses are buffered and written once per received batch, or sooner once this many bytes are pending 
+    OUTPUT_BUFFER_LIMIT = 1024 * 1024
+    # most buffers a single sendmsg call may gather (IOV_MAX on Linux) 
+    MAX_IOVECS = 1024
+    # buckets or entries a metadump scans per lock acquisition 
+    METADUMP_BATCH = 1000
 
     def __init__(self, thread: int, client: str, address: str, hash_table: HashTable, 
-                 timeout: int, stop_event: threading.Event):
+                 timeout: int, stop_event: threading.Event, server_stats: ServerStats | None = None, 
+                 max_item_size: int = MAX_ITEM_SIZE):
         self.thread = thread
         self.client = client
         self.address = address
         self.hash_table = hash_table
-        self._recv_buffer = ""  
+        self.server_stats = server_stats if server_stats is not None else ServerStats(hash_table)
+        self.stats = self.server_stats.register()
+        self.hotkeys = self.server_stats.hotkeys
+        # keys left to go before the next one is sampled for hot key tracking 
+        self._hotkey_countdown = self.hotkeys.next_gap() if self.hotkeys is not None else 0
+        self.slowlog = self.server_stats.slowlog
+        self.profiler = self.server_stats.profiler
+        # commands left to go before the next one is profiled, while the profiler is on 
+        self._profile_countdown = 0
+        self._command_end = 0
+        # time spent writing responses that overflowed the output buffer mid-batch 
+        self._send_ns = 0
+        # (shards, shard index, cursor) of a metadump with batches left to send 
+        self._dump = None
+        self.max_item_size = max_item_size
+        self._recv_buffer = bytearray()
+        self._recv_pos = 0
+        # (command, args, no_reply, ChunkReceiver) of a setter whose large value is still arriving 
+        self._receiving = None
+        self._send_buffer = []
+        self._send_size = 0
         self.timeout = timeout 
         self.stop_event = stop_event
 
     def process_commands(self):
         last_message = datetime.now()
         while not self.stop_event.is_set(): 
+            if self.is_dumping():
+                self.resume()
+                last_message = datetime.now()
+                continue
             try:
-                data = self.client.recv(Message.DATA_SIZE)
+                received = self._recv()
             except BlockingIOError:
                 now = datetime.now()
                 if now - last_message > self.timeout:
                     raise RuntimeError("Client timed out")
             else:
-                if data:
-                    self._recv_buffer += data.decode("utf-8")
-                    self._process_recv_buffer()
+                if received:
                     last_message = datetime.now()
-                    print("Processed data")
+                    logger.debug("Processed data")
                 else:
-                    print("Didn't process data")
+                    logger.debug("Didn't process data")
                     raise RuntimeError("Client disconnected before data was sent")
                 
-        print("Stop event triggered, closing thread")
+        logger.info("Stop event triggered, closing thread")
+
+    def _recv(self) -> int:
+        '''Reads from the client socket and processes what arrived, returning the bytes read. While 
+        a large value is arriving and nothing else is buffered, reads go straight into its chunk'''
+        receiver = self._receiving[3] if self._receiving is not None else None
+        if receiver is not None and not receiver.done() and self._recv_pos == len(self._recv_buffer):
+            received = self.client.recv_into(receiver.get_buffer())
+            receiver.advance(received)
+            if received:
+                self.receive(b"")
+            return received
+
+        data = self.client.recv(Message.DATA_SIZE)
+        if data:
+            self.receive(data)
+        return len(data)
+
+    def receive(self, data: bytes):
+        '''Appends raw client data to the buffer and executes every complete command in it'''
+        server_clock.tick()
+        self._recv_buffer += data
+        self.resume()
+
+    def is_dumping(self) -> bool:
+        return self._dump is not None
+
+    def resume(self):
+        '''Executes buffered commands and writes the responses. A metadump sends one batch per call 
+        while it lasts, and the commands behind it wait, so callers resume it until is_dumping is 
+        False, serving other clients in between'''
+        self._process_recv_buffer()
+        start = time.perf_counter_ns()
+        self._flush()
+        elapsed = time.perf_counter_ns() - start
+        if 0 < self.slowlog.threshold_ns <= elapsed:
+            self.slowlog.record("flush", [], self.address, (0, 0, 0, elapsed))
 
     def _process_recv_buffer(self):
-        command_buffered, multiline = self._check_complete_buffered()
-        while command_buffered:
-            header, value = self._strip_message(multiline)
+        # a command's parse phase runs from the end of the one before, saving a clock read per command 
+        self._command_end = time.perf_counter_ns()
+        while True:
+            if self._dump is not None:
+                self._continue_dump()
+                if self._dump is not None:
+                    break
+                self._command_end = time.perf_counter_ns()
+            try:
+                next_command = self._next_command()
+                if next_command is None:
+                    break
+                command, args, no_reply, value = next_command
+                if self.profiler.every and self._profile_due():
+                    self.profiler.run(self._perform_cache_operation, command, args, no_reply, value, 
+                                      self._command_end)
+                else:
+                    self._perform_cache_operation(command, args, no_reply, value, self._command_end)
+            except ProtocolError:
+                raise
+            except UnknownCommandError:
+                self._send_response([UNKNOWN_COMMAND])
+            except ValueError as e:
+                self._send_response([b"CLIENT_ERROR %b\r\n" % str(e).encode("utf-8", "surrogateescape")])
+
+        # consumed commands are dropped once per batch rather than once per command 
+        if self._recv_pos:
+            del self._recv_buffer[:self._recv_pos]
+            self._recv_pos = 0
+
+    def _next_command(self):
+        '''Parses the next complete command at the read position, or returns None if more data is 
+        needed. A setter's value is framed by its declared byte count, so it may contain CRLF. 
+        Values over CHUNK_SIZE are moved into chunks as they arrive instead of waiting in the buffer'''
+        while self._receiving is not None:
+            next_command = self._finish_receiving()
+            if next_command is None or next_command[0] is not None:
+                return next_command
+
+        header_end = self._recv_buffer.find(LINE_END, self._recv_pos)
+        if header_end == -1:
+            return None
+
+        value = None
+        next_pos = header_end + len(LINE_END)
+        try:
+            header = self._recv_buffer[self._recv_pos:header_end].decode("utf-8")
             command, args, no_reply = self._parse_header(header)
-            self._perform_cache_operation(command, args, no_reply, value)
-            command_buffered, multiline = self._check_complete_buffered() # continue while buffer nonempty 
+            byte_count = self._data_length(command, args)
+            if byte_count is not None and byte_count < 0:
+                raise ValueError("Byte count must be non-negative")
+        except ValueError:
+            # the bad line is skipped; as in memcached, a data block after it is then read as commands 
+            self._recv_pos = next_pos
+            raise
+
+        if byte_count is not None:
+            # setters are checked once their header is framed, so a refused value is swallowed 
+            discard = byte_count > self.max_item_size or not self._valid_flag(command, args)
+            if byte_count > CHUNK_SIZE or discard:
+                receiver = ChunkReceiver(byte_count, discard=discard)
+                self._recv_pos = next_pos
+                self._receiving = command, args, no_reply, receiver
+                return self._next_command()
+            value_end = next_pos + byte_count
+            if len(self._recv_buffer) < value_end + len(LINE_END):
+                return None
+            if self._recv_buffer[value_end:value_end + len(LINE_END)] != LINE_END:
+                raise ProtocolError("Data block does not match the declared byte count")
+            with memoryview(self._recv_buffer) as view:
+                value = bytes(view[next_pos:value_end])
+            next_pos = value_end + len(LINE_END)
+
+        self._recv_pos = next_pos
+        return command, args, no_reply, value
+
+    def _finish_receiving(self):
+        '''Feeds buffered bytes to the value being received. Returns None while more data is needed 
+        and the completed command otherwise, or a None command if the value was too large and 
+        has been answered already'''
+        command, args, no_reply, receiver = self._receiving
+        if not receiver.done():
+            with memoryview(self._recv_buffer) as view:
+                self._recv_pos += receiver.feed(view[self._recv_pos:])
+            if not receiver.done():
+                return None
+
+        if len(self._recv_buffer) < self._recv_pos + len(LINE_END):
+            return None
+        if self._recv_buffer[self._recv_pos:self._recv_pos + len(LINE_END)] != LINE_END:
+            raise ProtocolError("Data block does not match the declared byte count")
+        self._recv_pos += len(LINE_END)
+        self._receiving = None
+
+        if receiver.discard:
+            # like memcached, the refused value is swallowed and the error sent even with noreply
+            self._send_response([TOO_LARGE if receiver.byte_count > self.max_item_size else BAD_FLAGS])
+            return None, None, None, None
+        return command, args, no_reply, receiver.get_value()
+
+    @staticmethod 
+    def _valid_flag(command, args) -> bool:
+        '''Whether a classic setter's client flag fits in 32 bits; ms checks its F token itself'''
+        return command not in STORAGE_COMMANDS or 0 <= args[1] < FLAG_LIMIT
+
+    @staticmethod 
+    def _data_length(command, args):
+        '''Returns the declared size of the data block following the command line, None if it has none'''
+        if command in STORAGE_COMMANDS:
+            return args[3]
+        if command == MetaCommand.SET.value:
+            return args[1]
+        return None
 
-    def _check_complete_buffered(self):
-        count = self._recv_buffer.count("\r\n")
-        one_buffered = (self._recv_buffer.startswith(Command.GET.value) or 
-                        self._recv_buffer.startswith(Command.DELETE.value)) and count >= 1
-        
-        two_buffered = any([self._recv_buffer.startswith(val) for val in [
-            Command.REPLACE.value, Command.ADD.value, Command.SET.value]]
-            ) and count >= 2
-        return one_buffered or two_buffered, count >= 2
-
-    def _strip_message(self, multiline):
-        '''If command is single line, value is None. If multi-line, second line is value'''
-        header = self._strip_buffer_for_message()
-        value = None 
-        if multiline:
-            value = self._strip_buffer_for_message()
-        return header, value
-    
-    def _strip_buffer_for_message(self):
-        idx = self._recv_buffer.find("\r\n")
-        line_item = self._recv_buffer[:idx]
-        self._recv_buffer = self._recv_buffer[idx + 2:]
-        return line_item
-    
     def _parse_header(self, header):
         elements = header.split(" ")
         
         command = elements[0]
-        if command in [Command.GET.value, Command.DELETE.value]:
-            if len(elements) != 2:
-                raise ValueError("Must pass 2 items for get or delete command")
-            args = [elements[1]]
+        if command in [Command.GET.value, Command.GETS.value]:
+            if len(elements) < 2:
+                raise ValueError("Must pass at least one key for get command")
+            args = elements[1:]
             no_reply = False
 
-        elif command in [Command.SET.value, Command.ADD.value, Command.REPLACE.value]:
-            if not (len(elements) == 5 or len(elements) == 6):
-                raise ValueError("Must pass 5 or 6 items for setter command")
-            if len(elements) == 5:
+        elif command in (Command.GAT.value, Command.GATS.value):
+            if len(elements) < 3:
+                raise ValueError(f"Must pass an exptime and at least one key for {command} command")
+            args = [int(elements[1])] + elements[2:]
+            no_reply = False
+
+        elif command == Command.TOUCH.value:
+            if not (len(elements) == 3 or len(elements) == 4):
+                raise ValueError("Must pass 3 or 4 items for touch command")
+            args = [elements[1], int(elements[2])]
+            no_reply = len(elements) == 4 and elements[3] == "noreply"
+
+        elif command == Command.DELETE.value:
+            if not (len(elements) == 2 or len(elements) == 3):
+                raise ValueError("Must pass 2 or 3 items for delete command")
+            args = [elements[1]]
+            no_reply = len(elements) == 3 and elements[2] == "noreply"
+
+        elif command in STORAGE_COMMANDS:
+            arg_count = 6 if command == Command.CAS.value else 5
+            if not (len(elements) == arg_count or len(elements) == arg_count + 1):
+                raise ValueError(f"Must pass {arg_count} or {arg_count + 1} items for {command} command")
+            if len(elements) == arg_count:
                 args = elements[1:]
                 no_reply = False
-            elif len(elements) == 6:
+            else:
                 args = elements[1:-1]
                 no_reply = True if elements[-1] == "noreply" else False 
 
             args = [int(arg) if idx != 0 else arg for idx, arg in enumerate(args)]
+
+        elif command in [Command.INCR.value, Command.DECR.value]:
+            if not (len(elements) == 3 or len(elements) == 4):
+                raise ValueError(f"Must pass 3 or 4 items for {command} command")
+            delta = int(elements[2])
+            if not 0 <= delta < 2 ** 64:
+                raise ValueError("Delta must be an unsigned 64 bit integer")
+            args = [elements[1], delta]
+            no_reply = len(elements) == 4 and elements[3] == "noreply"
+
+        elif command in META_COMMANDS:
+            command, args = parse_meta_header(elements)
+            no_reply = False
+
+        elif command == Command.STATS.value:
+            if len(elements) > 2:
+                raise ValueError("Must pass 1 or 2 items for stats command")
+            args = elements[1:]
+            no_reply = False
+
+        elif command == Command.SLOWLOG.value:
+            # slowlog <threshold in microseconds> or slowlog reset 
+            if len(elements) != 2:
+                raise ValueError("Must pass 2 items for slowlog command")
+            args = [elements[1] if elements[1] == "reset" else int(elements[1])]
+            no_reply = False
+
+        elif command == Command.PROFILE.value:
+            # profile on [every], profile off or profile reset 
+            if not (len(elements) == 2 or len(elements) == 3 and elements[1] == "on"):
+                raise ValueError("Must pass profile on [every], off or reset")
+            if elements[1] not in ("on", "off", "reset"):
+                raise ValueError(f"Profile action {elements[1]} not supported")
+            args = [elements[1]] + [int(element) for element in elements[2:]]
+            no_reply = False
+
+        elif command == Command.LRU_CRAWLER.value:
+            if elements[1:] != ["metadump", "all"]:
+                raise ValueError("Only lru_crawler metadump all is supported")
+            args = elements[1:]
+            no_reply = False
+
+        elif command == Command.FLUSH_ALL.value:
+            # flush_all [delay] [noreply] 
+            no_reply = elements[-1] == "noreply"
+            args = [int(element) for element in elements[1:len(elements) - no_reply]]
+            if len(args) > 1 or args and args[0] < 0:
+                raise ValueError("Must pass flush_all [delay] [noreply] with a non-negative delay")
+
+        elif command == Command.FLUSH_NAMESPACE.value:
+            if not (len(elements) == 2 or len(elements) == 3):
+                raise ValueError("Must pass 2 or 3 items for flush_namespace command")
+            args = [elements[1]]
+            no_reply = len(elements) == 3 and elements[2] == "noreply"
         
         else:
-            raise ValueError(f"Command {command} not supported")
+            raise UnknownCommandError(f"Command {command} not supported")
             
         return command, args, no_reply 
         
 
-    def _perform_cache_operation(self, command, args, no_reply, value):
-        with hash_table_lock:
-            if command == Command.GET.value:
-                key = args[0] 
-                return_value = self.hash_table.get(key)
-                if return_value:
-                    value, flag, byte_count = return_value
-                    return_str = f"{Response.VALUE.value} {value} {flag} {byte_count}"
-                else:
-                    return_str = Response.END.value
+    def _perform_cache_operation(self, command, args, no_reply, value, parse_start=None):
+        start = time.perf_counter_ns()
+        lock_wait_ns, send_ns = self.stats.lock_wait_ns, self._send_ns
+        if self.hotkeys is not None and args and command not in ADMIN_COMMANDS:
+            # keys are counted down to the next sample, so a key that is not sampled costs a subtraction 
+            first_key = MULTI_KEY_COMMANDS.get(command)
+            self._hotkey_countdown -= 1 if first_key is None else len(args) - first_key
+            if self._hotkey_countdown <= 0:
+                self._sample_hot_keys(args[:1] if first_key is None else args[first_key:])
+
+        # only the table operation runs under the shard's lock, formatting happens after release 
+        if command in META_COMMANDS:
+            response = perform_meta_operation(self.hash_table, command, args, value, self.stats)
+            no_reply = not response
 
-            elif command in [Command.SET.value, Command.ADD.value, Command.REPLACE.value]:
-                key, flag, expiry, byte_count = args
-                return_str = self.hash_table.insert(key, value, flag, byte_count, expiry, Command(command))
+        elif command in [Command.GET.value, Command.GETS.value]:
+            response = self._get_values(args, command == Command.GETS.value)
 
-            elif command == Command.DELETE.value:
-                key = args[0]
-                return_str = self.hash_table.delete(key)
+        elif command in (Command.GAT.value, Command.GATS.value):
+            response = self._get_values(args[1:], command == Command.GATS.value, args[0])
 
+        elif command == Command.TOUCH.value:
+            key, expiry = args
+            shard = self.hash_table.get_shard(key)
+            with TimedLock(shard.lock, self.stats):
+                item = shard.touch(key, expiry)
+            self.stats.cmd_touch += 1
+            if item is None:
+                self.stats.touch_misses += 1
+                response = [ENCODED_RESPONSES[Response.NOT_FOUND.value]]
             else:
-                raise ValueError(f"Command {command} is not supported")
-        
+                self.stats.touch_hits += 1
+                response = [ENCODED_RESPONSES[Response.TOUCHED.value]]
+
+        elif command in STORAGE_COMMANDS:
+            key, flag, expiry, byte_count = args[:4]
+            cas_unique = args[4] if command == Command.CAS.value else None
+            shard = self.hash_table.get_shard(key)
+            self.stats.cmd_set += 1
+            with TimedLock(shard.lock, self.stats):
+                result = shard.insert(key, value, flag, byte_count, expiry, Command(command), cas_unique)
+            if command == Command.CAS.value:
+                counter = CAS_STATS.get(result)
+                if counter is not None:
+                    setattr(self.stats, counter, getattr(self.stats, counter) + 1)
+            response = [ENCODED_RESPONSES[result]]
+
+        elif command in [Command.INCR.value, Command.DECR.value]:
+            key, delta = args
+            shard = self.hash_table.get_shard(key)
+            with TimedLock(shard.lock, self.stats):
+                result = shard.increment(key, delta, command == Command.DECR.value)
+            hit = result != Response.NOT_FOUND.value
+            counter = f"{command}_hits" if hit else f"{command}_misses"
+            setattr(self.stats, counter, getattr(self.stats, counter) + 1)
+            response = [ENCODED_RESPONSES[result] if isinstance(result, str) else b"%d\r\n" % result]
+
+        elif command == Command.DELETE.value:
+            key = args[0]
+            shard = self.hash_table.get_shard(key)
+            with TimedLock(shard.lock, self.stats):
+                result = shard.delete(key)
+            if result == Response.DELETED.value:
+                self.stats.delete_hits += 1
+            else:
+                self.stats.delete_misses += 1
+            response = [ENCODED_RESPONSES[result]]
+
+        elif command == Command.STATS.value:
+            response = self._get_stats(args[0] if args else None)
+
+        elif command == Command.SLOWLOG.value:
+            if args[0] == "reset":
+                self.slowlog.reset()
+            else:
+                self.slowlog.set_threshold(args[0])
+            response = [ENCODED_RESPONSES[Response.OK.value]]
+
+        elif command == Command.PROFILE.value:
+            if args[0] == "on":
+                self.profiler.start(*args[1:])
+            elif args[0] == "off":
+                self.profiler.stop()
+            else:
+                self.profiler.reset()
+            response = [ENCODED_RESPONSES[Response.OK.value]]
+
+        elif command == Command.LRU_CRAWLER.value:
+            # the items are sent batch by batch as the dump is resumed 
+            self._dump = self.hash_table.get_shards(), 0, 0
+            response = []
+
+        elif command in (Command.FLUSH_ALL.value, Command.FLUSH_NAMESPACE.value):
+            # both only record a generation; flushed items are dropped when next touched or crawled 
+            try:
+                for shard in self.hash_table.get_shards():
+                    with TimedLock(shard.lock, self.stats):
+                        if command == Command.FLUSH_ALL.value:
+                            shard.flush(*args)
+                        else:
+                            shard.flush_namespace(args[0])
+            except NotImplementedError as e:
+                response = [b"SERVER_ERROR %b\r\n" % str(e).encode("utf-8")]
+            else:
+                self.stats.cmd_flush += 1
+                if self.server_stats.reaper is not None:
+                    self.server_stats.reaper.schedule_crawl(args[0] if command == Command.FLUSH_ALL.value and args else 0)
+                response = [ENCODED_RESPONSES[Response.OK.value]]
+
+        else:
+            raise ValueError(f"Command {command} is not supported")
 
         if not no_reply:
-            self._send_response(return_str)
+            self._send_response(response)
+
+        self._command_end = end = time.perf_counter_ns()
+        self.stats.record_latency(command, end - start)
+        if 0 < self.slowlog.threshold_ns <= end - (start if parse_start is None else parse_start):
+            self._log_slow_command(command, args, parse_start, start, end, lock_wait_ns, send_ns)
+        return response
+
+    def _log_slow_command(self, command, args, parse_start, start, end, lock_wait_ns, send_ns):
+        '''Splits the command's time into phases from the counters read when it started'''
+        parse_ns = start - parse_start if parse_start is not None else 0
+        lock_wait_ns = self.stats.lock_wait_ns - lock_wait_ns
+        send_ns = self._send_ns - send_ns
+        first_key = MULTI_KEY_COMMANDS.get(command)
+        keys = args[:1] if first_key is None else args[first_key:]
+        self.slowlog.record(command, keys, self.address, 
+                            (parse_ns, lock_wait_ns, end - start - lock_wait_ns - send_ns, send_ns))
+
+    def _continue_dump(self):
+        '''Sends key, expiry (unix time, -1 for never), last access, cas and size of the items in the 
+        next batch of the current shard, as memcached's lru_crawler metadump does, taking the 
+        shard's lock only while the batch is copied out'''
+        shards, index, cursor = self._dump
+        shard = shards[index]
+        with TimedLock(shard.lock, self.stats):
+            cursor, items = shard.scan(cursor, Message.METADUMP_BATCH, metadata=True)
+        unix_offset = server_clock.to_unix_time(0)
+        parts = [b"key=%b exp=%d la=%d cas=%d size=%d\r\n" % (quote(key, safe="", errors="surrogateescape").encode(), 
+                                                              expiry + unix_offset if expiry else -1, 
+                                                              last_access + unix_offset, cas, size) 
+                 for key, size, expiry, last_access, cas in items]
+        if cursor == 0:
+            index += 1
+        if index == len(shards):
+            parts.append(ENCODED_RESPONSES[Response.END.value])
+            self._dump = None
+        else:
+            self._dump = shards, index, cursor
+        self._send_response(parts)
+
+    def _profile_due(self):
+        self._profile_countdown -= 1
+        if self._profile_countdown > 0:
+            return False
+        self._profile_countdown = self.profiler.every
+        return True
+
+    def _sample_hot_keys(self, keys):
+        '''Records the keys the countdown reached, the last of keys sitting at countdown 0'''
+        while self._hotkey_countdown <= 0:
+            self.hotkeys.record(keys[self._hotkey_countdown + len(keys) - 1])
+            self._hotkey_countdown += self.hotkeys.next_gap()
+
+    def _get_values(self, keys, with_cas, time_to_expiry=None):
+        '''Looks up every key taking each shard's lock once, and returns the buffers of all VALUE 
+        blocks followed by END, so values are written out without being copied into one string. 
+        With time_to_expiry, as for gat and gats, the items found are touched as well'''
+        keys_by_shard = {}
+        for key in keys:
+            keys_by_shard.setdefault(self.hash_table.get_shard(key), []).append(key)
+
+        items = {}
+        for shard, shard_keys in keys_by_shard.items():
+            with TimedLock(shard.lock, self.stats):
+                if time_to_expiry is None:
+                    for key in shard_keys:
+                        items[key] = shard.get_item(key)
+                else:
+                    for key in shard_keys:
+                        items[key] = shard.touch(key, time_to_expiry, with_value=True)
+
+        parts = []
+        hits = 0
+        for key in keys:
+            item = items[key]
+            if item is None:
+                continue
+            hits += 1
+            value, flag, byte_count, cas, _ = item
+            if with_cas:
+                parts.append(b"VALUE %b %d %d %d\r\n" % (key.encode("utf-8"), flag, byte_count, cas))
+            else:
+                parts.append(b"VALUE %b %d %d\r\n" % (key.encode("utf-8"), flag, byte_count))
+            parts.extend(value_buffers(value))
+            parts.append(LINE_END)
+        parts.append(ENCODED_RESPONSES[Response.END.value])
+
+        # as in memcached, gat and gats count as gets as well as touches 
+        self.stats.cmd_get += len(keys)
+        self.stats.get_hits += hits
+        self.stats.get_misses += len(keys) - hits
+        if time_to_expiry is not None:
+            self.stats.cmd_touch += len(keys)
+            self.stats.touch_hits += hits
+            self.stats.touch_misses += len(keys) - hits
+        return parts
+
+    def _get_stats(self, group):
+        # hot keys and slow log entries may hold binary keys set with the meta commands' b flag 
+        parts = [b"STAT %b %b\r\n" % (str(name).encode("utf-8", "surrogateescape"), 
+                                       str(value).encode("utf-8", "surrogateescape")) 
+                 for name, value in self.server_stats.report(group)]
+        parts.append(ENCODED_RESPONSES[Response.END.value])
+        return parts
+
+    def _send_response(self, response: list[bytes]):
+        self._send_buffer.extend(response)
+        self._send_size += sum(len(part) for part in response)
+        if self._send_size >= Message.OUTPUT_BUFFER_LIMIT:
+            start = time.perf_counter_ns()
+            self._flush()
+            self._send_ns += time.perf_counter_ns() - start
 
-        return return_str
+    def _flush(self):
+        '''Writes every buffered response with as few sendmsg calls as possible, resuming after 
+        partial writes. Blocking here is what pushes back on clients that read slowly'''
+        buffers, i = self._send_buffer, 0
+        while i < len(buffers):
+            sent = self.client.sendmsg(buffers[i:i + Message.MAX_IOVECS])
+            while i < len(buffers) and sent >= len(buffers[i]):
+                sent -= len(buffers[i])
+                i += 1
+            if sent:
+                buffers[i] = memoryview(buffers[i])[sent:]
 
-    def _send_response(self, return_str):
-        return_str += "\r\n"
-        self.client.send(return_str.encode("utf-8"))
+        self._send_buffer = []
+        self._send_size = 0
 
 
     def close(self):
+       self.server_stats.unregister(self.stats)
        self.client.close()
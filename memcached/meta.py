@@ -0,0 +1,148 @@
+import base64
+from enum import Enum
+
+from memcached.hash_table import Command, Response, FLAG_LIMIT
+from memcached.stats import ConnectionStats, TimedLock
+from memcached.chunks import value_buffers
+
+
+class MetaCommand(Enum):
+    GET = "mg"
+    SET = "ms"
+    DELETE = "md"
+    NOOP = "mn"
+
+
+class MetaResponse(Enum):
+    HEADER = "HD"
+    VALUE = "VA"
+    MISS = "EN"
+    NOT_STORED = "NS"
+    NOT_FOUND = "NF"
+    EXISTS = "EX"
+    NOOP = "MN"
+
+
+META_COMMANDS = [command.value for command in MetaCommand]
+
+# ms M<mode> tokens and the store they perform
+SET_MODES = {"S": Command.SET, "E": Command.ADD, "R": Command.REPLACE, "A": Command.APPEND, 
+             "P": Command.PREPEND}
+
+# ms outcomes other than STORED and the status line they answer with
+SET_FAILURES = {Response.NOT_STORED.value: MetaResponse.NOT_STORED, Response.EXISTS.value: MetaResponse.EXISTS, 
+                Response.NOT_FOUND.value: MetaResponse.NOT_FOUND}
+
+LINE_END = b"\r\n"
+
+
+def parse_meta_header(elements: list[str]) -> tuple[str, list]:
+    '''Splits a meta command line into its command and args: [key, flags] or, for ms,
+    [key, data length, flags]. Flags are (flag, token) pairs in request order, since return
+    flags are echoed back in the order they were asked for. Base64 keys (b flag) are decoded'''
+    command = elements[0]
+    if command == MetaCommand.NOOP.value:
+        return command, []
+
+    key_elements = 3 if command == MetaCommand.SET.value else 2
+    if len(elements) < key_elements:
+        raise ValueError(f"Must pass {key_elements} or more items for {command} command")
+
+    flags = [(element[0], element[1:]) for element in elements[key_elements:] if element]
+    key = elements[1]
+    if any(flag == "b" for flag, _ in flags):
+        key = base64.b64decode(key, validate=True).decode("utf-8", "surrogateescape")
+
+    if command == MetaCommand.SET.value:
+        return command, [key, int(elements[2]), flags]
+    return command, [key, flags]
+
+
+def perform_meta_operation(hash_table, command: str, args: list, value: bytes | None, 
+                           stats: ConnectionStats) -> list[bytes]:
+    '''Runs a meta command and returns its response buffers, which are empty when the q flag
+    suppresses the usual outcome (a miss for mg, success for ms and md)'''
+    if command == MetaCommand.NOOP.value:
+        return [_status(MetaResponse.NOOP)]
+
+    key, flags = args[0], args[-1]
+    requested = dict(flags)
+    quiet = "q" in requested
+    shard = hash_table.get_shard(key)
+
+    if command == MetaCommand.GET.value:
+        with TimedLock(shard.lock, stats):
+            # T<ttl> touches the item as gat does
+            if "T" in requested:
+                item = shard.touch(key, int(requested["T"]), with_value=True)
+            else:
+                item = shard.get_item(key)
+        stats.cmd_get += 1
+        if item is None:
+            stats.get_misses += 1
+            return [] if quiet else [_status(MetaResponse.MISS)]
+        stats.get_hits += 1
+
+        value, flag, byte_count, cas, expiry = item
+        ttl = expiry - shard.clock.current_time if expiry else -1
+        return_flags = _return_flags(flags, key, {"c": cas, "f": flag, "s": byte_count, "t": ttl})
+        if "v" in requested:
+            return [b"VA %d%b\r\n" % (byte_count, return_flags), *value_buffers(value), LINE_END]
+        return [_status(MetaResponse.HEADER, return_flags)]
+
+    elif command == MetaCommand.SET.value:
+        mode = SET_MODES.get(requested.get("M", "S").upper())
+        if mode is None:
+            raise ValueError(f"Mode {requested['M']} not supported for ms command")
+        # C<cas> turns a plain set into a compare and swap
+        cas_unique = int(requested["C"]) if "C" in requested else None
+        if cas_unique is not None and mode == Command.SET:
+            mode = Command.CAS
+        client_flag, ttl = int(requested.get("F", 0)), int(requested.get("T", 0))
+        if not 0 <= client_flag < FLAG_LIMIT:
+            raise ValueError("Flags must be an unsigned 32 bit integer")
+        stats.cmd_set += 1
+        with TimedLock(shard.lock, stats):
+            result = shard.insert(key, value, client_flag, args[1], ttl, mode, cas_unique)
+            stored = result == Response.STORED.value
+            cas = shard.get(key, with_cas=True)[3] if stored and "c" in requested else 0
+        return_flags = _return_flags(flags, key, {"c": cas})
+        if not stored:
+            return [_status(SET_FAILURES[result], return_flags)]
+        return [] if quiet else [_status(MetaResponse.HEADER, return_flags)]
+
+    elif command == MetaCommand.DELETE.value:
+        with TimedLock(shard.lock, stats):
+            deleted = shard.delete(key) == Response.DELETED.value
+        return_flags = _return_flags(flags, key, {})
+        if not deleted:
+            stats.delete_misses += 1
+            return [_status(MetaResponse.NOT_FOUND, return_flags)]
+        stats.delete_hits += 1
+        return [] if quiet else [_status(MetaResponse.HEADER, return_flags)]
+
+    raise ValueError(f"Command {command} is not supported")
+
+
+def _status(response: MetaResponse, return_flags: bytes = b"") -> bytes:
+    return response.value.encode("utf-8") + return_flags + LINE_END
+
+
+def _return_flags(flags: list[tuple[str, str]], key: str, values: dict) -> bytes:
+    '''Formats the requested return flags as " f0 t-1 Oabc ..." from values plus the key,
+    opaque and base64 marker, which every meta command echoes'''
+    base64_key = any(flag == "b" for flag, _ in flags)
+    parts = []
+    for flag, token in flags:
+        if flag in values:
+            parts.append(f"{flag}{values[flag]}")
+        elif flag == "k":
+            if base64_key:
+                parts.append("k" + base64.b64encode(key.encode("utf-8", "surrogateescape")).decode("ascii"))
+            else:
+                parts.append(f"k{key}")
+        elif flag == "O":
+            parts.append(f"O{token}")
+        elif flag == "b" and any(flag == "k" for flag, _ in flags):
+            parts.append("b")
+    return "".join(f" {part}" for part in parts).encode("utf-8")
@@ -0,0 +1,117 @@
+import cProfile
+import os
+import pstats
+import threading
+import time
+from collections import deque
+
+
+class SlowLog:
+
+    '''The most recent commands that took at least threshold microseconds, from parsing their
+    line to queueing their response, with the time split into phases: parse, lock wait (time
+    blocked on a contended table lock), table (the operation itself, resizes included) and send.
+    Responses are written once per received batch, so a slow socket write is logged as a flush
+    entry of its own. A threshold of 0 turns the log off'''
+
+    DEFAULT_THRESHOLD = 10000
+    MAX_ENTRIES = 128
+    PHASES = ("parse", "lock_wait", "table", "send")
+
+    def __init__(self, threshold: int = DEFAULT_THRESHOLD, max_entries: int = MAX_ENTRIES):
+        self.lock = threading.Lock()
+        self.entries = deque(maxlen=max_entries)
+        self.logged = 0
+        self.set_threshold(threshold)
+
+    def set_threshold(self, threshold: int) -> None:
+        if threshold < 0:
+            raise ValueError("Slow log threshold must be non-negative")
+        self.threshold = threshold
+        # read on every command, so kept in the unit commands are timed in
+        self.threshold_ns = threshold * 1000
+
+    def record(self, command: str, keys: list, address, phases_ns: tuple[int, int, int, int]) -> None:
+        with self.lock:
+            self.logged += 1
+            self.entries.append((self.logged, int(time.time()), command, keys[:1], len(keys), address, phases_ns))
+
+    def reset(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def report(self) -> list[tuple[str, object]]:
+        '''Returns the settings and one line per entry, newest first'''
+        with self.lock:
+            entries = list(self.entries)
+            report = [("slowlog_threshold", self.threshold), ("slowlog_len", len(entries)),
+                      ("slowlog_logged", self.logged)]
+        for entry_id, logged_at, command, keys, key_count, address, phases_ns in reversed(entries):
+            target = " ".join(str(key) for key in keys)
+            if key_count > 1:
+                target += f" +{key_count - 1}"
+            phases = " ".join(f"{phase}={elapsed // 1000}us" for phase, elapsed in zip(SlowLog.PHASES, phases_ns))
+            client = f"{address[0]}:{address[1]}" if isinstance(address, tuple) else address
+            report.append((f"slowlog:{entry_id}",
+                           f"{logged_at} {sum(phases_ns) // 1000}us {command} {target} {phases} client={client}"))
+        return report
+
+
+class RequestProfiler:
+
+    '''Runs one in every `every` commands of each connection under cProfile and adds up the
+    results, so a live server can be profiled without paying for it on every command. It is off
+    until started, and the profile command starts, stops and resets it at runtime. Only one
+    command is profiled at a time; others due while one is running are skipped'''
+
+    DEFAULT_EVERY = 100
+    REPORT_LIMIT = 30
+
+    def __init__(self):
+        self.every = 0
+        self.profiled = 0
+        self.stats = None
+        self.lock = threading.Lock()
+        self.running = threading.Lock()
+
+    def start(self, every: int = DEFAULT_EVERY) -> None:
+        if every < 1:
+            raise ValueError("Must profile every 1 or more commands")
+        self.every = every
+
+    def stop(self) -> None:
+        self.every = 0
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stats = None
+            self.profiled = 0
+
+    def run(self, function, *args):
+        '''Calls function under the profiler, or plainly if another command is being profiled'''
+        if not self.running.acquire(False):
+            return function(*args)
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args)
+        finally:
+            self.running.release()
+            with self.lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+                self.profiled += 1
+
+    def report(self, limit: int = REPORT_LIMIT) -> list[tuple[str, object]]:
+        '''Returns the functions with the most cumulative time as calls, total and cumulative
+        seconds and location, like pstats' columns'''
+        with self.lock:
+            report = [("profile_every", self.every), ("profile_commands", self.profiled)]
+            if self.stats is None:
+                return report
+            functions = sorted(self.stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        for rank, ((filename, line, name), (_, calls, total, cumulative, _)) in enumerate(functions, 1):
+            location = f"{os.path.basename(filename)}:{line}({name})" if filename != "~" else name
+            report.append((f"profile:{rank}", f"{calls} {total:.6f} {cumulative:.6f} {location}"))
+        return report
@@ -1,14 +1,80 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import signal
 import socket 
+import sys
 import threading 
 
 from memcached.message import Message 
-from memcached.hash_table import HashTable
+from memcached.hash_table import HashTable, ShardedHashTable
+from memcached.compact_table import CompactHashTable
+from memcached.shared_table import SharedHashTable
+from memcached.slab_table import SlabHashTable
+from memcached.tinylfu import TinyLFUHashTable
+from memcached.expiry import ExpiryReaper
+from memcached.snapshot import Snapshotter, read_item_count, restore_snapshot
+from memcached.stats import ServerStats
+from memcached.compression import Compressor
+from memcached.hotkeys import HotKeyTracker
+from memcached.profiling import SlowLog
+
+logger = logging.getLogger(__name__)
 
 DEFAULT_TIMEOUT = 60
 DEFAULT_CACHE_CAPACITY = 100
 DEFAULT_HOST = "0.0.0.0"
 DEFAULT_PORT = 11211
 
+TABLE_ENGINES = {"chained": HashTable, "compact": CompactHashTable, "slab": SlabHashTable}
+# eviction policies of the chained engine
+EVICTION_POLICIES = {"lru": HashTable, "tinylfu": TinyLFUHashTable}
+
+
+def create_hash_table(hash_capacity, shards=1, memory_limit=None, table_engine="chained", restore_path=None, 
+                      compress_threshold=None, compress_level=Compressor.DEFAULT_LEVEL, eviction_policy="lru", 
+                      max_item_size=Message.MAX_ITEM_SIZE):
+    '''Builds the table; given a snapshot to restore, it is sized up front for the snapshot's items 
+    so loading them never resizes, and then loaded'''
+    if restore_path is not None and not os.path.exists(restore_path):
+        logger.warning("Snapshot %s does not exist, starting with an empty cache", restore_path)
+        restore_path = None
+    if restore_path is not None:
+        hash_capacity = max(hash_capacity, 2 * read_item_count(restore_path) + 1)
+
+    table_class = TABLE_ENGINES[table_engine]
+    if eviction_policy != "lru":
+        if table_engine != "chained":
+            raise ValueError(f"Eviction policy {eviction_policy} needs the chained table engine")
+        table_class = EVICTION_POLICIES[eviction_policy]
+    if table_engine == "slab":
+        # slab pages must hold the largest value clients may send 
+        table_class = functools.partial(table_class, max_item_size=max_item_size)
+    if shards > 1:
+        hash_table = ShardedHashTable(hash_capacity, shards, memory_limit, table_class, 
+                                      compress_threshold=compress_threshold, compress_level=compress_level)
+    else:
+        hash_table = table_class(hash_capacity, memory_limit, compress_threshold=compress_threshold, 
+                                 compress_level=compress_level)
+
+    if restore_path is not None:
+        restore_snapshot(hash_table, restore_path)
+    return hash_table
+
+
+def create_hotkey_tracker(hotkey_sample_rate):
+    '''Returns a tracker sampling at the given rate, or None if the rate is 0'''
+    return HotKeyTracker(hotkey_sample_rate) if hotkey_sample_rate else None
+
+
+def create_snapshotter(hash_table, snapshot_path, snapshot_interval):
+    if snapshot_path is None:
+        return None
+    return Snapshotter(hash_table, snapshot_path, snapshot_interval)
+
+
 class ThreadedServer:
 
     BACKLOG_SIZE = 5
@@ -16,17 +82,32 @@ class ThreadedServer:
     DEFAULT_CACHE_CAPACITY = 100
 
     def __init__(self, host, port, max_threads, hash_capacity=DEFAULT_CACHE_CAPACITY, 
-                 client_timeout=DEFAULT_TIMEOUT):
+                 client_timeout=DEFAULT_TIMEOUT, shards=1, memory_limit=None, table_engine="chained", 
+                 hash_table=None, reuse_port=False, restore_path=None, snapshot_path=None, 
+                 snapshot_interval=Snapshotter.DEFAULT_INTERVAL, max_item_size=Message.MAX_ITEM_SIZE, 
+                 compress_threshold=None, compress_level=Compressor.DEFAULT_LEVEL, 
+                 hotkey_sample_rate=HotKeyTracker.DEFAULT_SAMPLE_RATE, eviction_policy="lru", 
+                 slowlog_threshold=SlowLog.DEFAULT_THRESHOLD):
         self.host = host
         self.port = port
+        self.max_item_size = max_item_size
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.sock.bind((self.host, self.port))
         self.stop_event = threading.Event()
         self.client_timeout = client_timeout
 
         self.thread_manager = ThreadManager(max_threads)
-        self.hash_table = HashTable(hash_capacity)
+        if hash_table is None:
+            hash_table = create_hash_table(hash_capacity, shards, memory_limit, table_engine, restore_path, 
+                                           compress_threshold, compress_level, eviction_policy, max_item_size)
+        self.hash_table = hash_table
+        self.reaper = ExpiryReaper(self.hash_table)
+        self.snapshotter = create_snapshotter(self.hash_table, snapshot_path, snapshot_interval)
+        self.stats = ServerStats(self.hash_table, self.reaper, create_hotkey_tracker(hotkey_sample_rate), 
+                                 SlowLog(slowlog_threshold))
 
 
     def __enter__(self):
@@ -37,9 +118,15 @@ class ThreadedServer:
         for thread in self.thread_manager.threads:
            thread.join()
 
+        self.reaper.stop()
+        if self.snapshotter is not None:
+            self.snapshotter.stop()
         self.sock.close()
 
     def run(self):
+        self.reaper.start()
+        if self.snapshotter is not None:
+            self.snapshotter.start()
         self.sock.listen(ThreadedServer.BACKLOG_SIZE)
         while not self.stop_event.is_set():
             client, address = self.sock.accept()
@@ -55,24 +142,27 @@ class ThreadedServer:
         thread_id = threading.get_ident()
         current_thread = threading.current_thread()
         message = Message(thread_id, client, address, self.hash_table, 
-                          self.client_timeout, self.stop_event)
+                          self.client_timeout, self.stop_event, self.stats, self.max_item_size)
 
         try:
             if self.thread_manager.add_thread(current_thread):
-                print(f"Successfully connected thread {thread_id}")
+                logger.info("Successfully connected thread %d", thread_id)
                 message.process_commands()
             else:
                 raise RuntimeError("Maximum number of threads are currently connected")
         except RuntimeError:
-            print(f"Thread {thread_id} disconnected")
+            logger.info("Thread %d disconnected", thread_id)
+        except ValueError as e:
+            # only input the connection cannot recover from gets here, the rest is answered with errors 
+            logger.warning("Closing connection to %s: %s", address, e)
         
         finally:
-            client.close()
+            message.close()
             removed = self.thread_manager.remove_thread(current_thread)
             if removed:
-                print(f"Successfully stopped thread {thread_id}")
+                logger.debug("Successfully stopped thread %d", thread_id)
             else:
-                print(f"Failed to remove {thread_id} from ThreadManager")
+                logger.warning("Failed to remove %d from ThreadManager", thread_id)
 
 
 class ThreadManager:
@@ -101,3 +191,240 @@ class ThreadManager:
             else:
                 return False 
 
+
+
+class PreforkServer:
+
+    '''Forks worker processes that each run a ThreadedServer or AsyncServer on the same port with 
+    SO_REUSEPORT, so the kernel spreads connections over them and throughput is no longer capped by 
+    a single interpreter's GIL. Every worker serves one SharedHashTable created before the fork'''
+
+    def __init__(self, host, port, workers, max_threads, client_timeout=DEFAULT_TIMEOUT, 
+                 shards=SharedHashTable.DEFAULT_SHARDS, memory_limit=64 * 1024 * 1024, 
+                 value_size=SharedHashTable.DEFAULT_VALUE_SIZE, engine="threaded", restore_path=None, 
+                 snapshot_path=None, snapshot_interval=Snapshotter.DEFAULT_INTERVAL, 
+                 max_item_size=Message.MAX_ITEM_SIZE, hotkey_sample_rate=HotKeyTracker.DEFAULT_SAMPLE_RATE, 
+                 slowlog_threshold=SlowLog.DEFAULT_THRESHOLD):
+        self.host = host
+        self.port = port
+        self.max_item_size = max_item_size
+        self.hotkey_sample_rate = hotkey_sample_rate
+        self.slowlog_threshold = slowlog_threshold
+        self.workers = workers
+        self.max_threads = max_threads
+        self.client_timeout = client_timeout
+        self.engine = engine
+        self.hash_table = SharedHashTable(memory_limit, shards, value_size)
+        if restore_path is not None and os.path.exists(restore_path):
+            restore_snapshot(self.hash_table, restore_path)
+        # the parent process dumps the shared table while the workers serve it 
+        self.snapshotter = create_snapshotter(self.hash_table, snapshot_path, snapshot_interval)
+        self.processes = []
+
+    def __enter__(self):
+        return self 
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        if self.snapshotter is not None:
+            self.snapshotter.stop()
+        self.hash_table.close()
+        self.hash_table.unlink()
+
+    def run(self):
+        context = multiprocessing.get_context("fork")
+        for index in range(self.workers):
+            process = context.Process(target=self._serve_worker, args=(index,), daemon=True)
+            process.start()
+            self.processes.append(process)
+        # started after forking, since a forked child only inherits the thread that forked it 
+        if self.snapshotter is not None:
+            self.snapshotter.start()
+        # only the parent exits through __exit__ on SIGTERM, stopping the workers; they keep the default action 
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        for process in self.processes:
+            process.join()
+
+    def stop(self):
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    def _serve_worker(self, index):
+        if self.engine == "asyncio":
+            server = AsyncServer(self.host, self.port, client_timeout=self.client_timeout, 
+                                 hash_table=self.hash_table, reuse_port=True, max_item_size=self.max_item_size, 
+                                 hotkey_sample_rate=self.hotkey_sample_rate, slowlog_threshold=self.slowlog_threshold)
+        else:
+            server = ThreadedServer(self.host, self.port, self.max_threads, client_timeout=self.client_timeout, 
+                                    hash_table=self.hash_table, reuse_port=True, max_item_size=self.max_item_size, 
+                                    hotkey_sample_rate=self.hotkey_sample_rate, 
+                                    slowlog_threshold=self.slowlog_threshold)
+        logger.info("Worker %d serving on port %d", index, self.port)
+        with server:
+            server.run()
+
+
+class AsyncServer:
+
+    '''Serves every client from a single asyncio event loop instead of one thread per client'''
+
+    BACKLOG_SIZE = 1024
+    # reaper batches run per event loop callback 
+    SWEEP_BATCHES = 10
+
+    def __init__(self, host, port, hash_capacity=DEFAULT_CACHE_CAPACITY, 
+                 client_timeout=DEFAULT_TIMEOUT, memory_limit=None, table_engine="chained", 
+                 hash_table=None, reuse_port=False, restore_path=None, snapshot_path=None, 
+                 snapshot_interval=Snapshotter.DEFAULT_INTERVAL, max_item_size=Message.MAX_ITEM_SIZE, 
+                 compress_threshold=None, compress_level=Compressor.DEFAULT_LEVEL, 
+                 hotkey_sample_rate=HotKeyTracker.DEFAULT_SAMPLE_RATE, eviction_policy="lru", 
+                 slowlog_threshold=SlowLog.DEFAULT_THRESHOLD):
+        self.host = host
+        self.port = port
+        self.max_item_size = max_item_size
+        self.reuse_port = reuse_port
+        self.stop_event = threading.Event()
+        self.client_timeout = client_timeout
+        if hash_table is None:
+            hash_table = create_hash_table(hash_capacity, memory_limit=memory_limit, table_engine=table_engine, 
+                                           restore_path=restore_path, compress_threshold=compress_threshold, 
+                                           compress_level=compress_level, eviction_policy=eviction_policy, 
+                                           max_item_size=max_item_size)
+        self.hash_table = hash_table
+        self.reaper = ExpiryReaper(self.hash_table)
+        self.snapshotter = create_snapshotter(self.hash_table, snapshot_path, snapshot_interval)
+        self.stats = ServerStats(self.hash_table, self.reaper, create_hotkey_tracker(hotkey_sample_rate), 
+                                 SlowLog(slowlog_threshold))
+
+        self.connections = set()
+        self.loop = None
+        self.server = None
+        self.sweep_handle = None
+
+    def __enter__(self):
+        return self 
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for connection in list(self.connections):
+            connection.close()
+        if self.snapshotter is not None:
+            self.snapshotter.stop()
+
+    def run(self):
+        if self.snapshotter is not None:
+            self.snapshotter.start()
+        asyncio.run(self._serve())
+
+    def stop(self):
+        '''Thread-safe; closes the listening socket and lets run return'''
+        self.stop_event.set()
+        if self.loop is not None and self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await self.loop.create_server(
+            lambda: ClientProtocol(self), self.host, self.port, 
+            backlog=AsyncServer.BACKLOG_SIZE, reuse_address=True, reuse_port=self.reuse_port)
+        self._sweep_expired()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        except asyncio.CancelledError:
+            logger.info("Stop event triggered, closing server")
+        finally:
+            self.sweep_handle.cancel()
+
+    def _sweep_expired(self):
+        # sweeps run on the loop itself, between client callbacks, a few batches at a time so a 
+        # mass expiry does not stall the clients 
+        self.reaper.sweep(AsyncServer.SWEEP_BATCHES)
+        if self.reaper.pending:
+            self.sweep_handle = self.loop.call_soon(self._sweep_expired)
+        else:
+            self.sweep_handle = self.loop.call_later(self.reaper.interval, self._sweep_expired)
+
+
+class ClientProtocol(asyncio.Protocol):
+
+    '''One client connection of an AsyncServer. Acts as the client socket of its Message, so
+    command handling is shared with ThreadedServer while idle connections only cost this object'''
+
+    def __init__(self, server: AsyncServer):
+        self.server = server
+        self.transport = None
+        self.message = None
+        self.timeout_handle = None
+        self.dump_handle = None
+        self.writing_paused = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.set_write_buffer_limits(high=Message.OUTPUT_BUFFER_LIMIT)
+        address = transport.get_extra_info("peername")
+        self.message = Message(None, self, address, self.server.hash_table, 
+                               self.server.client_timeout, self.server.stop_event, self.server.stats, 
+                               self.server.max_item_size)
+        self.server.connections.add(self)
+        self._reset_timeout()
+
+    def data_received(self, data):
+        self._reset_timeout()
+        try:
+            self.message.receive(data)
+        except ValueError as e:
+            logger.warning("Closing connection to %s: %s", self.message.address, e)
+            self.close()
+            return
+        self._schedule_dump()
+
+    def _schedule_dump(self):
+        # a metadump sends a batch per loop iteration, so other clients are served in between 
+        if self.message.is_dumping() and not self.writing_paused and self.dump_handle is None:
+            self.dump_handle = self.server.loop.call_soon(self._resume_dump)
+
+    def _resume_dump(self):
+        self.dump_handle = None
+        if self.transport.is_closing():
+            return
+        self._reset_timeout()
+        try:
+            self.message.resume()
+        except ValueError as e:
+            logger.warning("Closing connection to %s: %s", self.message.address, e)
+            self.close()
+            return
+        self._schedule_dump()
+
+    def connection_lost(self, exc):
+        if self.timeout_handle is not None:
+            self.timeout_handle.cancel()
+        if self.dump_handle is not None:
+            self.dump_handle.cancel()
+        self.message.close()
+        self.server.connections.discard(self)
+
+    def sendmsg(self, buffers: list[bytes]) -> int:
+        # the transport accepts everything and buffers what the socket cannot take yet 
+        self.transport.writelines(buffers)
+        return sum(len(buffer) for buffer in buffers)
+
+    def pause_writing(self):
+        # the client is not reading its responses, so stop reading its requests until it catches up 
+        self.writing_paused = True
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.writing_paused = False
+        self.transport.resume_reading()
+        self._schedule_dump()
+
+    def close(self):
+        self.transport.close()
+
+    def _reset_timeout(self):
+        if self.timeout_handle is not None:
+            self.timeout_handle.cancel()
+        self.timeout_handle = self.server.loop.call_later(self.server.client_timeout, self.close)
@@ -0,0 +1,413 @@
+import multiprocessing
+import struct
+from multiprocessing import shared_memory
+
+from memcached.hash_table import (HashTable, BaseShardedTable, Node, Command, Response, combine_values, parse_counter, 
+                                  apply_delta)
+from memcached.expiry import ServerClock, server_clock
+from memcached.chunks import value_buffers
+
+
+# slot states
+EMPTY = 0
+USED = 1
+DELETED = 2
+
+# state, referenced bit, key length, byte count, client flag, expiry, cas unique, key hash and
+# the server clock time of the last store or hit
+SLOT_HEADER = struct.Struct("=BBHIIqQqI")
+LAST_ACCESS = struct.Struct("=I")
+LAST_ACCESS_OFFSET = 36
+EXPIRY = struct.Struct("=q")
+EXPIRY_OFFSET = 12
+MAX_KEY_LENGTH = 250
+
+# counters kept in front of each shard's slots, so every process sees the same values. FLUSHED is
+# the cas unique up to which items are flushed and FLUSH_AT the clock time of a pending delayed
+# flush_all, 0 if there is none
+SIZE, TOMBSTONES, MEMORY_USED, EVICTIONS, CAS_COUNTER, CLOCK_HAND, REAP_CURSOR, FLUSHED, FLUSH_AT = range(9)
+HEADER_FIELDS = 9
+HEADER_SIZE = HEADER_FIELDS * 8
+
+
+class SharedTableShard:
+
+    '''One lock-guarded region of a SharedHashTable: a fixed number of fixed-size slots probed
+    linearly, preceded by the shard's counters. Items are evicted by CLOCK (second chance) instead
+    of a recency list, so a hit only sets the slot's referenced bit rather than relinking items in
+    shared memory. Deleted slots become tombstones until the region is compacted. flush_all is
+    recorded in the shard's counters as in Generations, so it applies to every process; there is
+    no room there for per-namespace generations, so namespaces cannot be flushed'''
+
+    # live items per slot before inserts evict, and live items plus tombstones before compaction
+    MAX_LOAD = 0.75
+    MAX_FILL = 0.9
+    # values are stored as they are, since a slot is sized for the largest value anyway 
+    compressor = None
+
+    def __init__(self, buffer: memoryview, offset: int, capacity: int, value_size: int, lock,
+                 memory_limit: int | None = None, clock: ServerClock = server_clock):
+        self.buffer = buffer
+        self.header = buffer[offset:offset + HEADER_SIZE].cast('q')
+        self.slots_offset = offset + HEADER_SIZE
+        self.capacity = capacity
+        self.value_size = value_size
+        self.slot_size = SLOT_HEADER.size + MAX_KEY_LENGTH + value_size
+        self.lock = lock
+        self.memory_limit = memory_limit
+        self.clock = clock
+
+    def _slot_offset(self, slot: int) -> int:
+        return self.slots_offset + slot * self.slot_size
+
+    def _lookup(self, key: bytes, key_hash: int) -> tuple[int, bool]:
+        '''Returns (slot, found). If key is absent, slot is where it should be inserted,
+        preferring the first tombstone on its probe sequence'''
+        slot = key_hash % self.capacity
+        insert_slot = None
+        while True:
+            offset = self._slot_offset(slot)
+            state = self.buffer[offset]
+            if state == EMPTY:
+                return (slot if insert_slot is None else insert_slot), False
+            if state == DELETED:
+                if insert_slot is None:
+                    insert_slot = slot
+            else:
+                _, _, key_length, _, _, _, _, slot_hash, _ = SLOT_HEADER.unpack_from(self.buffer, offset)
+                key_offset = offset + SLOT_HEADER.size
+                if slot_hash == key_hash and self.buffer[key_offset:key_offset + key_length] == key:
+                    return slot, True
+            slot = (slot + 1) % self.capacity
+
+    def _item_size(self, slot: int) -> int:
+        _, _, key_length, byte_count, _, _, _, _, _ = SLOT_HEADER.unpack_from(self.buffer, self._slot_offset(slot))
+        return key_length + byte_count + Node.ITEM_OVERHEAD
+
+    def _write_slot(self, slot: int, key: bytes, key_hash: int, value: bytes, flag: int,
+                    byte_count: int, expiry: int) -> None:
+        if self.header[FLUSH_AT] and self.header[FLUSH_AT] <= self.clock.current_time:
+            self.flush()
+        self.header[CAS_COUNTER] += 1
+        offset = self._slot_offset(slot)
+        SLOT_HEADER.pack_into(self.buffer, offset, USED, 0, len(key), byte_count, flag, expiry,
+                              self.header[CAS_COUNTER], key_hash, self.clock.current_time)
+        key_offset = offset + SLOT_HEADER.size
+        self.buffer[key_offset:key_offset + len(key)] = key
+        value_offset = key_offset + MAX_KEY_LENGTH
+        for buffer in value_buffers(value):
+            self.buffer[value_offset:value_offset + len(buffer)] = buffer
+            value_offset += len(buffer)
+
+    def _remove_slot(self, slot: int) -> None:
+        self.header[MEMORY_USED] -= self._item_size(slot)
+        self.buffer[self._slot_offset(slot)] = DELETED
+        self.header[SIZE] -= 1
+        self.header[TOMBSTONES] += 1
+
+    def _evict_one(self, protected_slot: int | None = None) -> bool:
+        '''Advances the clock hand, giving referenced items a second chance, and evicts the first
+        unreferenced item. Returns False if nothing but protected_slot could be evicted'''
+        hand = self.header[CLOCK_HAND]
+        for _ in range(2 * self.capacity):
+            slot, hand = hand, (hand + 1) % self.capacity
+            offset = self._slot_offset(slot)
+            if self.buffer[offset] != USED or slot == protected_slot:
+                continue
+            if self.buffer[offset + 1]:
+                self.buffer[offset + 1] = 0
+                continue
+            self._remove_slot(slot)
+            self.header[EVICTIONS] += 1
+            self.header[CLOCK_HAND] = hand
+            return True
+        self.header[CLOCK_HAND] = hand
+        return False
+
+    def _over_limit(self, incoming_size: int) -> bool:
+        return self.memory_limit is not None and self.header[MEMORY_USED] + incoming_size > self.memory_limit
+
+    def _is_flushed(self, cas: int) -> bool:
+        '''See Generations.is_flushed'''
+        if cas <= self.header[FLUSHED]:
+            return True
+        return 0 < self.header[FLUSH_AT] <= self.clock.current_time
+
+    def _is_stale(self, slot: int) -> bool:
+        '''Whether the item in slot has expired or been flushed, either way to be treated as absent'''
+        _, _, _, _, _, expiry, cas, _, _ = SLOT_HEADER.unpack_from(self.buffer, self._slot_offset(slot))
+        return self.clock.is_expired(expiry) or self._is_flushed(cas)
+
+    def _find_live(self, encoded_key: bytes, key_hash: int) -> tuple[int, bool]:
+        '''_lookup that removes the item it finds if it has expired or been flushed'''
+        slot, found = self._lookup(encoded_key, key_hash)
+        if found and self._is_stale(slot):
+            self._remove_slot(slot)
+            found = False
+        return slot, found
+
+    def insert(self, key, value, flag: int, byte_count: int, time_to_expiry: int, method: Command, 
+               cas_unique: int | None = None):
+        '''See HashTable.insert'''
+        add_to_cache, expiry = self.clock.get_expiry_time(time_to_expiry)
+        if not add_to_cache:
+            return Response.NOT_STORED.value
+
+        encoded_key = key.encode("utf-8", "surrogateescape")
+        if len(encoded_key) > MAX_KEY_LENGTH:
+            return Response.NOT_STORED.value
+
+        key_hash = HashTable._hash_key(key)
+        slot, found = self._find_live(encoded_key, key_hash)
+        if found and method in (Command.APPEND, Command.PREPEND):
+            old_value, flag, old_byte_count, _, expiry = self._read_item(slot)
+            value = combine_values(method, old_value, value)
+            byte_count += old_byte_count
+
+        new_size = len(encoded_key) + byte_count + Node.ITEM_OVERHEAD
+        if byte_count > self.value_size or (self.memory_limit is not None and new_size > self.memory_limit):
+            return Response.NOT_STORED.value
+
+        if found:
+            if method == Command.ADD:
+                return Response.NOT_STORED.value
+            if method == Command.CAS and self._read_item(slot)[3] != cas_unique:
+                return Response.EXISTS.value
+            old_size = self._item_size(slot)
+            while self._over_limit(new_size - old_size) and self._evict_one(protected_slot=slot):
+                pass
+            self._write_slot(slot, encoded_key, key_hash, value, flag, byte_count, expiry)
+            self.header[MEMORY_USED] += new_size - old_size
+            return Response.STORED.value
+
+        if method == Command.CAS:
+            return Response.NOT_FOUND.value
+        if method in (Command.REPLACE, Command.APPEND, Command.PREPEND):
+            return Response.NOT_STORED.value
+
+        while ((self.header[SIZE] + 1 > self.capacity * SharedTableShard.MAX_LOAD or self._over_limit(new_size))
+               and self._evict_one()):
+            pass
+        if self.buffer[self._slot_offset(slot)] == DELETED:
+            self.header[TOMBSTONES] -= 1
+        self._write_slot(slot, encoded_key, key_hash, value, flag, byte_count, expiry)
+        self.header[SIZE] += 1
+        self.header[MEMORY_USED] += new_size
+        if self.header[SIZE] + self.header[TOMBSTONES] > self.capacity * SharedTableShard.MAX_FILL:
+            self.compact()
+        return Response.STORED.value
+
+    def _read_item(self, slot: int) -> tuple:
+        '''Returns (value, flag, byte_count, cas, expiry) of the item in slot'''
+        offset = self._slot_offset(slot)
+        _, _, _, byte_count, flag, expiry, cas, _, _ = SLOT_HEADER.unpack_from(self.buffer, offset)
+        value_offset = offset + SLOT_HEADER.size + MAX_KEY_LENGTH
+        return bytes(self.buffer[value_offset:value_offset + byte_count]), flag, byte_count, cas, expiry
+
+    def increment(self, key, delta: int, decrement: bool = False) -> int | str:
+        '''See HashTable.increment'''
+        encoded_key = key.encode("utf-8", "surrogateescape")
+        if len(encoded_key) > MAX_KEY_LENGTH:
+            return Response.NOT_FOUND.value
+        key_hash = HashTable._hash_key(key)
+        slot, found = self._find_live(encoded_key, key_hash)
+        if not found:
+            return Response.NOT_FOUND.value
+
+        old_value, flag, byte_count, _, expiry = self._read_item(slot)
+        number = parse_counter(old_value)
+        if number is None:
+            return Response.NON_NUMERIC.value
+        number = apply_delta(number, delta, decrement)
+        value = b"%d" % number
+        self._write_slot(slot, encoded_key, key_hash, value, flag, len(value), expiry)
+        self.header[MEMORY_USED] += len(value) - byte_count
+        self.buffer[self._slot_offset(slot) + 1] = 1
+        return number
+
+    def get(self, key, with_cas: bool = False):
+        item = self.get_item(key)
+        if item is None:
+            return None
+        return item[:4] if with_cas else item[:3]
+
+    def get_item(self, key):
+        '''Returns (value, flag, byte_count, cas, expiry) and marks the item as referenced'''
+        encoded_key = key.encode("utf-8", "surrogateescape")
+        if len(encoded_key) > MAX_KEY_LENGTH:
+            return None
+        slot, found = self._find_live(encoded_key, HashTable._hash_key(key))
+        if not found:
+            return None
+        offset = self._slot_offset(slot)
+        self.buffer[offset + 1] = 1
+        LAST_ACCESS.pack_into(self.buffer, offset + LAST_ACCESS_OFFSET, self.clock.current_time)
+        return self._read_item(slot)
+
+    def touch(self, key, time_to_expiry: int, with_value: bool = False):
+        '''See HashTable.touch; marks the item as referenced'''
+        encoded_key = key.encode("utf-8", "surrogateescape")
+        if len(encoded_key) > MAX_KEY_LENGTH:
+            return None
+        slot, found = self._find_live(encoded_key, HashTable._hash_key(key))
+        if not found:
+            return None
+        offset = self._slot_offset(slot)
+        _, _, _, byte_count, flag, expiry, cas, _, _ = SLOT_HEADER.unpack_from(self.buffer, offset)
+        value = self._read_item(slot)[0] if with_value else None
+        keep, new_expiry = self.clock.get_expiry_time(time_to_expiry)
+        if not keep:
+            self._remove_slot(slot)
+            return value, flag, byte_count, cas, expiry
+        EXPIRY.pack_into(self.buffer, offset + EXPIRY_OFFSET, new_expiry)
+        self.buffer[offset + 1] = 1
+        LAST_ACCESS.pack_into(self.buffer, offset + LAST_ACCESS_OFFSET, self.clock.current_time)
+        return value, flag, byte_count, cas, new_expiry
+
+    def delete(self, key):
+        '''See HashTable.delete'''
+        encoded_key = key.encode("utf-8", "surrogateescape")
+        if len(encoded_key) > MAX_KEY_LENGTH:
+            return Response.END.value
+        slot, found = self._lookup(encoded_key, HashTable._hash_key(key))
+        if not found:
+            return Response.END.value
+        stale = self._is_stale(slot)
+        self._remove_slot(slot)
+        return Response.NOT_FOUND.value if stale else Response.DELETED.value
+
+    def flush(self, delay: int = 0) -> None:
+        '''See HashTable.flush'''
+        if delay > 0:
+            self.header[FLUSH_AT] = self.clock.current_time + delay
+        else:
+            self.header[FLUSHED] = self.header[CAS_COUNTER]
+            self.header[FLUSH_AT] = 0
+
+    def flush_namespace(self, namespace: str) -> None:
+        raise NotImplementedError("namespaces not supported with shared memory")
+
+    def compact(self) -> None:
+        '''Reinserts every live item into a cleared region, dropping the tombstones that make
+        probes for absent keys long'''
+        items = []
+        for slot in range(self.capacity):
+            offset = self._slot_offset(slot)
+            if self.buffer[offset] == USED:
+                items.append(bytes(self.buffer[offset:offset + self.slot_size]))
+            self.buffer[offset] = EMPTY
+
+        for item in items:
+            slot = SLOT_HEADER.unpack_from(item)[7] % self.capacity
+            while self.buffer[self._slot_offset(slot)] != EMPTY:
+                slot = (slot + 1) % self.capacity
+            offset = self._slot_offset(slot)
+            self.buffer[offset:offset + self.slot_size] = item
+        self.header[TOMBSTONES] = 0
+
+    def get_shard(self, key) -> "SharedTableShard":
+        return self
+
+    def get_shards(self) -> list["SharedTableShard"]:
+        return [self]
+
+    def get_size(self) -> int:
+        return self.header[SIZE]
+
+    def get_capacity(self) -> int:
+        return self.capacity
+
+    def get_memory_used(self) -> int:
+        return self.header[MEMORY_USED]
+
+    def get_evictions(self) -> int:
+        return self.header[EVICTIONS]
+
+    def reap_expired(self, max_entries: int) -> tuple[int, int, bool]:
+        '''Examines the next max_entries slots after the shard's reap cursor, removing expired
+        and flushed items. There is no expiry heap in shared memory, so a sweep scans the region; the cursor is
+        shared, so workers sweeping at the same time split the work. Returns (items reclaimed,
+        bytes reclaimed, whether the scan has not reached the end of the region yet)'''
+        start = self.header[REAP_CURSOR]
+        end = min(start + max_entries, self.capacity)
+        items, byte_count = 0, 0
+        for slot in range(start, end):
+            offset = self._slot_offset(slot)
+            if self.buffer[offset] == USED and self._is_stale(slot):
+                byte_count += self._item_size(slot)
+                items += 1
+                self._remove_slot(slot)
+
+        self.header[REAP_CURSOR] = end % self.capacity
+        return items, byte_count, end < self.capacity
+
+    def scan(self, cursor: int, count: int, metadata: bool = False) -> tuple[int, list[tuple]]:
+        '''See HashTable.scan; the cursor is a slot number. A compaction between calls moves items 
+        between slots, so a scan spanning one may skip or repeat some items'''
+        end = min(cursor + count, self.capacity)
+        items = []
+        for slot in range(cursor, end):
+            offset = self._slot_offset(slot)
+            if self.buffer[offset] != USED:
+                continue
+            header = SLOT_HEADER.unpack_from(self.buffer, offset)
+            _, _, key_length, byte_count, flag, expiry, cas, _, last_access = header
+            if self.clock.is_expired(expiry) or self._is_flushed(cas):
+                self._remove_slot(slot)
+                continue
+            key_offset = offset + SLOT_HEADER.size
+            value_offset = key_offset + MAX_KEY_LENGTH
+            key = bytes(self.buffer[key_offset:key_offset + key_length]).decode("utf-8", "surrogateescape")
+            if metadata:
+                items.append((key, key_length + byte_count + Node.ITEM_OVERHEAD, expiry, last_access, cas))
+            else:
+                items.append((key, bytes(self.buffer[value_offset:value_offset + byte_count]), flag, byte_count, 
+                              expiry))
+        return (end if end < self.capacity else 0), items
+
+    def get_size_histogram(self, bucket_size: int) -> dict[int, int]:
+        '''Counts items by memory size rounded up to a multiple of bucket_size'''
+        histogram = {}
+        for slot in range(self.capacity):
+            if self.buffer[self._slot_offset(slot)] == USED:
+                bucket = -(-self._item_size(slot) // bucket_size) * bucket_size
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+        return histogram
+
+    def release(self) -> None:
+        self.header.release()
+
+
+class SharedHashTable(BaseShardedTable):
+
+    '''Hash table living in a multiprocessing.shared_memory segment, so processes forked after it
+    is created all serve the same items. The segment is split into shards of fixed-size slots, each
+    guarded by a process-shared lock; memory_limit sizes the whole segment and values longer than
+    value_size bytes are not stored. Slots are found with the str hash, which forked processes
+    share because they inherit the parent's hash secret'''
+
+    DEFAULT_SHARDS = 64
+    DEFAULT_VALUE_SIZE = 1024
+
+    def __init__(self, memory_limit: int, num_shards: int = DEFAULT_SHARDS,
+                 value_size: int = DEFAULT_VALUE_SIZE, clock: ServerClock = server_clock):
+        if num_shards < 1:
+            raise ValueError("Must have at least one shard")
+        slot_size = SLOT_HEADER.size + MAX_KEY_LENGTH + value_size
+        shard_capacity = max(4, memory_limit // num_shards // slot_size)
+        region_size = HEADER_SIZE + shard_capacity * slot_size
+
+        # new segments are zero filled, so every slot starts EMPTY and every counter at 0
+        self.memory = shared_memory.SharedMemory(create=True, size=region_size * num_shards)
+        self.shards = [SharedTableShard(self.memory.buf, index * region_size, shard_capacity, value_size,
+                                        multiprocessing.Lock(), memory_limit // num_shards, clock)
+                       for index in range(num_shards)]
+
+    def close(self) -> None:
+        '''Detaches this process from the segment; the creator should also call unlink'''
+        for shard in self.shards:
+            shard.release()
+        self.memory.close()
+
+    def unlink(self) -> None:
+        self.memory.unlink()
@@ -0,0 +1,435 @@
+import struct
+from array import array
+
+from memcached.hash_table import BaseTable, Command, Response, combine_values, parse_counter, apply_delta
+from memcached.expiry import ServerClock, server_clock
+from memcached.compression import Compressor, CompressedValue
+from memcached.chunks import value_buffers
+from memcached.slabs import SlabAllocator, NO_CHUNK
+
+
+# markers stored in the index array in place of a chunk
+EMPTY = -1
+DELETED = -2
+
+# chunk states
+FREE = 0
+USED = 1
+
+# prev and next chunk in the class's recency list, key hash, cas, expiry, stored value length,
+# client byte count, client flag, key length, state, whether the value is compressed and the
+# server clock time of the last store or hit
+ITEM_HEADER = struct.Struct("=qqqQqIIIHBBI")
+LINK = struct.Struct("=q")
+PREV_OFFSET = 0
+NEXT_OFFSET = 8
+KEY_LENGTH = struct.Struct("=H")
+EXPIRY = struct.Struct("=q")
+EXPIRY_OFFSET = 32
+KEY_LENGTH_OFFSET = 52
+STATE_OFFSET = 54
+LAST_ACCESS = struct.Struct("=I")
+LAST_ACCESS_OFFSET = 56
+# memcached's key limit, which the largest size class leaves room for besides the largest value
+MAX_KEY_LENGTH = 250
+
+
+class SlabHashTable(BaseTable):
+
+    '''Alternative to HashTable that keeps items out of the Python heap. Each item is packed as a
+    header, key and value into a chunk of a SlabAllocator arena, and the table itself is an
+    open-addressing index of chunk offsets with their key hashes, probed linearly as in
+    CompactHashTable. Memory is the arena's pages, allocated up to the memory limit and never
+    returned, so usage is predictable however much items churn.
+
+    As in memcached, every size class has its own recency list, threaded through the item headers,
+    and an item that does not fit evicts the least recently used items of its own class. A class
+    without items to evict once every page is taken reclaims a page from the class with the most
+    pages instead, evicting the items on the page holding that class's least recently used item,
+    so a new item size is never refused for good. Updates are written in place when the item stays
+    in the same class and moved to a new chunk otherwise. Given max_item_size, pages are made large 
+    enough for the largest class to hold a value of that size'''
+
+    MAX_LOAD = 0.5
+
+    def __init__(self, capacity: int, memory_limit: int | None = None, clock: ServerClock = server_clock,
+                 compress_threshold: int | None = None, compress_level: int = Compressor.DEFAULT_LEVEL,
+                 page_size: int = SlabAllocator.PAGE_SIZE, growth_factor: float = SlabAllocator.GROWTH_FACTOR,
+                 max_item_size: int | None = None):
+        super().__init__(capacity, memory_limit, clock, compress_threshold, compress_level)
+        self.tombstones = 0
+        self.indices = array('q', [EMPTY]) * capacity
+        self.hashes = array('q', [0]) * capacity
+
+        if max_item_size is not None:
+            largest_item = ITEM_HEADER.size + MAX_KEY_LENGTH + max_item_size
+            page_size = max(page_size, -(-largest_item // SlabAllocator.ALIGNMENT) * SlabAllocator.ALIGNMENT)
+        max_pages = max(1, memory_limit // page_size) if memory_limit is not None else None
+        self.slabs = SlabAllocator(max_pages, page_size, growth_factor=growth_factor)
+        self.lru_heads = [NO_CHUNK] * len(self.slabs.chunk_sizes)
+        self.lru_tails = [NO_CHUNK] * len(self.slabs.chunk_sizes)
+
+    def _read_header(self, chunk: int) -> tuple:
+        page, offset = self.slabs.get_view(chunk)
+        return ITEM_HEADER.unpack_from(page, offset)
+
+    def _read_key(self, chunk: int) -> memoryview:
+        page, offset = self.slabs.get_view(chunk)
+        key_offset = offset + ITEM_HEADER.size
+        return page[key_offset:key_offset + KEY_LENGTH.unpack_from(page, offset + KEY_LENGTH_OFFSET)[0]]
+
+    def _read_value(self, chunk: int) -> bytes:
+        page, offset = self.slabs.get_view(chunk)
+        _, _, _, _, _, value_length, _, _, key_length, _, compressed, _ = ITEM_HEADER.unpack_from(page, offset)
+        value_offset = offset + ITEM_HEADER.size + key_length
+        value = bytes(page[value_offset:value_offset + value_length])
+        return self.compressor.decompress(CompressedValue(value)) if compressed else value
+
+    def _item_size(self, chunk: int) -> int:
+        header = self._read_header(chunk)
+        return ITEM_HEADER.size + header[8] + header[5]
+
+    def _lookup(self, key: bytes, key_hash: int) -> tuple[int, int]:
+        '''Returns (slot, chunk) for key. If key is absent chunk is EMPTY and slot is where it
+        should be inserted, preferring the first tombstone on its probe sequence'''
+        slot = key_hash % self.capacity
+        insert_slot = None
+        while True:
+            chunk = self.indices[slot]
+            if chunk == EMPTY:
+                return (slot if insert_slot is None else insert_slot), EMPTY
+            if chunk == DELETED:
+                if insert_slot is None:
+                    insert_slot = slot
+            elif self.hashes[slot] == key_hash and self._read_key(chunk) == key:
+                return slot, chunk
+            slot = (slot + 1) % self.capacity
+
+    def _find_live(self, key: bytes, key_hash: int) -> tuple[int, int]:
+        '''_lookup that removes the item it finds if it has expired or been flushed'''
+        slot, chunk = self._lookup(key, key_hash)
+        if chunk != EMPTY and self._is_stale(chunk, self._read_header(chunk)):
+            self._remove_item(slot, chunk)
+            chunk = EMPTY
+        return slot, chunk
+
+    def _get_link(self, chunk: int, link_offset: int) -> int:
+        page, offset = self.slabs.get_view(chunk)
+        return LINK.unpack_from(page, offset + link_offset)[0]
+
+    def _set_link(self, chunk: int, link_offset: int, linked: int) -> None:
+        page, offset = self.slabs.get_view(chunk)
+        LINK.pack_into(page, offset + link_offset, linked)
+
+    def _lru_push_front(self, chunk: int) -> None:
+        size_class = self.slabs.get_chunk_class(chunk)
+        head = self.lru_heads[size_class]
+        self._set_link(chunk, PREV_OFFSET, NO_CHUNK)
+        self._set_link(chunk, NEXT_OFFSET, head)
+        if head != NO_CHUNK:
+            self._set_link(head, PREV_OFFSET, chunk)
+        self.lru_heads[size_class] = chunk
+        if self.lru_tails[size_class] == NO_CHUNK:
+            self.lru_tails[size_class] = chunk
+
+    def _lru_unlink(self, chunk: int) -> None:
+        size_class = self.slabs.get_chunk_class(chunk)
+        prev, next = self._get_link(chunk, PREV_OFFSET), self._get_link(chunk, NEXT_OFFSET)
+        if prev != NO_CHUNK:
+            self._set_link(prev, NEXT_OFFSET, next)
+        else:
+            self.lru_heads[size_class] = next
+        if next != NO_CHUNK:
+            self._set_link(next, PREV_OFFSET, prev)
+        else:
+            self.lru_tails[size_class] = prev
+
+    def _lru_bump(self, chunk: int) -> None:
+        if self.lru_heads[self.slabs.get_chunk_class(chunk)] != chunk:
+            self._lru_unlink(chunk)
+            self._lru_push_front(chunk)
+
+    def _is_stale(self, chunk: int, header: tuple) -> bool:
+        '''Whether the item has expired or been flushed, either way to be treated as absent. The key
+        is only decoded when there are namespace flushes to check it against'''
+        if self.clock.is_expired(header[4]):
+            return True
+        key = self._decode_key(chunk) if self.generations.namespaces else None
+        return self.generations.is_flushed(key, header[3])
+
+    def _decode_key(self, chunk: int) -> str:
+        return bytes(self._read_key(chunk)).decode("utf-8", "surrogateescape")
+
+    def _free_chunk(self, chunk: int) -> None:
+        page, offset = self.slabs.get_view(chunk)
+        page[offset + STATE_OFFSET] = FREE
+        self.slabs.free(chunk)
+
+    def _remove_item(self, slot: int, chunk: int) -> None:
+        self.memory_used -= self._item_size(chunk)
+        self._lru_unlink(chunk)
+        self._free_chunk(chunk)
+        self.indices[slot] = DELETED
+        self.tombstones += 1
+        self.size -= 1
+
+    def _evict_lru(self, size_class: int) -> bool:
+        '''Evicts the least recently used item of the class; False if the class has none'''
+        victim = self.lru_tails[size_class]
+        if victim == NO_CHUNK:
+            return False
+        slot, _ = self._lookup(bytes(self._read_key(victim)), self._read_header(victim)[2])
+        self._remove_item(slot, victim)
+        self.evictions += 1
+        return True
+
+    def _evict_page(self, size_class: int, protected_chunk: int) -> bool:
+        '''Empties a page of another class and hands it to size_class. The page of protected_chunk,
+        an item being moved to size_class, is left alone. False if no page could be taken'''
+        page_size = self.slabs.page_size
+        classes = sorted(range(len(self.lru_tails)), key=self.slabs.page_classes.count, reverse=True)
+        for victim_class in classes:
+            tail = self.lru_tails[victim_class]
+            if victim_class == size_class or tail == NO_CHUNK or tail // page_size == protected_chunk // page_size:
+                continue
+            page_number = tail // page_size
+            chunk_size = self.slabs.chunk_sizes[victim_class]
+            page = self.slabs.pages[page_number]
+            for offset in range(0, page_size - chunk_size + 1, chunk_size):
+                if page[offset + STATE_OFFSET] == USED:
+                    chunk = page_number * page_size + offset
+                    slot, _ = self._lookup(bytes(self._read_key(chunk)), self._read_header(chunk)[2])
+                    self._remove_item(slot, chunk)
+                    self.evictions += 1
+            self.slabs.reassign(page_number, size_class)
+            return True
+        return False
+
+    def _allocate(self, size_class: int, protected_chunk: int = NO_CHUNK) -> int:
+        while True:
+            chunk = self.slabs.allocate(size_class)
+            if chunk != NO_CHUNK:
+                return chunk
+            if not self._evict_lru(size_class) and not self._evict_page(size_class, protected_chunk):
+                return NO_CHUNK
+
+    def _write_item(self, chunk: int, key: bytes, key_hash: int, value, flag: int, byte_count: int,
+                    expiry: int) -> None:
+        compressed = isinstance(value, CompressedValue)
+        if compressed:
+            value = value.data
+        page, offset = self.slabs.get_view(chunk)
+        ITEM_HEADER.pack_into(page, offset, NO_CHUNK, NO_CHUNK, key_hash, self._next_cas(), expiry, len(value),
+                              byte_count, flag, len(key), USED, compressed, self.clock.current_time)
+        key_offset = offset + ITEM_HEADER.size
+        page[key_offset:key_offset + len(key)] = key
+        value_offset = key_offset + len(key)
+        for buffer in value_buffers(value):
+            page[value_offset:value_offset + len(buffer)] = buffer
+            value_offset += len(buffer)
+
+    def _store(self, slot: int, chunk: int, key: bytes, key_hash: int, value, flag: int, byte_count: int,
+               expiry: int) -> bool:
+        '''Writes an item over the one in chunk, or as a new item if chunk is EMPTY. Returns False
+        if no chunk could be found for it'''
+        value = self._compress(value, byte_count)
+        size_class = self.slabs.get_class(ITEM_HEADER.size + len(key) + len(value))
+        if size_class is None:
+            return False
+
+        if chunk != EMPTY:
+            # take the item out of the recency list so it cannot evict itself
+            self._lru_unlink(chunk)
+        if chunk != EMPTY and self.slabs.get_chunk_class(chunk) == size_class:
+            new_chunk = chunk
+            self.memory_used -= self._item_size(chunk)
+        else:
+            new_chunk = self._allocate(size_class, NO_CHUNK if chunk == EMPTY else chunk)
+            if new_chunk == NO_CHUNK:
+                if chunk != EMPTY:
+                    self._lru_push_front(chunk)
+                return False
+            if chunk != EMPTY:
+                self.memory_used -= self._item_size(chunk)
+                self._free_chunk(chunk)
+                self.indices[slot] = new_chunk
+            else:
+                # evictions leave tombstones, possibly on this key's probe sequence
+                slot, _ = self._lookup(key, key_hash)
+                if self.indices[slot] == DELETED:
+                    self.tombstones -= 1
+                self.indices[slot] = new_chunk
+                self.hashes[slot] = key_hash
+                self.size += 1
+
+        self._write_item(new_chunk, key, key_hash, value, flag, byte_count, expiry)
+        self.memory_used += self._item_size(new_chunk)
+        self._lru_push_front(new_chunk)
+        if chunk == EMPTY:
+            self.check_and_do_resize()
+        return True
+
+    def insert(self, key, value, flag: int, byte_count: int, time_to_expiry: int, method: Command,
+               cas_unique: int | None = None):
+        '''See HashTable.insert'''
+        add_to_cache, expiry = self.clock.get_expiry_time(time_to_expiry)
+        if not add_to_cache:
+            return Response.NOT_STORED.value
+
+        encoded_key = key.encode("utf-8", "surrogateescape")
+        key_hash = self._hash_key(key)
+        slot, chunk = self._find_live(encoded_key, key_hash)
+        if chunk != EMPTY:
+            if method == Command.ADD:
+                return Response.NOT_STORED.value
+            _, _, _, cas, old_expiry, _, old_byte_count, old_flag, _, _, _, _ = self._read_header(chunk)
+            if method == Command.CAS and cas != cas_unique:
+                return Response.EXISTS.value
+            if method in (Command.APPEND, Command.PREPEND):
+                value = combine_values(method, self._read_value(chunk), value)
+                flag, byte_count, expiry = old_flag, old_byte_count + byte_count, old_expiry
+        elif method == Command.CAS:
+            return Response.NOT_FOUND.value
+        elif method in (Command.REPLACE, Command.APPEND, Command.PREPEND):
+            return Response.NOT_STORED.value
+
+        if not self._store(slot, chunk, encoded_key, key_hash, value, flag, byte_count, expiry):
+            return Response.NOT_STORED.value
+        self._schedule_expiry(expiry, key)
+        return Response.STORED.value
+
+    def increment(self, key, delta: int, decrement: bool = False) -> int | str:
+        '''See HashTable.increment'''
+        encoded_key = key.encode("utf-8", "surrogateescape")
+        key_hash = self._hash_key(key)
+        slot, chunk = self._find_live(encoded_key, key_hash)
+        if chunk == EMPTY:
+            return Response.NOT_FOUND.value
+
+        number = parse_counter(self._read_value(chunk))
+        if number is None:
+            return Response.NON_NUMERIC.value
+        number = apply_delta(number, delta, decrement)
+        value = b"%d" % number
+        _, _, _, _, expiry, _, _, flag, _, _, _, _ = self._read_header(chunk)
+        if not self._store(slot, chunk, encoded_key, key_hash, value, flag, len(value), expiry):
+            # the item is still there with its old value 
+            return Response.OUT_OF_MEMORY.value
+        return number
+
+    def get_item(self, key):
+        '''Returns (value, flag, byte_count, cas, expiry) and counts as a use of the item'''
+        slot, chunk = self._lookup(key.encode("utf-8", "surrogateescape"), self._hash_key(key))
+        if chunk == EMPTY:
+            return None
+        header = self._read_header(chunk)
+        _, _, _, cas, expiry, _, byte_count, flag, _, _, _, _ = header
+        if self._is_stale(chunk, header):
+            self._remove_item(slot, chunk)
+            return None
+        self._lru_bump(chunk)
+        page, offset = self.slabs.get_view(chunk)
+        LAST_ACCESS.pack_into(page, offset + LAST_ACCESS_OFFSET, self.clock.current_time)
+        return self._read_value(chunk), flag, byte_count, cas, expiry
+
+    def touch(self, key, time_to_expiry: int, with_value: bool = False):
+        '''See HashTable.touch; the expiry is rewritten in the item's header'''
+        slot, chunk = self._find_live(key.encode("utf-8", "surrogateescape"), self._hash_key(key))
+        if chunk == EMPTY:
+            return None
+        _, _, _, cas, expiry, _, byte_count, flag, _, _, _, _ = self._read_header(chunk)
+        value = self._read_value(chunk) if with_value else None
+        keep, new_expiry = self.clock.get_expiry_time(time_to_expiry)
+        if not keep:
+            self._remove_item(slot, chunk)
+            return value, flag, byte_count, cas, expiry
+        page, offset = self.slabs.get_view(chunk)
+        EXPIRY.pack_into(page, offset + EXPIRY_OFFSET, new_expiry)
+        LAST_ACCESS.pack_into(page, offset + LAST_ACCESS_OFFSET, self.clock.current_time)
+        self._schedule_expiry(new_expiry, key)
+        self._lru_bump(chunk)
+        return value, flag, byte_count, cas, new_expiry
+
+    def delete(self, key):
+        '''See HashTable.delete'''
+        slot, chunk = self._lookup(key.encode("utf-8", "surrogateescape"), self._hash_key(key))
+        if chunk == EMPTY:
+            return Response.END.value
+        stale = self._is_stale(chunk, self._read_header(chunk))
+        self._remove_item(slot, chunk)
+        return Response.NOT_FOUND.value if stale else Response.DELETED.value
+
+    def get_slab_report(self) -> list[dict]:
+        return self.slabs.get_report()
+
+    def _live_chunks(self):
+        return (chunk for chunk in self.indices if chunk >= 0)
+
+    def _reap(self, key, expiry: int) -> int | None:
+        slot, chunk = self._lookup(key.encode("utf-8", "surrogateescape"), self._hash_key(key))
+        if chunk == EMPTY or self._read_header(chunk)[4] != expiry:
+            return None
+        size = self._item_size(chunk)
+        self._remove_item(slot, chunk)
+        return size
+
+    def _expiry_entries(self):
+        for chunk in self._live_chunks():
+            expiry = self._read_header(chunk)[4]
+            if expiry:
+                yield expiry, self._decode_key(chunk)
+
+    def _item_sizes(self):
+        return (self._item_size(chunk) for chunk in self._live_chunks())
+
+    def scan(self, cursor: int, count: int, metadata: bool = False) -> tuple[int, list[tuple]]:
+        '''See HashTable.scan. The cursor is a position in the arena, walked chunk by chunk: items
+        keep their chunk while the index array is rebuilt, so resizes cannot make the scan skip or
+        repeat items, though an item moved to another size class mid-scan may be'''
+        page_size = self.slabs.page_size
+        items = []
+        chunk = cursor
+        for _ in range(count):
+            if chunk >= self.slabs.get_total_memory():
+                return 0, items
+            chunk_size = self.slabs.chunk_sizes[self.slabs.get_chunk_class(chunk)]
+            page, offset = self.slabs.get_view(chunk)
+            if offset + chunk_size > page_size:
+                chunk += page_size - offset
+                continue
+            if page[offset + STATE_OFFSET] == USED:
+                header = self._read_header(chunk)
+                _, _, key_hash, cas, expiry, _, byte_count, flag, _, _, _, last_access = header
+                if self._is_stale(chunk, header):
+                    slot, _ = self._lookup(bytes(self._read_key(chunk)), key_hash)
+                    self._remove_item(slot, chunk)
+                else:
+                    key = self._decode_key(chunk)
+                    if metadata:
+                        items.append((key, self._item_size(chunk), expiry, last_access, cas))
+                    else:
+                        items.append((key, self._read_value(chunk), flag, byte_count, expiry))
+            chunk += chunk_size
+        return (chunk if chunk < self.slabs.get_total_memory() else 0), items
+
+    def check_and_do_resize(self) -> None:
+        if self.size / self.capacity >= SlabHashTable.MAX_LOAD:
+            self.resize(self.capacity * 2)
+        elif (self.size + self.tombstones) / self.capacity >= SlabHashTable.MAX_LOAD:
+            self.resize(self.capacity)
+
+    def resize(self, capacity: int) -> None:
+        '''Rebuilds the index array at the given capacity, dropping tombstones. Items stay in their
+        chunks; only their offsets are reinserted'''
+        old_indices, old_hashes = self.indices, self.hashes
+        self.capacity = capacity
+        self.indices = array('q', [EMPTY]) * capacity
+        self.hashes = array('q', [0]) * capacity
+        self.tombstones = 0
+        for chunk, key_hash in zip(old_indices, old_hashes):
+            if chunk >= 0:
+                slot = key_hash % capacity
+                while self.indices[slot] != EMPTY:
+                    slot = (slot + 1) % capacity
+                self.indices[slot] = chunk
+                self.hashes[slot] = key_hash
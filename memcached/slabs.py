@@ -0,0 +1,150 @@
+import bisect
+import struct
+from array import array
+
+# chunk offsets within the arena: page number times the page size plus the offset in the page
+NO_CHUNK = -1
+
+# a free chunk holds the offset of the next free chunk of its class in its first bytes
+FREE_LINK = struct.Struct("=q")
+
+
+class SlabAllocator:
+
+    '''Arena of fixed-size pages carved into chunks by size class, as in memcached's slabs. Class
+    chunk sizes start at min_chunk and grow by growth_factor up to a whole page. A page is given to
+    one class the first time the class runs out of chunks; freed chunks go on the class's free
+    list, threaded through the free chunks themselves, so the allocator keeps no Python object per
+    chunk. Pages are allocated on demand until max_pages is reached. After that a class that runs
+    out takes over a page none of whose chunks are in use, and reassign lets the table move a page
+    it has emptied, like memcached's slab rebalancer'''
+
+    PAGE_SIZE = 1024 * 1024
+    MIN_CHUNK = 96
+    GROWTH_FACTOR = 1.25
+    # chunk sizes are multiples of this, like memcached's CHUNK_ALIGN_BYTES
+    ALIGNMENT = 8
+
+    def __init__(self, max_pages: int | None = None, page_size: int = PAGE_SIZE, min_chunk: int = MIN_CHUNK,
+                 growth_factor: float = GROWTH_FACTOR):
+        if growth_factor <= 1:
+            raise ValueError("Growth factor must be greater than 1")
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.chunk_sizes = []
+        size = min_chunk
+        while size < page_size:
+            self.chunk_sizes.append(size)
+            size = max(size + SlabAllocator.ALIGNMENT, int(size * growth_factor))
+            size = -(-size // SlabAllocator.ALIGNMENT) * SlabAllocator.ALIGNMENT
+        self.chunk_sizes.append(page_size)
+
+        self.pages = []
+        # size class of each page
+        self.page_classes = []
+        self.free_heads = [NO_CHUNK] * len(self.chunk_sizes)
+        # chunks never handed out yet in the class's newest page, as (next chunk, end of page)
+        self.fresh = [(NO_CHUNK, NO_CHUNK)] * len(self.chunk_sizes)
+        self.used_chunks = [0] * len(self.chunk_sizes)
+        # chunks in use in each page, and how many pages have none
+        self.page_used = array('I')
+        self.empty_pages = 0
+
+    def get_class(self, size: int) -> int | None:
+        '''Returns the smallest size class whose chunks hold size bytes, or None if none do'''
+        size_class = bisect.bisect_left(self.chunk_sizes, size)
+        return size_class if size_class < len(self.chunk_sizes) else None
+
+    def get_chunk_class(self, chunk: int) -> int:
+        return self.page_classes[chunk // self.page_size]
+
+    def get_view(self, chunk: int) -> tuple[memoryview, int]:
+        '''Returns the page holding chunk and the chunk's offset in it'''
+        return self.pages[chunk // self.page_size], chunk % self.page_size
+
+    def allocate(self, size_class: int) -> int:
+        '''Returns a chunk of the class, or NO_CHUNK if the class has none free and no page is left'''
+        chunk = self.free_heads[size_class]
+        if chunk != NO_CHUNK:
+            page, offset = self.get_view(chunk)
+            self.free_heads[size_class] = FREE_LINK.unpack_from(page, offset)[0]
+        else:
+            chunk = self._carve(size_class)
+            if chunk == NO_CHUNK and self.empty_pages:
+                self.reassign(self.page_used.index(0), size_class)
+                chunk = self._carve(size_class)
+            if chunk == NO_CHUNK:
+                return NO_CHUNK
+        self.used_chunks[size_class] += 1
+        page_number = chunk // self.page_size
+        if self.page_used[page_number] == 0:
+            self.empty_pages -= 1
+        self.page_used[page_number] += 1
+        return chunk
+
+    def _carve(self, size_class: int) -> int:
+        chunk, end = self.fresh[size_class]
+        chunk_size = self.chunk_sizes[size_class]
+        if chunk == NO_CHUNK or chunk + chunk_size > end:
+            if self.max_pages is not None and len(self.pages) >= self.max_pages:
+                return NO_CHUNK
+            chunk = len(self.pages) * self.page_size
+            end = chunk + self.page_size
+            self.pages.append(memoryview(bytearray(self.page_size)))
+            self.page_classes.append(size_class)
+            self.page_used.append(0)
+            self.empty_pages += 1
+        self.fresh[size_class] = (chunk + chunk_size, end)
+        return chunk
+
+    def free(self, chunk: int) -> None:
+        size_class = self.get_chunk_class(chunk)
+        page, offset = self.get_view(chunk)
+        FREE_LINK.pack_into(page, offset, self.free_heads[size_class])
+        self.free_heads[size_class] = chunk
+        self.used_chunks[size_class] -= 1
+        page_number = chunk // self.page_size
+        self.page_used[page_number] -= 1
+        if self.page_used[page_number] == 0:
+            self.empty_pages += 1
+
+    def reassign(self, page_number: int, size_class: int) -> None:
+        '''Gives a page with no chunk in use to size_class, whose chunks must have run out. The
+        page's free chunks are dropped from its old class's free list, which is walked once'''
+        if self.page_used[page_number] != 0:
+            raise ValueError("Only a page with no chunk in use can be reassigned")
+        old_class = self.page_classes[page_number]
+        start, end = page_number * self.page_size, (page_number + 1) * self.page_size
+        kept = []
+        chunk = self.free_heads[old_class]
+        while chunk != NO_CHUNK:
+            page, offset = self.get_view(chunk)
+            if not start <= chunk < end:
+                kept.append(chunk)
+            chunk = FREE_LINK.unpack_from(page, offset)[0]
+        self.free_heads[old_class] = NO_CHUNK
+        for chunk in reversed(kept):
+            page, offset = self.get_view(chunk)
+            FREE_LINK.pack_into(page, offset, self.free_heads[old_class])
+            self.free_heads[old_class] = chunk
+        if start <= self.fresh[old_class][0] < end:
+            self.fresh[old_class] = (NO_CHUNK, NO_CHUNK)
+
+        # chunk boundaries move, so stale headers must not look like items to a scan of the page
+        self.pages[page_number][:] = bytes(self.page_size)
+        self.page_classes[page_number] = size_class
+        self.fresh[size_class] = (start, end)
+
+    def get_total_memory(self) -> int:
+        return len(self.pages) * self.page_size
+
+    def get_report(self) -> list[dict]:
+        '''Summarizes every size class that has pages, for stats slabs'''
+        report = []
+        for size_class, chunk_size in enumerate(self.chunk_sizes):
+            pages = self.page_classes.count(size_class)
+            if pages:
+                report.append({"class": size_class, "chunk_size": chunk_size, "total_pages": pages,
+                               "total_chunks": pages * (self.page_size // chunk_size),
+                               "used_chunks": self.used_chunks[size_class]})
+        return report
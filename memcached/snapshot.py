@@ -0,0 +1,141 @@
+import gc
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from memcached.hash_table import Command
+from memcached.expiry import ServerClock, server_clock
+from memcached.chunks import value_buffers
+
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b"MCSNAP01"
+# magic, item count, unix time the snapshot was taken
+FILE_HEADER = struct.Struct("=8sQq")
+# key length, byte count, client flag, expiry in unix seconds (0 = never)
+RECORD_HEADER = struct.Struct("=HIIq")
+
+
+def write_snapshot(hash_table, path: str, batch_size: int = 1000, clock: ServerClock = server_clock) -> int:
+    '''Writes every unexpired item to path and returns how many were written. Each shard's lock is
+    only held while scan copies out one batch of buckets, so clients keep being served during the
+    dump; items changed meanwhile may be written with either their old or new value. The file is
+    written under a temporary name and renamed, so a crash never leaves a truncated snapshot'''
+    clock.tick()
+    temporary_path = f"{path}.tmp"
+    count = 0
+    with open(temporary_path, "wb") as f:
+        f.write(FILE_HEADER.pack(MAGIC, 0, int(time.time())))
+        for shard in hash_table.get_shards():
+            cursor = 0
+            while True:
+                with shard.lock:
+                    cursor, items = shard.scan(cursor, batch_size)
+                for key, value, flag, byte_count, expiry in items:
+                    encoded_key = key.encode("utf-8", "surrogateescape")
+                    f.write(RECORD_HEADER.pack(len(encoded_key), byte_count, flag, clock.to_wall_time(expiry)))
+                    f.write(encoded_key)
+                    f.writelines(value_buffers(value))
+                count += len(items)
+                if cursor == 0:
+                    break
+
+        f.seek(0)
+        f.write(FILE_HEADER.pack(MAGIC, count, int(time.time())))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+    return count
+
+
+def read_item_count(path: str) -> int:
+    '''Returns the number of items in a snapshot, so the table can be sized before restoring'''
+    with open(path, "rb") as f:
+        magic, count, _ = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a snapshot file")
+    return count
+
+
+def restore_snapshot(hash_table, path: str, clock: ServerClock = server_clock) -> int:
+    '''Loads the items of a snapshot into hash_table, skipping those that have expired since it
+    was written, and returns how many were loaded. The file is memory mapped and read in place.
+    Meant for startup, before clients connect, so shards are loaded without taking their locks'''
+    clock.tick()
+    now = time.time()
+    # millions of new items would otherwise trigger collection after collection over the same objects
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        loaded = _load_items(hash_table, path, now)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return loaded
+
+
+def _load_items(hash_table, path: str, now: float) -> int:
+    loaded = 0
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        magic, count, _ = FILE_HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+
+        offset = FILE_HEADER.size
+        for _ in range(count):
+            key_length, byte_count, flag, expiry = RECORD_HEADER.unpack_from(data, offset)
+            key_offset = offset + RECORD_HEADER.size
+            value_offset = key_offset + key_length
+            offset = value_offset + byte_count
+            if expiry and expiry <= now:
+                continue
+
+            key = data[key_offset:value_offset].decode("utf-8", "surrogateescape")
+            time_to_expiry = math.ceil(expiry - now) if expiry else 0
+            hash_table.get_shard(key).insert(key, data[value_offset:offset], flag, byte_count, 
+                                             time_to_expiry, Command.SET)
+            loaded += 1
+
+    logger.info("Restored %d of %d items from %s", loaded, count, path)
+    return loaded
+
+
+class Snapshotter:
+
+    '''Writes a snapshot of the table every interval seconds from a background thread, and a
+    final one when stopped'''
+
+    DEFAULT_INTERVAL = 300.0
+
+    def __init__(self, hash_table, path: str, interval: float = DEFAULT_INTERVAL):
+        self.hash_table = hash_table
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def save(self) -> int:
+        start = time.perf_counter()
+        count = write_snapshot(self.hash_table, self.path)
+        logger.info("Wrote %d items to %s in %.2fs", count, self.path, time.perf_counter() - start)
+        return count
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.save()
+
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            self.save()
@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+
+from memcached.profiling import SlowLog, RequestProfiler
+
+
+# latency buckets are powers of two of microseconds; the last one also holds everything slower
+LATENCY_BUCKETS = 24
+# granularity of the item size histogram, as in memcached's stats sizes
+SIZE_BUCKET = 32
+
+
+class ConnectionStats:
+
+    '''Counters of a single connection. Only the connection's own thread writes them, so counting
+    needs no lock; ServerStats adds up every connection when stats are requested'''
+
+    COUNTERS = ["cmd_get", "cmd_set", "get_hits", "get_misses", "delete_hits", "delete_misses", "incr_hits", 
+                "incr_misses", "decr_hits", "decr_misses", "cas_hits", "cas_misses", "cas_badval", "cmd_flush", 
+                "cmd_touch", "touch_hits", "touch_misses", "lock_wait_ns"]
+
+    def __init__(self):
+        for counter in ConnectionStats.COUNTERS:
+            setattr(self, counter, 0)
+        # command -> counts per latency bucket
+        self.latencies = {}
+
+    def record_latency(self, command: str, elapsed_ns: int) -> None:
+        histogram = self.latencies.get(command)
+        if histogram is None:
+            histogram = self.latencies[command] = [0] * LATENCY_BUCKETS
+        histogram[min((elapsed_ns // 1000).bit_length(), LATENCY_BUCKETS - 1)] += 1
+
+    def merge(self, other: "ConnectionStats") -> None:
+        for counter in ConnectionStats.COUNTERS:
+            setattr(self, counter, getattr(self, counter) + getattr(other, counter))
+        for command, histogram in list(other.latencies.items()):
+            totals = self.latencies.setdefault(command, [0] * LATENCY_BUCKETS)
+            for bucket, count in enumerate(histogram):
+                totals[bucket] += count
+
+
+class TimedLock:
+
+    '''Acquires lock for a with block, charging time spent waiting on a contended lock to
+    stats.lock_wait_ns. Uncontended acquisitions are not timed at all. Works with threading and
+    multiprocessing locks alike, whose acquire arguments differ in name but not in position'''
+
+    __slots__ = ("lock", "stats")
+
+    def __init__(self, lock: threading.Lock, stats: ConnectionStats):
+        self.lock = lock
+        self.stats = stats
+
+    def __enter__(self):
+        if not self.lock.acquire(False):
+            start = time.perf_counter_ns()
+            self.lock.acquire()
+            self.stats.lock_wait_ns += time.perf_counter_ns() - start
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.lock.release()
+
+
+class ServerStats:
+
+    '''Server-wide view for the stats command: connection counters plus what the hash table,
+    expiry reaper, hot key tracker, slow log and profiler track themselves'''
+
+    def __init__(self, hash_table, reaper=None, hotkeys=None, slowlog=None, profiler=None):
+        self.hash_table = hash_table
+        self.reaper = reaper
+        self.hotkeys = hotkeys
+        self.slowlog = slowlog if slowlog is not None else SlowLog()
+        self.profiler = profiler if profiler is not None else RequestProfiler()
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.connections = set()
+        self.closed_connections = ConnectionStats()
+        self.total_connections = 0
+
+    def register(self) -> ConnectionStats:
+        stats = ConnectionStats()
+        with self.lock:
+            self.connections.add(stats)
+            self.total_connections += 1
+        return stats
+
+    def unregister(self, stats: ConnectionStats) -> None:
+        with self.lock:
+            if stats in self.connections:
+                self.connections.remove(stats)
+                self.closed_connections.merge(stats)
+
+    def report(self, group: str | None = None) -> list[tuple[str, object]]:
+        '''Returns (name, value) pairs for stats, stats items, sizes, slabs, hotkeys, slowlog or profile'''
+        if group is None:
+            return self._report_general()
+        if group == "items":
+            return self._report_items()
+        if group == "sizes":
+            return self._report_sizes()
+        if group == "slabs":
+            return self._report_slabs()
+        if group == "hotkeys":
+            return self._report_hotkeys()
+        if group == "slowlog":
+            return self.slowlog.report()
+        if group == "profile":
+            return self.profiler.report()
+        raise ValueError(f"Stats group {group} not supported")
+
+    def _report_general(self) -> list[tuple[str, object]]:
+        totals = ConnectionStats()
+        with self.lock:
+            totals.merge(self.closed_connections)
+            for stats in self.connections:
+                totals.merge(stats)
+            curr_connections, total_connections = len(self.connections), self.total_connections
+
+        shards = self.hash_table.get_shards()
+        report = [
+            ("pid", os.getpid()),
+            ("uptime", int(time.time() - self.started)),
+            ("time", int(time.time())),
+            ("curr_connections", curr_connections),
+            ("total_connections", total_connections),
+        ]
+        report += [(counter, getattr(totals, counter)) for counter in ConnectionStats.COUNTERS
+                   if counter != "lock_wait_ns"]
+        report += [
+            ("lock_wait_time", f"{totals.lock_wait_ns / 1e9:.6f}"),
+            ("curr_items", self.hash_table.get_size()),
+            ("bytes", self.hash_table.get_memory_used()),
+            ("limit_maxbytes", sum(shard.memory_limit or 0 for shard in shards)),
+            ("evictions", self.hash_table.get_evictions()),
+        ]
+        compressors = [shard.compressor for shard in shards if shard.compressor is not None]
+        if compressors:
+            bytes_in = sum(compressor.bytes_in for compressor in compressors)
+            bytes_out = sum(compressor.bytes_out for compressor in compressors)
+            report += [
+                ("compress_threshold", compressors[0].threshold),
+                ("compressions", sum(compressor.compressions for compressor in compressors)),
+                ("compressed_bytes_in", bytes_in),
+                ("compressed_bytes_out", bytes_out),
+                ("compression_ratio", f"{bytes_in / bytes_out if bytes_out else 0:.2f}"),
+                ("compress_time", f"{sum(compressor.compress_ns for compressor in compressors) / 1e9:.6f}"),
+                ("decompress_time", f"{sum(compressor.decompress_ns for compressor in compressors) / 1e9:.6f}"),
+            ]
+        if self.reaper is not None:
+            report += [("reclaimed", self.reaper.reclaimed_items),
+                       ("reclaimed_bytes", self.reaper.reclaimed_bytes)]
+
+        for command, histogram in sorted(totals.latencies.items()):
+            for bucket, count in enumerate(histogram):
+                if count:
+                    report.append((f"latency:{command}:{2 ** bucket}us", count))
+        return report
+
+    def _report_items(self) -> list[tuple[str, object]]:
+        report = []
+        for index, shard in enumerate(self.hash_table.get_shards()):
+            with shard.lock:
+                report += [
+                    (f"items:{index}:number", shard.get_size()),
+                    (f"items:{index}:bytes", shard.get_memory_used()),
+                    (f"items:{index}:evicted", shard.get_evictions()),
+                    (f"items:{index}:capacity", shard.get_capacity()),
+                ]
+        return report
+
+    def _report_sizes(self) -> list[tuple[str, object]]:
+        histogram = {}
+        for shard in self.hash_table.get_shards():
+            with shard.lock:
+                shard_histogram = shard.get_size_histogram(SIZE_BUCKET)
+            for size, count in shard_histogram.items():
+                histogram[size] = histogram.get(size, 0) + count
+        return sorted(histogram.items())
+
+    def _report_slabs(self) -> list[tuple[str, object]]:
+        shards = self.hash_table.get_shards()
+        if not all(hasattr(shard, "get_slab_report") for shard in shards):
+            raise ValueError("Stats group slabs needs the slab table engine")
+        classes = {}
+        for shard in shards:
+            with shard.lock:
+                shard_report = shard.get_slab_report()
+            for size_class in shard_report:
+                totals = classes.setdefault(size_class["class"], dict.fromkeys(size_class, 0))
+                totals.update({name: totals[name] + value for name, value in size_class.items() 
+                               if name in ("total_pages", "total_chunks", "used_chunks")})
+                totals["chunk_size"] = size_class["chunk_size"]
+
+        report = []
+        for size_class, totals in sorted(classes.items()):
+            report += [(f"{size_class}:{name}", value) for name, value in totals.items() if name != "class"]
+        report += [("active_slabs", len(classes)), 
+                   ("total_malloced", sum(shard.slabs.get_total_memory() for shard in shards))]
+        return report
+
+    def _report_hotkeys(self) -> list[tuple[str, object]]:
+        if self.hotkeys is None:
+            raise ValueError("Hot key tracking is disabled")
+        report = [("hotkeys_sample_rate", self.hotkeys.sample_rate), ("hotkeys_sampled", self.hotkeys.sampled)]
+        return report + [(f"hotkey:{key}", count) for key, count in self.hotkeys.report()]
@@ -0,0 +1,130 @@
+from memcached.hash_table import HashTable, Node, Command
+from memcached.hotkeys import CountMinSketch
+from memcached.compression import Compressor
+from memcached.expiry import ServerClock, server_clock
+
+
+class TinyLFUHashTable(HashTable):
+
+    '''HashTable that evicts by W-TinyLFU instead of plain LRU. New items enter a small admission
+    window, a recency list of about WINDOW_SHARE of the items, and move on to the main recency list
+    as the window overflows. When memory runs out while the window is full, the window's least
+    recently used item (the candidate) only displaces the main list's least recently used item
+    (the victim) if a frequency sketch of recent accesses says it is used more often; otherwise the
+    candidate is evicted. A scan of one-off keys thus cycles through the window and leaves the
+    frequently used items in the main list alone.
+
+    Every lookup and store is counted in the sketch, hits or not, and all counts are halved once
+    SAMPLE_FACTOR times the sketch width accesses have been counted, so the frequencies follow
+    changes in the workload'''
+
+    WINDOW_SHARE = 0.01
+    SKETCH_WIDTH = 16384
+    SKETCH_DEPTH = 4
+    SAMPLE_FACTOR = 10
+
+    def __init__(self, capacity: int, memory_limit: int | None = None, clock: ServerClock = server_clock,
+                 compress_threshold: int | None = None, compress_level: int = Compressor.DEFAULT_LEVEL):
+        super().__init__(capacity, memory_limit, clock, compress_threshold, compress_level)
+        self.sketch = CountMinSketch(TinyLFUHashTable.SKETCH_WIDTH, TinyLFUHashTable.SKETCH_DEPTH)
+        self.recorded = 0
+        self.window_head = None
+        self.window_tail = None
+        self.window_size = 0
+
+    def _record(self, key) -> None:
+        self.sketch.add(key)
+        self.recorded += 1
+        if self.recorded >= TinyLFUHashTable.SAMPLE_FACTOR * TinyLFUHashTable.SKETCH_WIDTH:
+            self.sketch.decay()
+            self.recorded //= 2
+
+    def _window_limit(self) -> int:
+        return max(1, int(self.size * TinyLFUHashTable.WINDOW_SHARE))
+
+    def _lru_push_front(self, node: Node) -> None:
+        if not node.in_window:
+            super()._lru_push_front(node)
+            return
+        node.lru_prev = None
+        node.lru_next = self.window_head
+        if self.window_head:
+            self.window_head.lru_prev = node
+        self.window_head = node
+        if self.window_tail is None:
+            self.window_tail = node
+        self.window_size += 1
+
+    def _lru_unlink(self, node: Node) -> None:
+        if not node.in_window:
+            super()._lru_unlink(node)
+            return
+        if node.lru_prev:
+            node.lru_prev.lru_next = node.lru_next
+        else:
+            self.window_head = node.lru_next
+        if node.lru_next:
+            node.lru_next.lru_prev = node.lru_prev
+        else:
+            self.window_tail = node.lru_prev
+        node.lru_prev = node.lru_next = None
+        self.window_size -= 1
+
+    def _lru_bump(self, node: Node) -> None:
+        if node is not (self.window_head if node.in_window else self.lru_head):
+            self._lru_unlink(node)
+            self._lru_push_front(node)
+
+    def _promote(self, node: Node) -> None:
+        '''Moves an item from the window to the front of the main list'''
+        self._lru_unlink(node)
+        node.in_window = False
+        self._lru_push_front(node)
+
+    def _add_node(self, node: Node) -> None:
+        node.in_window = True
+        super()._add_node(node)
+        while self.window_size > self._window_limit():
+            self._promote(self.window_tail)
+
+    def _evict_to_fit(self, incoming_size: int) -> None:
+        if self.memory_limit is None:
+            return
+        while self.memory_used + incoming_size > self.memory_limit:
+            candidate, victim = self.window_tail, self.lru_tail
+            if candidate is None and victim is None:
+                return
+            if victim is None:
+                self._evict(candidate)
+            elif candidate is None or self.window_size < self._window_limit():
+                # the window has room for the incoming item, so nothing has to leave it
+                self._evict(victim)
+            elif self.sketch.estimate(candidate.key) > self.sketch.estimate(victim.key):
+                self._evict(victim)
+                self._promote(candidate)
+            else:
+                self._evict(candidate)
+
+    def _iter_nodes(self):
+        node = self.window_head
+        while node:
+            yield node
+            node = node.lru_next
+        yield from super()._iter_nodes()
+
+    def insert(self, key, value, flag: int, byte_count: int, time_to_expiry: int, method: Command,
+               cas_unique: int | None = None):
+        self._record(key)
+        return super().insert(key, value, flag, byte_count, time_to_expiry, method, cas_unique)
+
+    def increment(self, key, delta: int, decrement: bool = False):
+        self._record(key)
+        return super().increment(key, delta, decrement)
+
+    def get_item(self, key) -> tuple | None:
+        self._record(key)
+        return super().get_item(key)
+
+    def touch(self, key, time_to_expiry: int, with_value: bool = False) -> tuple | None:
+        self._record(key)
+        return super().touch(key, time_to_expiry, with_value)
@@ -0,0 +1,27 @@
+import os
+import socket
+import subprocess
+import time
+
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(__file__), "..", "..", "main.py")
+# a cold start imports every engine, so allow far more than it usually takes 
+STARTUP_TIMEOUT = 30
+
+
+def spawn_server(host, port, *args):
+    '''Runs main.py on host and port and waits until it accepts connections, as 
+    benchmarks/load_generator.spawn_server does'''
+    process = subprocess.Popen(["python", SERVER_SCRIPT, f"--port={port}", f"--host={host}", *args])
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server on port {port} exited with {process.returncode}")
+            time.sleep(0.05)
+    process.terminate()
+    process.wait()
+    raise RuntimeError(f"Server on port {port} did not start listening")
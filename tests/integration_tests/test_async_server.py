@@ -0,0 +1,88 @@
+import socket
+import pytest 
+import os 
+from threading import Thread
+
+from memcached.server import DEFAULT_HOST
+from server_process import spawn_server
+
+
+ASYNC_PORT = 11212
+
+
+@pytest.fixture(scope="module")
+def async_server_process():
+    process = spawn_server(DEFAULT_HOST, ASYNC_PORT, "--engine=asyncio")
+
+    yield process
+
+    process.terminate()
+    process.wait()
+
+
+def send_and_receive(s, message):
+    s.sendall(message.encode("utf-8"))
+    return s.recv(1024).decode("utf-8")
+
+
+def test_async_single_client(async_server_process):
+    with socket.create_connection((DEFAULT_HOST, ASYNC_PORT), timeout=10) as s:
+        assert send_and_receive(s, "set test 0 0 4\r\n1234\r\n") == "STORED\r\n"
+        assert send_and_receive(s, "get test\r\n") == "VALUE test 0 4\r\n1234\r\nEND\r\n"
+        assert send_and_receive(s, "delete test\r\n") == "DELETED\r\n"
+        assert send_and_receive(s, "get test\r\n") == "END\r\n"
+
+
+def test_async_many_concurrent_clients(async_server_process):
+    # far more simultaneous connections than ThreadedServer's max_threads 
+    sockets = [socket.create_connection((DEFAULT_HOST, ASYNC_PORT), timeout=10) for _ in range(200)]
+    errors = []
+
+    def run_client(i, s):
+        try:
+            assert send_and_receive(s, f"set key{i} 0 0 4\r\n{i:04}\r\n") == "STORED\r\n"
+            assert send_and_receive(s, f"get key{i}\r\n") == f"VALUE key{i} 0 4\r\n{i:04}\r\nEND\r\n"
+        except AssertionError as e:
+            errors.append(e)
+
+    threads = [Thread(target=run_client, args=(i, s)) for i, s in enumerate(sockets)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for s in sockets:
+        s.close()
+
+    assert len(errors) == 0
+
+
+def test_async_large_values(async_server_process):
+    value = os.urandom(1024 * 1024)
+    with socket.create_connection((DEFAULT_HOST, ASYNC_PORT), timeout=10) as s:
+        s.sendall(b"set big 0 0 %d\r\n" % len(value) + value + b"\r\nget big\r\n")
+        expected = b"STORED\r\nVALUE big 0 %d\r\n" % len(value) + value + b"\r\nEND\r\n"
+        response = b""
+        while len(response) < len(expected):
+            response += s.recv(65536)
+        assert response == expected
+
+
+def test_async_metadump(async_server_process):
+    with socket.create_connection((DEFAULT_HOST, ASYNC_PORT), timeout=10) as s, \
+         socket.create_connection((DEFAULT_HOST, ASYNC_PORT), timeout=10) as other:
+        s.sendall(b"".join(b"set dump%d 0 0 1 noreply\r\nx\r\n" % i for i in range(3000)) + b"get dump0\r\n")
+        received = b""
+        while not received.endswith(b"END\r\n"):
+            received += s.recv(65536)
+
+        s.sendall(b"lru_crawler metadump all\r\nget dump1\r\n")
+        # the dump is sent in batches, so other clients are answered while it runs 
+        assert send_and_receive(other, "get dump2\r\n") == "VALUE dump2 0 1\r\nx\r\nEND\r\n"
+        received = b""
+        while not received.endswith(b"VALUE dump1 0 1\r\nx\r\nEND\r\n"):
+            received += s.recv(65536)
+
+    lines = received.decode().split("\r\n")
+    dumped = {line.split(" ")[0][len("key="):] for line in lines if line.startswith("key=")}
+    assert {f"dump{i}" for i in range(3000)} <= dumped
+    assert lines.index("END") == len(lines) - 5
@@ -0,0 +1,70 @@
+import pytest 
+from concurrent.futures import ThreadPoolExecutor
+
+from memcached.client import Client
+from server_process import spawn_server
+
+
+CLIENT_PORTS = [11221, 11222, 11223]
+
+
+@pytest.fixture(scope="module")
+def server_processes():
+    processes = [spawn_server("127.0.0.1", port, "--max_threads=20") for port in CLIENT_PORTS]
+
+    yield processes
+
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+
+@pytest.fixture
+def client(server_processes):
+    with Client([f"127.0.0.1:{port}" for port in CLIENT_PORTS], pool_size=4) as client:
+        yield client
+
+
+def test_keys_spread_over_servers(client):
+    keys = [f"spread{i}" for i in range(300)]
+    for key in keys:
+        assert client.set(key, key)
+
+    assert client.get_multi(keys + ["missing"]) == {key: key.encode("utf-8") for key in keys}
+    # every server holds part of the keys, and only the keys the ring gives it 
+    for node, pool in client.pools.items():
+        owned = [key for key in keys if client.ring.get_node(key) == node]
+        assert 0 < len(owned) < len(keys)
+        single = Client([node])
+        assert single.get_multi(keys) == {key: key.encode("utf-8") for key in owned}
+        single.close()
+
+
+def test_store_commands(client):
+    assert client.set("count", "10", expire=100)
+    assert client.incr("count", 5) == 15
+    assert client.decr("count", 20) == 0
+    assert client.incr("missing") is None
+
+    assert not client.add("count", "1")
+    assert client.append("count", b"1") and client.prepend("count", b"9")
+    value, cas = client.gets("count")
+    assert value == b"901"
+    assert client.cas("count", "2", cas)
+    assert not client.cas("count", "3", cas)
+    assert client.get("count") == b"2"
+
+    assert client.delete("count")
+    assert not client.delete("count")
+    assert client.get("count") is None
+
+
+def test_client_shared_between_threads(client):
+    def run(thread):
+        keys = [f"thread{thread}:{i}" for i in range(50)]
+        for key in keys:
+            client.set(key, key)
+        return client.get_multi(keys) == {key: key.encode("utf-8") for key in keys}
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert all(executor.map(run, range(16)))
@@ -1,23 +1,18 @@
 import sys
 import socket
 from threading import Thread
-import subprocess
 import time
 import pytest 
 import os 
 from contextlib import contextmanager
 
 from memcached.server import DEFAULT_HOST, DEFAULT_PORT
+from server_process import spawn_server
 
 
 @pytest.fixture(scope="session")
 def server_process():
-    current_dir = os.path.dirname(__file__)
-    src_path = os.path.join(current_dir, '..', '..')
-    server_script = os.path.join(src_path, "main.py")
-    process = subprocess.Popen(
-        ["python", server_script, f"--port={DEFAULT_PORT}", f"--host={DEFAULT_HOST}"])
-    time.sleep(0.2)
+    process = spawn_server(DEFAULT_HOST, DEFAULT_PORT)
 
     yield server_process
 
@@ -57,7 +52,7 @@ def test_connect_single_client(server_process):
         message = "get test\r\n"
         s.sendall(message.encode("utf-8"))
         response = s.recv(1024)
-        assert response.decode("utf-8") == "VALUE 1234 0 4\r\n"
+        assert response.decode("utf-8") == "VALUE test 0 4\r\n1234\r\nEND\r\n"
 
         message = "delete test\r\n"
         s.sendall(message.encode("utf-8"))
@@ -80,7 +75,7 @@ def test_connect_single_client_with_expiry(server_process):
         assert response.decode("utf-8") == "STORED\r\n"
 
         # value expires after 1 second, should return different things 
-        expected_responses = ["VALUE 1234 0 4\r\n", "END\r\n"]
+        expected_responses = ["VALUE diff 0 4\r\n1234\r\nEND\r\n", "END\r\n"]
         for ind, expected in enumerate(expected_responses):
             message = "get diff\r\n"
             s.sendall(message.encode("utf-8"))
@@ -96,11 +91,11 @@ def test_connect_multiple_client(server_process):
     errors = []
 
     messages1 = ["set test 0 0 4\r\n1234\r\n", "get test\r\n"]
-    expected_responses1 = ["STORED\r\n", "VALUE 1234 0 4\r\n"]
+    expected_responses1 = ["STORED\r\n", "VALUE test 0 4\r\n1234\r\nEND\r\n"]
     thread1 = Thread(target=run_thread_test, args=(messages1, expected_responses1, errors))
     
     messages2 = ["set another 0 0 4\r\n1234\r\n", "get another\r\n"]
-    expected_responses2 = ["STORED\r\n", "VALUE 1234 0 4\r\n"]
+    expected_responses2 = ["STORED\r\n", "VALUE another 0 4\r\n1234\r\nEND\r\n"]
     thread2 = Thread(target=run_thread_test, args=(messages2, expected_responses2, errors))
     
     threads = [thread1, thread2]
@@ -113,7 +108,7 @@ def test_connect_multiple_client(server_process):
         
     # check that different threads can access the same values in the cache 
     messages3 = ["get test\r\n"]
-    expected_responses3 = ["VALUE 1234 0 4\r\n"]
+    expected_responses3 = ["VALUE test 0 4\r\n1234\r\nEND\r\n"]
     thread3 = Thread(target=run_thread_test, args=(messages3, expected_responses3, errors))
 
     thread3.start()
@@ -126,12 +121,12 @@ def test_connect_multiple_clients_complex(server_process):
     errors = []
 
     messages1 = ["set test 0 0 4\r\n1234\r\n", "get test\r\n"]
-    expected_responses1 = ["STORED\r\n", "VALUE 1234 0 4\r\n"]
+    expected_responses1 = ["STORED\r\n", "VALUE test 0 4\r\n1234\r\nEND\r\n"]
     thread1 = Thread(target=run_thread_test, args=(
         messages1, expected_responses1, errors))
 
     messages2 = ["set another 0 0 4\r\n1234\r\n", "get another\r\n"]
-    expected_responses2 = ["STORED\r\n", "VALUE 1234 0 4\r\n"]
+    expected_responses2 = ["STORED\r\n", "VALUE another 0 4\r\n1234\r\nEND\r\n"]
     thread2 = Thread(target=run_thread_test, args=(
         messages2, expected_responses2, errors))
 
@@ -145,7 +140,7 @@ def test_connect_multiple_clients_complex(server_process):
 
     # check that different threads can access the same values in the cache
     messages3 = ["get test\r\n", "replace test 0 0 4\r\n5678\r\n"]
-    expected_responses3 = ["VALUE 1234 0 4\r\n", "STORED\r\n"]
+    expected_responses3 = ["VALUE test 0 4\r\n1234\r\nEND\r\n", "STORED\r\n"]
     thread3 = Thread(target=run_thread_test, args=(
         messages3, expected_responses3, errors))
     
@@ -188,3 +183,35 @@ def test_connect_many_dummy_clients(server_process):
 
 
 
+
+
+def receive_until(s, terminator):
+    response = b""
+    while not response.endswith(terminator):
+        response += s.recv(65536)
+    return response
+
+
+def test_large_values(server_process):
+    value = os.urandom(1024 * 1024)
+    with connect_socket(DEFAULT_HOST, DEFAULT_PORT) as s:
+        s.sendall(b"set big 0 0 %d\r\n" % len(value) + value + b"\r\n")
+        assert receive_until(s, b"\r\n") == b"STORED\r\n"
+        s.sendall(b"get big\r\n")
+        assert receive_until(s, b"END\r\n") == b"VALUE big 0 %d\r\n" % len(value) + value + b"\r\nEND\r\n"
+
+        # values over the 1 MB default item size are refused 
+        s.sendall(b"set bigger 0 0 %d\r\n" % (len(value) + 1) + value + b"!\r\n")
+        assert receive_until(s, b"\r\n") == b"SERVER_ERROR object too large for cache\r\n"
+
+
+def test_bad_commands_keep_connection(server_process):
+    with connect_socket(DEFAULT_HOST, DEFAULT_PORT) as s:
+        s.sendall(b"slowlog -5\r\n")
+        assert receive_until(s, b"\r\n") == b"CLIENT_ERROR Slow log threshold must be non-negative\r\n"
+        s.sendall(b"stats foo\r\n")
+        assert receive_until(s, b"\r\n") == b"CLIENT_ERROR Stats group foo not supported\r\n"
+        s.sendall(b"bogus\r\n")
+        assert receive_until(s, b"\r\n") == b"ERROR\r\n"
+        s.sendall(b"set ok 0 0 1\r\n1\r\nget ok\r\n")
+        assert receive_until(s, b"END\r\n") == b"STORED\r\nVALUE ok 0 1\r\n1\r\nEND\r\n"
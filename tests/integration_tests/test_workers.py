@@ -0,0 +1,38 @@
+import socket
+import pytest 
+
+from memcached.server import DEFAULT_HOST
+from server_process import spawn_server
+
+
+WORKERS_PORT = 11213
+
+
+@pytest.fixture(scope="module")
+def workers_server_process():
+    process = spawn_server(DEFAULT_HOST, WORKERS_PORT, "--workers=3", "--max_threads=10")
+
+    yield process
+
+    process.terminate()
+    process.wait()
+
+
+def send_and_receive(s, message):
+    s.sendall(message.encode("utf-8"))
+    return s.recv(1024).decode("utf-8")
+
+
+def test_workers_share_items(workers_server_process):
+    # connections are spread over the workers, yet every one sees the same items 
+    sockets = [socket.create_connection((DEFAULT_HOST, WORKERS_PORT), timeout=10) for _ in range(9)]
+    for i, s in enumerate(sockets):
+        assert send_and_receive(s, f"set key{i} 0 0 4\r\n{i:04}\r\n") == "STORED\r\n"
+    for s in sockets:
+        for i in range(len(sockets)):
+            assert send_and_receive(s, f"get key{i}\r\n") == f"VALUE key{i} 0 4\r\n{i:04}\r\nEND\r\n"
+
+    assert send_and_receive(sockets[0], "delete key5\r\n") == "DELETED\r\n"
+    assert send_and_receive(sockets[-1], "get key5\r\n") == "END\r\n"
+    for s in sockets:
+        s.close()
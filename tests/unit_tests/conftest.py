@@ -0,0 +1,29 @@
+import pytest
+
+
+class FakeClient:
+
+    '''Records what a Message writes, accepting at most max_write bytes per sendmsg call'''
+
+    def __init__(self, max_write=None):
+        self.max_write = max_write
+        self.writes = []
+
+    def sendmsg(self, buffers):
+        data = b"".join(buffers)[:self.max_write]
+        self.writes.append(data)
+        return len(data)
+
+    def close(self):
+        pass
+
+    def received(self):
+        '''Returns what was written since the last call'''
+        response = b"".join(self.writes)
+        self.writes.clear()
+        return response
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
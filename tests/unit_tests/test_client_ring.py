@@ -0,0 +1,58 @@
+import socket
+import threading
+
+import pytest
+
+from memcached.client import HashRing, ConnectionPool
+from memcached.client.client import _encode_key
+
+
+def test_ring_spreads_keys():
+    nodes = ["10.0.0.1:11211", "10.0.0.2:11211", "10.0.0.3:11211"]
+    ring = HashRing(nodes)
+    counts = {node: 0 for node in nodes}
+    for i in range(3000):
+        counts[ring.get_node(f"key{i}")] += 1
+    assert all(700 < count < 1300 for count in counts.values())
+    assert HashRing(nodes).get_node("key1") == ring.get_node("key1")
+
+
+def test_ring_moves_few_keys_on_change():
+    ring = HashRing(["a:1", "b:1", "c:1"])
+    before = {f"key{i}": ring.get_node(f"key{i}") for i in range(3000)}
+    ring.add_node("d:1")
+    moved = [key for key, node in before.items() if ring.get_node(key) != node]
+    # only keys taken over by the new node move 
+    assert all(ring.get_node(key) == "d:1" for key in moved)
+    assert len(moved) < 1200
+
+    ring.remove_node("d:1")
+    assert all(ring.get_node(key) == node for key, node in before.items())
+    with pytest.raises(ValueError):
+        HashRing().get_node("key")
+
+
+def test_pool_reuses_and_limits_connections():
+    listener = socket.create_server(("127.0.0.1", 0))
+    accepted = []
+    threading.Thread(target=lambda: [accepted.append(listener.accept()) for _ in range(2)], daemon=True).start()
+
+    pool = ConnectionPool("127.0.0.1", listener.getsockname()[1], max_size=2, timeout=0.2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+        with pool.connection() as third:
+            assert third is not first
+            with pytest.raises(TimeoutError):
+                with pool.connection():
+                    pass
+    pool.close()
+    listener.close()
+
+
+def test_keys_validated():
+    assert _encode_key("dogs") == b"dogs"
+    for key in ["", "two words", "a" * 251, "new\nline"]:
+        with pytest.raises(ValueError):
+            _encode_key(key)
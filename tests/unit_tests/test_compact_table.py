@@ -0,0 +1,108 @@
+import tracemalloc
+
+from memcached.hash_table import HashTable, ShardedHashTable, Node, Command, Response 
+from memcached.compact_table import CompactHashTable
+from memcached.expiry import ServerClock
+
+
+def test_compact_insert_get_remove():
+    table = CompactHashTable(capacity=3)
+    table.insert("dogs", 2, 0, 4, 0, Command.SET)
+    table.insert("cats", 3, 1, 4, 0, Command.SET)
+    assert table.capacity == 6
+
+    table.insert("horses", 5, 2, 6, 0, Command.SET)
+    table.insert("dogs", 1, 3, 4, 0, Command.SET)
+    assert table.capacity == 12
+    assert table.get("dogs") == (1, 3, 4)
+    assert table.get("horses") == (5, 2, 6)
+
+    table.delete("dogs")
+    assert table.get("dogs") is None
+    assert table.get_size() == 2
+    assert table.insert("cats", 0, 0, 4, 0, Command.ADD) == Response.NOT_STORED.value
+    assert table.insert("fish", 0, 0, 4, 0, Command.REPLACE) == Response.NOT_STORED.value
+
+
+def test_compact_tombstones_and_reuse():
+    table = CompactHashTable(capacity=16)
+    for round in range(50):
+        for i in range(6):
+            assert table.insert(f"key{i}", round, 0, 4, 0, Command.SET) == Response.STORED.value
+        for i in range(6):
+            assert table.get(f"key{i}") == (round, 0, 4)
+            assert table.delete(f"key{i}") == Response.DELETED.value
+
+    # churn purges tombstones instead of growing, and freed entries are reused 
+    assert table.get_size() == 0
+    assert table.get_capacity() == 16
+    assert len(table.keys) == 6
+
+
+def test_compact_expiry_and_lru():
+    item_size = len("key0") + 4 + Node.ITEM_OVERHEAD
+    clock = ServerClock()
+    table = CompactHashTable(capacity=8, memory_limit=3 * item_size, clock=clock)
+    table.insert("key0", b"abcd", 0, 4, 1, Command.SET)
+    clock.current_time += 1
+    assert table.get("key0") is None
+
+    for i in range(3):
+        table.insert(f"key{i}", b"abcd", 0, 4, 0, Command.SET)
+    table.get("key0")
+    table.insert("key3", b"abcd", 0, 4, 0, Command.SET)
+    assert table.get("key1") is None
+    assert table.get("key0") is not None and table.get("key3") is not None
+    assert table.get_evictions() == 1 and table.get_memory_used() == 3 * item_size
+
+
+def test_compact_reap_expired():
+    clock = ServerClock()
+    table = CompactHashTable(capacity=8, clock=clock)
+    for i in range(5):
+        table.insert(f"key{i}", b"abcd", 0, 4, 1, Command.SET)
+    table.insert("key0", b"abcd", 0, 4, 0, Command.SET)
+
+    clock.current_time += 1
+    items, byte_count, more = table.reap_expired(100)
+    assert items == 4 and not more
+    assert table.get_size() == 1 and table.get("key0") == (b"abcd", 0, 4)
+
+
+def test_compact_sharded():
+    table = ShardedHashTable(capacity=16, num_shards=4, table_class=CompactHashTable)
+    for i in range(20):
+        table.insert(f"key{i}", i, 0, 4, 0, Command.SET)
+    assert all(isinstance(shard, CompactHashTable) for shard in table.shards)
+    assert table.get_size() == 20 and table.get("key7") == (7, 0, 4)
+
+
+def measure_table_memory(table_class, keys, value):
+    tracemalloc.start()
+    table = table_class(capacity=16)
+    for key in keys:
+        table.insert(key, value, 0, len(value), 0, Command.SET)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return memory
+
+
+def test_compact_uses_less_memory_per_item():
+    keys = [f"key{i}" for i in range(20000)]
+    value = b"abcd"
+    chained = measure_table_memory(HashTable, keys, value)
+    compact = measure_table_memory(CompactHashTable, keys, value)
+    assert compact * 2.5 < chained
+
+
+def test_compact_cas_and_increment():
+    table = CompactHashTable(capacity=8)
+    table.insert("count", b"1", 0, 1, 0, Command.SET)
+    cas = table.get("count", with_cas=True)[3]
+    assert table.increment("count", 9) == 10
+    assert table.insert("count", b"5", 0, 1, 0, Command.CAS, cas) == Response.EXISTS.value
+
+    assert table.insert("count", b"0", 0, 1, 0, Command.APPEND) == Response.STORED.value
+    assert table.get("count") == (b"100", 0, 3)
+    assert table.increment("count", 1, decrement=True) == 99
+    assert table.increment("missing", 1) == Response.NOT_FOUND.value
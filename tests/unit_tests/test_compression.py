@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from memcached.hash_table import HashTable, ShardedHashTable, Command
+from memcached.compact_table import CompactHashTable
+from memcached.compression import Compressor, CompressedValue
+from memcached.chunks import CHUNK_SIZE, ChunkedValue
+from memcached.stats import ServerStats
+
+
+DOCUMENT = json.dumps([{"id": i, "name": f"user{i}", "active": True} for i in range(100)]).encode("utf-8")
+
+
+@pytest.mark.parametrize("table_class", [HashTable, CompactHashTable])
+def test_values_compressed_above_threshold(table_class):
+    table = table_class(capacity=8, compress_threshold=256)
+    table.insert("doc", DOCUMENT, 5, len(DOCUMENT), 0, Command.SET)
+    table.insert("small", b"x" * 100, 1, 100, 0, Command.SET)
+
+    # clients get their bytes and flag back, while the table only holds the compressed form 
+    assert table.get("doc") == (DOCUMENT, 5, len(DOCUMENT))
+    assert table.get("small") == (b"x" * 100, 1, 100)
+    assert table.get_memory_used() < len(DOCUMENT) // 3
+    assert table.compressor.compressions == 1
+    assert table.compressor.bytes_in == len(DOCUMENT) and table.compressor.bytes_out < len(DOCUMENT) // 3
+
+    table.insert("doc", b"]", 0, 1, 0, Command.APPEND)
+    assert table.get("doc") == (DOCUMENT + b"]", 5, len(DOCUMENT) + 1)
+    _, items = table.scan(0, 100)
+    assert sorted(item[1] for item in items) == [DOCUMENT + b"]", b"x" * 100]
+
+
+def test_incompressible_and_chunked_values():
+    compressor = Compressor(threshold=16)
+    random_bytes = bytes(range(256))
+    assert compressor.compress(random_bytes, 256) is random_bytes
+
+    chunked = ChunkedValue([bytearray(b"a" * CHUNK_SIZE), bytearray(b"b" * CHUNK_SIZE)], 2 * CHUNK_SIZE)
+    compressed = compressor.compress(chunked, 2 * CHUNK_SIZE)
+    assert isinstance(compressed, CompressedValue) and len(compressed) < 1000
+    assert compressor.decompress(compressed) == bytes(chunked)
+
+    with pytest.raises(ValueError):
+        Compressor(level=10)
+
+
+def test_compression_stats():
+    hash_table = ShardedHashTable(capacity=16, num_shards=2, compress_threshold=256, compress_level=9)
+    for i in range(4):
+        hash_table.insert(f"doc{i}", DOCUMENT, 0, len(DOCUMENT), 0, Command.SET)
+        hash_table.get(f"doc{i}")
+
+    report = dict(ServerStats(hash_table).report())
+    assert report["compressions"] == 4
+    assert report["compressed_bytes_in"] == 4 * len(DOCUMENT)
+    assert float(report["compression_ratio"]) > 3
+    assert "compress_time" in report and "decompress_time" in report
+
+    assert "compression_ratio" not in dict(ServerStats(HashTable(capacity=4)).report())
@@ -0,0 +1,151 @@
+import pytest
+
+from memcached.hash_table import HashTable, ShardedHashTable, Command, Response
+from memcached.compact_table import CompactHashTable
+from memcached.slab_table import SlabHashTable
+from memcached.shared_table import SharedHashTable
+from memcached.tinylfu import TinyLFUHashTable
+from memcached.generations import get_namespace
+from memcached.expiry import ServerClock, ExpiryReaper
+from memcached.message import Message
+from memcached.stats import ServerStats
+from conftest import FakeClient
+
+
+TABLE_CLASSES = [HashTable, CompactHashTable, SlabHashTable, TinyLFUHashTable]
+
+
+def test_get_namespace():
+    assert get_namespace("tenant42:user:7") == "tenant42"
+    assert get_namespace(":user") == ""
+    assert get_namespace("user7") is None
+
+
+@pytest.mark.parametrize("table_class", TABLE_CLASSES)
+def test_flush_all(table_class):
+    table = table_class(16, None, ServerClock())
+    for i in range(6):
+        table.insert(f"key{i}", b"value", 0, 5, 0, Command.SET)
+    table.flush()
+
+    assert table.get("key0") is None
+    assert table.insert("key1", b"x", 0, 1, 0, Command.REPLACE) == Response.NOT_STORED.value
+    assert table.increment("key2", 1) == Response.NOT_FOUND.value
+    assert table.delete("key3") == Response.NOT_FOUND.value
+    # items stored after the flush are unaffected
+    assert table.insert("key4", b"new", 0, 3, 0, Command.SET) == Response.STORED.value
+    assert table.get("key4") == (b"new", 0, 3)
+    # the flushed item left behind is removed by a scan
+    assert table.get_size() == 2
+    assert table.scan(0, 1024, metadata=True)[1][0][0] == "key4"
+    assert table.get_size() == 1
+
+
+@pytest.mark.parametrize("table_class", TABLE_CLASSES)
+def test_delayed_flush_all(table_class):
+    clock = ServerClock()
+    table = table_class(16, None, clock)
+    table.insert("before", b"1", 0, 1, 0, Command.SET)
+    table.flush(10)
+    clock.current_time = 9
+    table.insert("during", b"2", 0, 1, 0, Command.SET)
+    assert table.get("before") == (b"1", 0, 1)
+
+    clock.current_time = 10
+    assert table.get("before") is None
+    assert table.get("during") is None
+    table.insert("after", b"3", 0, 1, 0, Command.SET)
+    assert table.get("after") == (b"3", 0, 1)
+    assert table.generations.flush_at is None
+
+
+@pytest.mark.parametrize("table_class", TABLE_CLASSES)
+def test_delete_expired_item(table_class):
+    clock = ServerClock()
+    table = table_class(16, None, clock)
+    table.insert("short", b"1", 0, 1, 5, Command.SET)
+    table.insert("long", b"1", 0, 1, 50, Command.SET)
+    clock.current_time = 10
+    # not reaped yet, but gone as far as clients can tell 
+    assert table.delete("short") == Response.NOT_FOUND.value
+    assert table.delete("long") == Response.DELETED.value
+    assert table.delete("long") == Response.END.value
+    assert table.get_size() == 0
+
+
+@pytest.mark.parametrize("table_class", TABLE_CLASSES)
+def test_flush_namespace(table_class):
+    table = table_class(16, None, ServerClock())
+    table.insert("a:1", b"1", 0, 1, 0, Command.SET)
+    table.insert("a:2", b"2", 0, 1, 0, Command.SET)
+    table.insert("b:1", b"3", 0, 1, 0, Command.SET)
+    table.insert("a", b"4", 0, 1, 0, Command.SET)
+    table.flush_namespace("a")
+
+    assert table.get("a:1") is None
+    assert table.get("b:1") == (b"3", 0, 1)
+    # keys without a delimiter belong to no namespace
+    assert table.get("a") == (b"4", 0, 1)
+    table.insert("a:2", b"5", 0, 1, 0, Command.SET)
+    assert table.get("a:2") == (b"5", 0, 1)
+
+
+def test_shared_flush_all():
+    table = SharedHashTable(1 << 20, num_shards=2, value_size=64)
+    try:
+        table.insert("a", b"1", 0, 1, 0, Command.SET)
+        table.insert("b", b"2", 0, 1, 0, Command.SET)
+        for shard in table.get_shards():
+            shard.flush()
+        assert table.get("a") is None
+        table.insert("c", b"3", 0, 1, 0, Command.SET)
+        assert table.get("c") == (b"3", 0, 1)
+        for shard in table.get_shards():
+            shard.reap_expired(shard.capacity)
+        assert table.get_size() == 1
+        client = FakeClient()
+        message = Message(None, client, None, table, None, None)
+        message.receive(b"flush_namespace a\r\nflush_all\r\n")
+        assert b"".join(client.writes) == b"SERVER_ERROR namespaces not supported with shared memory\r\nOK\r\n"
+    finally:
+        table.close()
+        table.unlink()
+
+
+def test_reaper_crawls_after_flush(monkeypatch):
+    monkeypatch.setattr(ExpiryReaper, "CRAWL_BATCHES", 2)
+    clock = ServerClock()
+    hash_table = ShardedHashTable(64, 2, clock=clock)
+    for i in range(50):
+        hash_table.insert(f"key{i}", b"value", 0, 5, 0, Command.SET)
+    reaper = ExpiryReaper(hash_table, batch_size=8, clock=clock)
+    memory_used = hash_table.get_memory_used()
+    for shard in hash_table.get_shards():
+        shard.flush()
+    reaper.schedule_crawl()
+
+    # each sweep only crawls CRAWL_BATCHES batches
+    items, _ = reaper.sweep()
+    assert 0 < items < 50
+    while reaper.crawl_queue:
+        reaper.sweep()
+    assert hash_table.get_size() == 0
+    assert reaper.reclaimed_items == 50
+    assert reaper.reclaimed_bytes == memory_used
+
+
+def test_flush_commands(client):
+    hash_table = ShardedHashTable(16, 2)
+    stats = ServerStats(hash_table)
+    message = Message(None, client, None, hash_table, None, None, stats)
+    message.receive(b"set x:1 0 0 1\r\na\r\nset y:1 0 0 1\r\nb\r\nflush_namespace x\r\nget x:1 y:1\r\n")
+    assert b"".join(client.writes) == b"STORED\r\nSTORED\r\nOK\r\nVALUE y:1 0 1\r\nb\r\nEND\r\n"
+
+    client.writes.clear()
+    message.receive(b"flush_all noreply\r\nget y:1\r\nflush_all 0\r\n")
+    assert b"".join(client.writes) == b"END\r\nOK\r\n"
+    assert dict(stats.report())["cmd_flush"] == 3
+
+    client.writes.clear()
+    message.receive(b"flush_all -1\r\n")
+    assert b"".join(client.writes).startswith(b"CLIENT_ERROR ")
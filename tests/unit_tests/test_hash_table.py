@@ -1,6 +1,7 @@
-import time
+from threading import Thread
 
-from memcached.hash_table import HashTable, Command, Response 
+from memcached.hash_table import HashTable, ShardedHashTable, Node, Command, Response 
+from memcached.expiry import ServerClock, ExpiryReaper
 
 
 
@@ -23,17 +24,17 @@ def test_insert_get_remove():
 
 
 def test_with_expiry():
-
-    table = HashTable(capacity=6)
+    clock = ServerClock()
+    table = HashTable(capacity=6, clock=clock)
     table.insert("dogs", 2, 1, 4, -1, Command.SET)
     table.insert("cats", 2, 2, 4, 0, Command.SET)
-    table.insert("fish", 2, 3, 4, 0.1, Command.SET)
+    table.insert("fish", 2, 3, 4, 1, Command.SET)
 
     assert table.get("dogs") is None
     assert table.get("cats") == (2, 2, 4)
     assert table.get("fish") == (2, 3, 4)
 
-    time.sleep(0.1)
+    clock.current_time += 1
     assert table.get("fish") is None
 
 
@@ -63,6 +64,206 @@ def test_set_add_replace():
     # replace should not store if key is not present 
     response_add = table.insert("horse", 3, 1, 4, 0, Command.REPLACE)
     assert response_add == Response.NOT_STORED.value
-    assert table.get("horse") is None 
-   
-    
\ No newline at end of file
+    assert table.get("horse") is None
+
+
+def test_sharded_insert_get_remove():
+    table = ShardedHashTable(capacity=16, num_shards=4)
+    for i in range(20):
+        assert table.insert(f"key{i}", i, 0, 4, 0, Command.SET) == Response.STORED.value
+    assert table.get_size() == 20
+    assert sum(shard.get_size() > 0 for shard in table.shards) > 1
+
+    assert table.get("key3") == (3, 0, 4)
+    assert table.insert("key3", 0, 0, 4, 0, Command.ADD) == Response.NOT_STORED.value
+    assert table.delete("key3") == Response.DELETED.value
+    assert table.get("key3") is None
+    assert table.get_size() == 19
+
+
+def test_sharded_locks_are_independent():
+    table = ShardedHashTable(capacity=16, num_shards=4)
+    locked_shard = table.get_shard("key0")
+    other_key = next(f"key{i}" for i in range(100) if table.get_shard(f"key{i}") is not locked_shard)
+    
+    # a held lock on one shard must not block operations on another 
+    with locked_shard.lock:
+        thread = Thread(target=table.insert, args=(other_key, 1, 0, 4, 0, Command.SET))
+        thread.start()
+        thread.join(timeout=1)
+        assert not thread.is_alive()
+    assert table.get(other_key) == (1, 0, 4)
+
+
+def test_lru_eviction_under_memory_limit():
+    item_size = len("key0") + 4 + Node.ITEM_OVERHEAD
+    table = HashTable(capacity=8, memory_limit=3 * item_size)
+    for i in range(3):
+        table.insert(f"key{i}", b"abcd", 0, 4, 0, Command.SET)
+    assert table.get_memory_used() == 3 * item_size
+
+    # reading key0 makes key1 the least recently used item 
+    assert table.get("key0") == (b"abcd", 0, 4)
+    table.insert("key3", b"abcd", 0, 4, 0, Command.SET)
+    assert table.get("key1") is None
+    assert table.get("key0") is not None and table.get("key3") is not None
+    assert table.get_evictions() == 1
+    assert table.get_memory_used() == 3 * item_size
+
+    # items larger than the whole budget are refused 
+    assert table.insert("big", b"x" * 1000, 0, 1000, 0, Command.SET) == Response.NOT_STORED.value
+
+    table.delete("key0")
+    assert table.get_size() == 2 and table.get_memory_used() == 2 * item_size
+
+
+def test_incremental_rehash():
+    table = HashTable(capacity=64)
+    for i in range(32):
+        table.insert(f"key{i}", i, 0, 4, 0, Command.SET)
+
+    # the doubling has started but only a few buckets have moved so far 
+    assert table.get_capacity() == 128 and table.is_rehashing()
+    for i in range(32):
+        assert table.get(f"key{i}") == (i, 0, 4)
+    assert table.delete("key0") == Response.DELETED.value
+
+    for _ in range(64):
+        table.get("missing")
+    assert not table.is_rehashing()
+    assert table.get_size() == 31
+    assert all(table.get(f"key{i}") == (i, 0, 4) for i in range(1, 32))
+
+
+def test_rehash_drops_expired_items():
+    clock = ServerClock()
+    table = HashTable(capacity=4, clock=clock)
+    table.insert("fish", 1, 0, 4, 1, Command.SET)
+    clock.current_time += 1
+    table.insert("dogs", 2, 0, 4, 0, Command.SET)
+    table.finish_rehash()
+    assert table.get_size() == 1 and table.get("dogs") == (2, 0, 4)
+
+
+def test_anagram_keys_and_chain_report():
+    table = HashTable(capacity=1 << 16)
+    keys = ["user:12", "user:21", "resu:12", "user:1:2"]
+    for key in keys:
+        table.insert(key, 0, 0, 1, 0, Command.SET)
+
+    report = table.get_chain_report()
+    assert report["buckets"] == 1 << 16
+    assert report["used_buckets"] == len(keys)
+    assert report["max_chain"] == 1
+    assert report["histogram"] == {0: (1 << 16) - len(keys), 1: len(keys)}
+
+
+def test_reap_expired_in_batches():
+    clock = ServerClock()
+    table = HashTable(capacity=64, clock=clock)
+    for i in range(10):
+        table.insert(f"short{i}", b"abcd", 0, 4, 1, Command.SET)
+    table.insert("long", b"abcd", 0, 4, 5, Command.SET)
+    table.insert("forever", b"abcd", 0, 4, 0, Command.SET)
+    # updating the TTL leaves a stale heap entry that must not remove the item 
+    table.insert("short0", b"abcd", 0, 4, 5, Command.SET)
+
+    clock.current_time += 1
+    items, byte_count, more = table.reap_expired(4)
+    assert items == 3 and more
+    assert byte_count == 3 * (len("short1") + 4 + Node.ITEM_OVERHEAD)
+
+    items, byte_count, more = table.reap_expired(100)
+    assert items == 6 and not more
+    assert table.get_size() == 3
+    assert table.get("short0") is not None
+
+
+def test_reaper_sweeps_every_shard():
+    clock = ServerClock()
+    table = ShardedHashTable(capacity=64, num_shards=4, clock=clock)
+    for i in range(40):
+        table.insert(f"key{i}", b"abcd", 0, 4, 1, Command.SET)
+
+    reaper = ExpiryReaper(table, batch_size=3, clock=clock)
+    assert reaper.sweep() == (0, 0)
+
+    # move the clock's origin back so the sweep's own tick lands one second later 
+    clock.started -= 1
+    items, byte_count = reaper.sweep()
+    assert items == 40 and table.get_size() == 0 and table.get_memory_used() == 0
+    assert reaper.reclaimed_items == 40 and reaper.reclaimed_bytes == byte_count
+
+
+def test_reaper_sweeps_in_bounded_steps():
+    clock = ServerClock()
+    table = ShardedHashTable(64, 2, clock=clock)
+    for i in range(40):
+        table.insert(f"key{i}", b"abcd", 0, 4, 1, Command.SET)
+    reaper = ExpiryReaper(table, batch_size=3, clock=clock)
+    clock.started -= 1
+
+    # each bounded sweep reaps at most two batches and leaves the rest pending 
+    steps = 0
+    while True:
+        items, _ = reaper.sweep(max_batches=2)
+        assert items <= 6
+        steps += 1
+        if not reaper.pending:
+            break
+    assert steps > 1 and table.get_size() == 0 and reaper.reclaimed_items == 40
+
+
+def test_scan_survives_resizes():
+    table = HashTable(capacity=3)
+    for i in range(20):
+        table.insert(f"key{i}", i, 0, 1, 0, Command.SET)
+
+    # keep growing the table between batches; every original key must still be returned
+    seen, cursor, added = [], 0, 20
+    while True:
+        cursor, items = table.scan(cursor, 4)
+        seen += [item[0] for item in items]
+        for _ in range(15):
+            table.insert(f"key{added}", added, 0, 1, 0, Command.SET)
+            added += 1
+        if cursor == 0:
+            break
+
+    assert table.get_capacity() > 3 * 2 ** 5
+    assert all(f"key{i}" in seen for i in range(20))
+    assert len(seen) - len(set(seen)) < len(seen) // 4
+
+
+def test_cas_append_prepend():
+    table = HashTable(capacity=8)
+    assert table.insert("dogs", b"12", 0, 2, 0, Command.CAS, 1) == Response.NOT_FOUND.value
+    assert table.insert("dogs", b"12", 0, 2, 0, Command.APPEND) == Response.NOT_STORED.value
+
+    table.insert("dogs", b"12", 7, 2, 0, Command.SET)
+    cas = table.get("dogs", with_cas=True)[3]
+    assert table.insert("dogs", b"34", 0, 2, 0, Command.APPEND) == Response.STORED.value
+    assert table.insert("dogs", b"00", 0, 2, 0, Command.PREPEND) == Response.STORED.value
+    assert table.get("dogs") == (b"001234", 7, 6)
+
+    # the appends changed the cas unique, so the stale one is refused 
+    assert table.insert("dogs", b"x", 0, 1, 0, Command.CAS, cas) == Response.EXISTS.value
+    cas = table.get("dogs", with_cas=True)[3]
+    assert table.insert("dogs", b"x", 1, 1, 0, Command.CAS, cas) == Response.STORED.value
+    assert table.get("dogs") == (b"x", 1, 1)
+
+
+def test_increment():
+    table = HashTable(capacity=8)
+    assert table.increment("count", 1) == Response.NOT_FOUND.value
+
+    table.insert("count", b"10", 3, 2, 0, Command.SET)
+    assert table.increment("count", 5) == 15
+    assert table.increment("count", 20, decrement=True) == 0
+    assert table.get("count") == (b"0", 3, 1)
+
+    table.insert("count", b"18446744073709551615", 0, 20, 0, Command.SET)
+    assert table.increment("count", 2) == 1
+
+    table.insert("count", b"ten", 0, 3, 0, Command.SET)
+    assert table.increment("count", 1) == Response.NON_NUMERIC.value
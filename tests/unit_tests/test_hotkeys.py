@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+from memcached.hotkeys import CountMinSketch, HeavyHitters, HotKeyTracker
+from memcached.message import Message
+from memcached.hash_table import HashTable
+from memcached.stats import ServerStats
+from conftest import FakeClient
+
+
+def test_count_min_sketch():
+    sketch = CountMinSketch(width=256, depth=4)
+    for i in range(1000):
+        sketch.add(f"key{i % 100}")
+    sketch.add("hot", 500)
+    # estimates never undercount, and with room to spare barely overcount 
+    assert all(10 <= sketch.estimate(f"key{i}") <= 20 for i in range(100))
+    assert sketch.estimate("hot") == 500
+
+    sketch.decay()
+    assert sketch.estimate("hot") == 250
+
+
+def test_heavy_hitters_keep_the_largest():
+    heavy_hitters = HeavyHitters(k=2)
+    for key, estimate in [("a", 5), ("b", 1), ("c", 3), ("b", 2), ("d", 4)]:
+        heavy_hitters.offer(key, estimate)
+    assert heavy_hitters.top() == [("a", 5), ("d", 4)]
+
+    heavy_hitters.decay()
+    assert heavy_hitters.top() == [("a", 2), ("d", 2)]
+
+
+def test_tracker_finds_hot_keys_from_samples():
+    random.seed(1)
+    tracker = HotKeyTracker(sample_rate=0.1, k=5)
+    keys = [f"cold{i}" for i in range(5000)] + ["viral"] * 5000 + ["warm"] * 1000
+    random.shuffle(keys)
+    countdown = tracker.next_gap()
+    for key in keys:
+        countdown -= 1
+        if countdown == 0:
+            tracker.record(key)
+            countdown = tracker.next_gap()
+
+    report = tracker.report()
+    assert [key for key, _ in report[:2]] == ["viral", "warm"]
+    assert 4000 < report[0][1] < 6000
+    assert 900 < tracker.sampled < 1300
+
+    with pytest.raises(ValueError):
+        HotKeyTracker(sample_rate=0)
+
+
+def test_tracker_decays(monkeypatch):
+    tracker = HotKeyTracker(sample_rate=1, decay_interval=60)
+    for _ in range(8):
+        tracker.record("key")
+    monkeypatch.setattr(tracker, "last_decay", tracker.last_decay - 61)
+    assert tracker.report() == [("key", 4)]
+
+
+def test_stats_hotkeys(client):
+    hash_table = HashTable(capacity=16)
+    message = Message(None, client, None, hash_table, None, None, 
+                      ServerStats(hash_table, hotkeys=HotKeyTracker(sample_rate=1)))
+    message.receive(b"set a 0 0 1\r\n1\r\nget a a b\r\nmg a v\r\ndelete b\r\nstats hotkeys\r\n")
+    response = client.writes[-1]
+    assert b"STAT hotkeys_sample_rate 1\r\nSTAT hotkeys_sampled 6\r\n" in response
+    assert b"STAT hotkey:a 4\r\nSTAT hotkey:b 2\r\nEND\r\n" in response
+
+    plain_client = FakeClient()
+    plain = Message(None, plain_client, None, hash_table, None, None, ServerStats(hash_table))
+    plain.receive(b"stats hotkeys\r\n")
+    assert plain_client.writes[-1].startswith(b"CLIENT_ERROR ")
@@ -0,0 +1,27 @@
+import random
+
+from benchmarks.load_generator import build_key_sampler, parse_ratio, percentile
+
+
+def test_key_samplers():
+    rng = random.Random(1)
+    uniform = build_key_sampler(100, "uniform", 1.0, rng)
+    zipf = build_key_sampler(100, "zipf", 1.0, rng)
+
+    uniform_keys = [uniform() for _ in range(10000)]
+    zipf_keys = [zipf() for _ in range(10000)]
+    assert all(0 <= key < 100 for key in uniform_keys + zipf_keys)
+    # with s = 1 over 100 keys the most popular key gets about 19% of the draws
+    assert 1500 < zipf_keys.count(0) < 2300
+    assert uniform_keys.count(0) < 200
+
+
+def test_ratio_and_percentiles():
+    assert parse_ratio("1:10") == 10 / 11
+    assert parse_ratio("1:0") == 0.0
+
+    latencies = [i / 1000 for i in range(1, 1001)]
+    assert percentile(latencies, 0.5) == 0.5
+    assert percentile(latencies, 0.99) == 0.99
+    assert percentile(latencies, 0.999) == 0.999
+    assert percentile([], 0.5) == 0.0
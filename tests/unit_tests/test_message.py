@@ -1,42 +1,72 @@
 import pytest 
 from unittest.mock import patch
 
-from message import Message
-from hash_table import HashTable
+from memcached.message import Message
+from memcached.hash_table import HashTable, ShardedHashTable, Command
+from memcached.chunks import CHUNK_SIZE, ChunkedValue
+from memcached.server import create_hash_table
+from conftest import FakeClient
 
 
-def test_message_str_processing():
+class FakeSocket(FakeClient):
+
+    '''FakeClient that also serves incoming data to recv and recv_into, recording the calls'''
+
+    def __init__(self, data):
+        super().__init__()
+        self.data = memoryview(data)
+        self.calls = []
+
+    def recv(self, size):
+        self.calls.append("recv")
+        data, self.data = self.data[:size], self.data[size:]
+        return bytes(data)
+
+    def recv_into(self, buffer):
+        self.calls.append("recv_into")
+        size = min(len(buffer), len(self.data))
+        buffer[:size] = self.data[:size]
+        self.data = self.data[size:]
+        return size
+
+
+def test_message_bytes_processing():
     message = Message(None, None, None, None, None, None) 
     
     ### mssage comes in all at once 
-    message._recv_buffer += "set test 0 0 4\r\n1234\r\nget test\r\n"
+    message._recv_buffer += b"set test 0 0 4\r\n1234\r\nget test\r\n"
 
-    buffered, multiline = message._check_complete_buffered()
-    assert buffered and multiline
+    command, args, no_reply, value = message._next_command()
+    assert command == "set" and args == ["test", 0, 0, 4] and value == b"1234"
 
-    header, value = message._strip_message(multiline)
-    assert header == "set test 0 0 4" and value == "1234"
+    command, args, no_reply, value = message._next_command()
+    assert command == "get" and args == ["test"] and value is None
 
-    buffered, multiline = message._check_complete_buffered()
-    assert buffered and not multiline
-    header, value = message._strip_message(multiline)
-    assert header == "get test" and value is None
-
-    buffered, multiline = message._check_complete_buffered()
-    assert not buffered 
+    assert message._next_command() is None 
 
     ### message comes in incrementally 
-    message._recv_buffer += "set test 0 0 4"
-    buffered, multiline = message._check_complete_buffered()
-    assert not buffered 
+    message._recv_buffer += b"set test 0 0 4"
+    assert message._next_command() is None 
     
-    message._recv_buffer += "\r\n"
-    buffered, multiline = message._check_complete_buffered()
-    assert not buffered 
+    message._recv_buffer += b"\r\n"
+    assert message._next_command() is None 
 
-    message._recv_buffer += "1234\r\n"
-    buffered, multiline = message._check_complete_buffered()
-    assert buffered
+    message._recv_buffer += b"1234\r\n"
+    command, args, no_reply, value = message._next_command()
+    assert value == b"1234"
+
+
+def test_value_framed_by_byte_count():
+    message = Message(None, None, None, None, None, None) 
+
+    # binary values may contain the line terminator 
+    message._recv_buffer += b"set test 0 0 6\r\n12\r\n34\r\n"
+    command, args, no_reply, value = message._next_command()
+    assert value == b"12\r\n34"
+
+    message._recv_buffer += b"set test 0 0 2\r\n1234\r\n"
+    with pytest.raises(ValueError):
+        message._next_command()
 
 
 def test_parse_header():
@@ -55,8 +85,16 @@ def test_parse_header():
     assert command == "get" and args == ["test"] and not no_reply
 
 
+    header = "gets test other"
+    command, args, no_reply = message._parse_header(header)
+    assert command == "gets" and args == ["test", "other"] and not no_reply
+
     ### too many or too few values passed 
-    header = "get test noreply"
+    header = "get"
+    with pytest.raises(ValueError):
+        command, args, no_reply = message._parse_header(header)
+
+    header = "delete test other noreply"
     with pytest.raises(ValueError):
         command, args, no_reply = message._parse_header(header)
    
@@ -71,19 +109,156 @@ def test_perform_cache_operations():
     message = Message(None, None, None, hash_table, None, None)
     
     with patch.object(Message, '_send_response'):
-        command, args, value = "set", ["test", 0, 0, 4], "1234"
+        command, args, value = "set", ["test", 0, 0, 4], b"1234"
         no_reply = False
         return_str = message._perform_cache_operation(command, args, no_reply, value)
-        assert return_str == "STORED"
+        assert return_str == [b"STORED\r\n"]
 
         command, args = "get", ["test"]
         return_str = message._perform_cache_operation(command, args, no_reply, value)
-        assert return_str == "VALUE 1234 0 4"
+        assert b"".join(return_str) == b"VALUE test 0 4\r\n1234\r\nEND\r\n"
 
         command, args = "do_another_thing", ["test"]
         with pytest.raises(ValueError):
             message._perform_cache_operation(command, args, no_reply, value)
 
 
+def test_receive_pipelined_bytes(client):
+    message = Message(None, client, None, HashTable(capacity=5), None, None)
+
+    message.receive(b"set test 0 0 4\r\n\x00\r\n\xff\r\nget te")
+    message.receive(b"st\r\n")
+    assert client.received() == b"STORED\r\nVALUE test 0 4\r\n\x00\r\n\xff\r\nEND\r\n"
+    assert message._recv_buffer == b"" and message._recv_pos == 0
+
+
+def test_multi_get_single_send(client):
+    hash_table = ShardedHashTable(capacity=16, num_shards=4)
+    message = Message(None, client, None, hash_table, None, None)
+    hash_table.insert("a", b"1", 1, 1, 0, Command.SET)
+    hash_table.insert("b", b"22", 2, 2, 0, Command.SET)
+
+    message.receive(b"get a missing b a\r\n")
+    assert client.writes == [
+        b"VALUE a 1 1\r\n1\r\nVALUE b 2 2\r\n22\r\nVALUE a 1 1\r\n1\r\nEND\r\n"]
 
+    client.writes.clear()
+    message.receive(b"gets a b\r\n")
+    lines = client.received().split(b"\r\n")
+    assert lines[0].startswith(b"VALUE a 1 1 ") and lines[2].startswith(b"VALUE b 2 2 ")
+    assert lines[-2:] == [b"END", b""]
 
+    # a new store changes the cas unique 
+    cas_before = lines[0].split(b" ")[-1]
+    client.writes.clear()
+    message.receive(b"set a 1 0 1\r\n3\r\ngets a\r\n")
+    lines = client.received().split(b"\r\n")
+    assert lines[0] == b"STORED" and lines[1].split(b" ")[-1] != cas_before
+
+
+def test_pipelined_responses_coalesced(client):
+    message = Message(None, client, None, HashTable(capacity=5), None, None)
+
+    message.receive(b"".join(b"set key%d 0 0 1\r\nx\r\n" % i for i in range(500)))
+    assert client.writes == [b"STORED\r\n" * 500]
+
+    # noreply commands produce no writes at all 
+    client.writes.clear()
+    message.receive(b"set a 0 0 1 noreply\r\nx\r\ndelete a noreply\r\n")
+    assert client.writes == []
+
+
+def test_partial_writes_resume():
+    client = FakeClient(max_write=7)
+    hash_table = HashTable(capacity=5)
+    hash_table.insert("key", b"x" * 20, 0, 20, 0, Command.SET)
+    message = Message(None, client, None, hash_table, None, None)
+
+    message.receive(b"get key\r\nget key\r\n")
+    expected = b"VALUE key 0 20\r\n" + b"x" * 20 + b"\r\nEND\r\n"
+    assert all(len(write) <= 7 for write in client.writes)
+    assert client.received() == expected * 2
+
+
+def test_large_values_received_into_chunks(client):
+    hash_table = HashTable(capacity=5)
+    message = Message(None, client, None, hash_table, None, None)
+    value = bytes(range(256)) * 1024
+
+    # the value arrives in small pieces and never accumulates in the receive buffer 
+    request = b"set big 3 0 %d\r\n" % len(value) + value + b"\r\nget big\r\n"
+    for start in range(0, len(request), 5000):
+        message.receive(request[start:start + 5000])
+        assert len(message._recv_buffer) < 5000
+
+    stored = hash_table.get("big")[0]
+    assert isinstance(stored, ChunkedValue)
+    assert all(len(chunk) == CHUNK_SIZE for chunk in stored.chunks)
+    assert bytes(stored) == value
+    # chunks are handed to sendmsg as they are 
+    assert client.received() == b"STORED\r\nVALUE big 3 %d\r\n" % len(value) + value + b"\r\nEND\r\n"
+
+
+def test_large_values_read_with_recv_into():
+    value = b"y" * (3 * CHUNK_SIZE + 10)
+    client = FakeSocket(b"set big 0 0 %d\r\n" % len(value) + value + b"\r\n")
+    hash_table = HashTable(capacity=5)
+    message = Message(None, client, None, hash_table, None, None)
+    while client.data:
+        message._recv()
+
+    assert bytes(hash_table.get("big")[0]) == value
+    assert client.calls.count("recv_into") >= 3
+    assert client.received() == b"STORED\r\n"
+
+
+def test_values_over_max_item_size_rejected(client):
+    hash_table = HashTable(capacity=5)
+    message = Message(None, client, None, hash_table, None, None, max_item_size=100)
+
+    # the oversized value is swallowed and the connection stays usable 
+    message.receive(b"set big 0 0 101 noreply\r\n" + b"z" * 101 + b"\r\nset small 0 0 1\r\nz\r\n")
+    assert client.received() == b"SERVER_ERROR object too large for cache\r\nSTORED\r\n"
+    assert hash_table.get("big") is None
+
+    with pytest.raises(ValueError):
+        message.receive(b"set big 0 0 101\r\n" + b"z" * 102 + b"\r\n")
+
+
+@pytest.mark.parametrize("table_engine", ["chained", "compact", "slab"])
+def test_invalid_flags_are_refused(table_engine, client):
+    hash_table = create_hash_table(16, table_engine=table_engine)
+    message = Message(None, client, None, hash_table, None, None)
+
+    # the value is swallowed with the error, and no table ever sees the flag 
+    message.receive(b"set a -1 0 1\r\nx\r\nset a 4294967296 0 1 noreply\r\nx\r\nms a 1 F-1\r\nx\r\n"
+                    b"set a 4294967295 0 1\r\nx\r\nget a\r\n")
+    assert client.received() == (b"CLIENT_ERROR flags must be an unsigned 32 bit integer\r\n" * 2 
+                                 + b"CLIENT_ERROR Flags must be an unsigned 32 bit integer\r\n"
+                                 + b"STORED\r\nVALUE a 4294967295 1\r\nx\r\nEND\r\n")
+
+
+def test_cas_incr_and_append_commands(client):
+    message = Message(None, client, None, HashTable(capacity=16), None, None)
+
+    message.receive(b"incr n 1\r\nset n 0 0 1\r\n5\r\nincr n 10\r\ndecr n 100\r\nappend n 0 0 1\r\n7\r\n")
+    assert client.received() == b"NOT_FOUND\r\nSTORED\r\n15\r\n0\r\nSTORED\r\n"
+
+    client.writes.clear()
+    message.receive(b"gets n\r\n")
+    cas = int(client.received().split(b"\r\n")[0].split()[-1])
+
+    client.writes.clear()
+    message.receive(b"cas n 0 0 1 %d\r\na\r\ncas n 0 0 1 %d\r\nb\r\nprepend n 0 0 1\r\nz\r\nget n\r\n" % (cas, cas))
+    assert client.received() == b"STORED\r\nEXISTS\r\nSTORED\r\nVALUE n 0 2\r\nza\r\nEND\r\n"
+
+    client.writes.clear()
+    message.receive(b"incr n 1\r\n")
+    assert client.received() == b"CLIENT_ERROR cannot increment or decrement non-numeric value\r\n"
+    assert (message.stats.incr_misses, message.stats.incr_hits, message.stats.decr_hits) == (1, 2, 1)
+    assert (message.stats.cas_hits, message.stats.cas_badval) == (1, 1)
+
+    with pytest.raises(ValueError):
+        message._parse_header("incr n -1")
+    with pytest.raises(ValueError):
+        message._parse_header("cas n 0 0 1")
@@ -0,0 +1,102 @@
+import base64
+import pytest 
+
+from memcached.message import Message
+from memcached.hash_table import HashTable, ShardedHashTable
+from memcached.meta import parse_meta_header
+from conftest import FakeClient
+
+
+def make_message(hash_table=None):
+    client = FakeClient()
+    return Message(None, client, None, hash_table or HashTable(capacity=16), None, None), client
+
+
+def test_parse_meta_header():
+    assert parse_meta_header(["mn"]) == ("mn", [])
+    assert parse_meta_header(["mg", "foo", "v", "Oab"]) == ("mg", ["foo", [("v", ""), ("O", "ab")]])
+    assert parse_meta_header(["ms", "foo", "4", "T10"]) == ("ms", ["foo", 4, [("T", "10")]])
+    assert parse_meta_header(["md", "Zm9v", "b"]) == ("md", ["foo", [("b", "")]])
+
+    with pytest.raises(ValueError):
+        parse_meta_header(["ms", "foo"])
+    with pytest.raises(ValueError):
+        parse_meta_header(["mg", "not*base64", "b"])
+
+
+def test_meta_set_get_delete():
+    message, client = make_message()
+
+    message.receive(b"ms foo 4 F5 T0 c O1\r\n1234\r\n")
+    response = client.received()
+    assert response.startswith(b"HD c") and response.endswith(b" O1\r\n")
+
+    message.receive(b"mg foo v f s t k Oxy\r\n")
+    assert client.received() == b"VA 4 f5 s4 t-1 kfoo Oxy\r\n1234\r\n"
+
+    message.receive(b"mg foo f\r\n")
+    assert client.received() == b"HD f5\r\n"
+
+    message.receive(b"ms foo 2 ME\r\nab\r\n")
+    assert client.received() == b"NS\r\n"
+
+    message.receive(b"md foo O9\r\nmd foo\r\nmg foo v\r\n")
+    assert client.received() == b"HD O9\r\nNF\r\nEN\r\n"
+
+
+def test_meta_ttl_and_modes():
+    message, client = make_message()
+
+    message.receive(b"ms foo 2 MR\r\nab\r\n")
+    assert client.received() == b"NS\r\n"
+    message.receive(b"ms foo 2 T100\r\nab\r\nmg foo t v\r\n")
+    assert client.received() == b"HD\r\nVA 2 t100\r\nab\r\n"
+    # T on mg touches the item
+    message.receive(b"mg foo T300 t\r\nmg foo t\r\n")
+    assert client.received() == b"HD t300\r\nHD t300\r\n"
+
+    message.receive(b"ms foo 2 MX\r\nab\r\n")
+    assert client.received() == b"CLIENT_ERROR Mode X not supported for ms command\r\n"
+
+
+def test_meta_quiet_mode_and_noop():
+    message, client = make_message()
+
+    # only the misses of mg, and failures, are reported in quiet mode; mn marks the end of the batch 
+    message.receive(b"ms a 1 q\r\n1\r\nmg a v q\r\nmg b v q Ob\r\nmd b q\r\nmd a q\r\nmn\r\n")
+    assert client.received() == b"VA 1\r\n1\r\nNF\r\nMN\r\n"
+
+
+def test_meta_base64_keys():
+    message, client = make_message()
+    encoded = base64.b64encode(b"key with spaces").decode("ascii")
+
+    message.receive(f"ms {encoded} 2 b\r\nhi\r\n".encode("utf-8"))
+    assert client.received() == b"HD\r\n"
+    message.receive(f"mg {encoded} b k v\r\n".encode("utf-8"))
+    assert client.received() == f"VA 2 b k{encoded}\r\nhi\r\n".encode("utf-8")
+    assert message.hash_table.get("key with spaces") == (b"hi", 0, 2)
+
+
+def test_meta_binary_keys_on_sharded_table():
+    message, client = make_message(ShardedHashTable(16, 4))
+    encoded = base64.b64encode(b"\xff\xfe").decode("ascii")
+
+    message.receive(f"ms {encoded} 2 b\r\nhi\r\nmg {encoded} b k v\r\n".encode("utf-8"))
+    assert client.received() == f"HD\r\nVA 2 b k{encoded}\r\nhi\r\n".encode("utf-8")
+    assert message.hash_table.get(b"\xff\xfe".decode("utf-8", "surrogateescape")) == (b"hi", 0, 2)
+
+
+def test_meta_append_and_compare():
+    message, client = make_message()
+
+    message.receive(b"ms foo 2 MA\r\nab\r\n")
+    assert client.received() == b"NS\r\n"
+    message.receive(b"ms foo 2 c\r\nab\r\n")
+    cas = int(client.received().split()[1][1:])
+
+    message.receive(b"ms foo 2 MA\r\ncd\r\nms foo 1 MP\r\nz\r\nmg foo v\r\n")
+    assert client.received() == b"HD\r\nHD\r\nVA 5\r\nzabcd\r\n"
+
+    message.receive(b"ms foo 1 C%d\r\nx\r\nms bar 1 C1\r\nx\r\n" % cas)
+    assert client.received() == b"EX\r\nNF\r\n"
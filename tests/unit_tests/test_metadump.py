@@ -0,0 +1,62 @@
+import pytest
+
+from memcached.hash_table import HashTable, ShardedHashTable, Command
+from memcached.compact_table import CompactHashTable
+from memcached.slab_table import SlabHashTable
+from memcached.expiry import ServerClock
+from memcached.message import Message
+from memcached.stats import ServerStats
+
+
+@pytest.mark.parametrize("table_class", [HashTable, CompactHashTable, SlabHashTable])
+def test_scan_metadata(table_class):
+    clock = ServerClock()
+    table = table_class(16, None, clock)
+    table.insert("a", b"12345", 0, 5, 0, Command.SET)
+    table.insert("b", b"1", 0, 1, 0, Command.SET)
+    clock.current_time = 10
+    table.insert("c", b"1", 0, 1, 100, Command.SET)
+    clock.current_time = 20
+    table.get("a")
+
+    items = []
+    cursor = 0
+    while True:
+        cursor, batch = table.scan(cursor, 1, metadata=True)
+        items += batch
+        if cursor == 0:
+            break
+    metadata = {key: (expiry, last_access, cas) for key, _, expiry, last_access, cas in items}
+    assert metadata == {"a": (0, 20, 1), "b": (0, 0, 2), "c": (110, 10, 3)}
+    sizes = {key: size for key, size, _, _, _ in items}
+    assert sizes["a"] - sizes["b"] == 4
+
+
+def test_metadump_streams_in_batches(monkeypatch, client):
+    monkeypatch.setattr(Message, "METADUMP_BATCH", 4)
+    hash_table = ShardedHashTable(16, 2)
+    for i in range(20):
+        hash_table.insert(f"key {i}" if i == 0 else f"key{i}", b"x", 0, 1, 0 if i % 2 else 60, Command.SET)
+    message = Message(None, client, None, hash_table, None, None, ServerStats(hash_table))
+    message.receive(b"lru_crawler metadump all\r\nget key1\r\n")
+    assert message.is_dumping()
+
+    resumes = 0
+    while message.is_dumping():
+        # every shard's lock is free between batches 
+        for shard in hash_table.get_shards():
+            assert not shard.lock.locked()
+        message.resume()
+        resumes += 1
+    assert resumes > 2
+
+    lines = b"".join(client.writes).decode().split("\r\n")
+    assert lines[-5:] == ["END", "VALUE key1 0 1", "x", "END", ""]
+    entries = [line for line in lines if line.startswith("key=")]
+    assert len(entries) == 20
+    assert any(entry.startswith("key=key%200 exp=") and " exp=-1 " not in entry for entry in entries)
+    assert any(entry.startswith("key=key1 exp=-1 la=") for entry in entries)
+
+    client.writes.clear()
+    message.receive(b"lru_crawler metadump 1\r\n")
+    assert client.writes == [b"CLIENT_ERROR Only lru_crawler metadump all is supported\r\n"]
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from memcached.hash_table import HashTable
+from memcached.message import Message
+from memcached.profiling import SlowLog, RequestProfiler
+from memcached.stats import ServerStats
+from conftest import FakeClient
+
+
+class SlowClient(FakeClient):
+
+    def sendmsg(self, buffers):
+        time.sleep(0.002)
+        return super().sendmsg(buffers)
+
+
+def test_slowlog_keeps_newest_entries():
+    slowlog = SlowLog(threshold=5, max_entries=2)
+    assert slowlog.threshold_ns == 5000
+    slowlog.record("get", ["a", "b", "c"], ("127.0.0.1", 5000), (1000, 2000, 3000, 4000))
+    slowlog.record("set", ["d"], None, (0, 0, 7000, 0))
+    slowlog.record("delete", ["e"], None, (0, 0, 9000, 0))
+
+    report = slowlog.report()
+    assert report[:3] == [("slowlog_threshold", 5), ("slowlog_len", 2), ("slowlog_logged", 3)]
+    assert [name for name, _ in report[3:]] == ["slowlog:3", "slowlog:2"]
+    assert report[3][1].split(" ", 1)[1] == "9us delete e parse=0us lock_wait=0us table=9us send=0us client=None"
+
+    slowlog.reset()
+    assert slowlog.report() == [("slowlog_threshold", 5), ("slowlog_len", 0), ("slowlog_logged", 3)]
+    with pytest.raises(ValueError):
+        slowlog.set_threshold(-1)
+
+
+def test_slowlog_records_phases(client):
+    hash_table = HashTable(capacity=16)
+    message = Message(None, client, ("10.0.0.1", 1234), hash_table, None, None, 
+                      ServerStats(hash_table, slowlog=SlowLog(threshold=0)))
+    message.receive(b"set a 0 0 1\r\n1\r\n")
+    assert message.slowlog.logged == 0
+
+    message.receive(b"slowlog 1\r\n")
+    assert client.writes[-1] == b"OK\r\n"
+    # every command takes longer than a microsecond 
+    message.receive(b"get a b\r\n")
+    message.receive(b"stats slowlog\r\n")
+    report = client.writes[-1].decode()
+    assert "STAT slowlog_threshold 1\r\n" in report
+    entry = next(line for line in report.split("\r\n") if line.startswith("STAT slowlog:") and " get " in line)
+    assert " get a +1 parse=" in entry and "lock_wait=" in entry and "client=10.0.0.1:1234" in entry
+
+    message.receive(b"slowlog 0\r\nslowlog reset\r\n")
+    assert message.slowlog.report()[1] == ("slowlog_len", 0)
+    client.writes.clear()
+    message.receive(b"slowlog\r\nslowlog -5\r\nslowlog 5\r\n")
+    assert client.writes == [b"CLIENT_ERROR Must pass 2 items for slowlog command\r\n"
+                             b"CLIENT_ERROR Slow log threshold must be non-negative\r\nOK\r\n"]
+
+
+def test_slowlog_logs_slow_flush():
+    hash_table = HashTable(capacity=16)
+    message = Message(None, SlowClient(), None, hash_table, None, None, 
+                      ServerStats(hash_table, slowlog=SlowLog(threshold=1000)))
+    message.receive(b"get a\r\n")
+    entries = [value for name, value in message.slowlog.report() if name.startswith("slowlog:")]
+    assert len(entries) == 1 and " flush " in entries[0]
+
+
+def test_profiler_samples_every_nth_command(client):
+    profiler = RequestProfiler()
+    hash_table = HashTable(capacity=16)
+    message = Message(None, client, None, hash_table, None, None, ServerStats(hash_table, profiler=profiler))
+    message.receive(b"set a 0 0 1\r\n1\r\nget a\r\n")
+    assert profiler.profiled == 0
+
+    message.receive(b"profile on 2\r\n")
+    assert client.writes[-1] == b"OK\r\n"
+    message.receive(b"get a\r\n" * 5)
+    assert profiler.profiled == 3
+    message.receive(b"profile off\r\n" + b"get a\r\n" * 4)
+    assert profiler.profiled == 3
+
+    message.receive(b"stats profile\r\n")
+    report = client.writes[-1].decode()
+    assert "STAT profile_every 0\r\nSTAT profile_commands 3\r\n" in report
+    assert "_perform_cache_operation" in report
+
+    message.receive(b"profile reset\r\n")
+    assert profiler.report() == [("profile_every", 0), ("profile_commands", 0)]
+    for header in (b"profile\r\n", b"profile start\r\n", b"profile off 2\r\n", b"profile on 0\r\n"):
+        message.receive(header)
+        assert client.writes[-1].startswith(b"CLIENT_ERROR ")
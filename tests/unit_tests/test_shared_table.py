@@ -0,0 +1,116 @@
+import multiprocessing
+
+import pytest
+
+from memcached.hash_table import Command, Response
+from memcached.shared_table import SharedHashTable, SharedTableShard, TOMBSTONES
+from memcached.expiry import ServerClock
+
+
+@pytest.fixture
+def shared_table():
+    tables = []
+
+    def create(*args, **kwargs):
+        tables.append(SharedHashTable(*args, **kwargs))
+        return tables[-1]
+
+    yield create
+    for table in tables:
+        table.close()
+        table.unlink()
+
+
+def test_shared_insert_get_remove(shared_table):
+    table = shared_table(1 << 20, num_shards=4, value_size=64)
+    assert table.insert("dogs", b"2222", 0, 4, 0, Command.SET) == Response.STORED.value
+    assert table.insert("cats", b"333", 1, 3, 0, Command.SET) == Response.STORED.value
+    assert table.insert("dogs", b"1", 3, 1, 0, Command.SET) == Response.STORED.value
+    assert table.get("dogs") == (b"1", 3, 1)
+    assert table.get("cats", with_cas=True) == (b"333", 1, 3, 1)
+
+    assert table.insert("cats", b"0000", 0, 4, 0, Command.ADD) == Response.NOT_STORED.value
+    assert table.insert("fish", b"0000", 0, 4, 0, Command.REPLACE) == Response.NOT_STORED.value
+    # values must fit in a slot
+    assert table.insert("fish", b"0" * 65, 0, 65, 0, Command.SET) == Response.NOT_STORED.value
+
+    assert table.delete("dogs") == Response.DELETED.value
+    assert table.get("dogs") is None
+    assert table.delete("dogs") == Response.END.value
+    assert table.get_size() == 1
+    assert table.get_memory_used() == len("cats") + 3 + 48
+
+
+def test_shared_clock_eviction_and_compaction(shared_table):
+    table = shared_table(1 << 16, num_shards=1, value_size=64)
+    shard = table.get_shards()[0]
+    capacity = shard.get_capacity()
+
+    # the referenced key survives while the others are evicted around it
+    table.insert("hot", b"1", 0, 1, 0, Command.SET)
+    for i in range(capacity * 4):
+        assert table.get("hot") is not None
+        assert table.insert(f"key{i}", b"x" * 10, 0, 10, 0, Command.SET) == Response.STORED.value
+
+    assert table.get_size() <= capacity * SharedTableShard.MAX_LOAD
+    assert table.get_evictions() == capacity * 4 + 1 - table.get_size()
+    assert table.get("hot") == (b"1", 0, 1)
+    assert table.get(f"key{capacity * 4 - 1}") is not None
+
+    # churn leaves tombstones that compaction clears, so probes for absent keys stay short
+    for round in range(20):
+        for i in range(capacity // 2):
+            table.insert(f"churn{i}", b"x", 0, 1, 0, Command.SET)
+            table.delete(f"churn{i}")
+    assert shard.get_size() + shard.header[TOMBSTONES] <= capacity * SharedTableShard.MAX_FILL
+    assert table.get("churn0") is None
+
+
+def test_shared_expiry_and_reaping(shared_table):
+    clock = ServerClock()
+    table = shared_table(1 << 16, num_shards=2, value_size=16, clock=clock)
+    for i in range(10):
+        table.insert(f"short{i}", b"x", 0, 1, 1, Command.SET)
+    table.insert("long", b"x", 0, 1, 100, Command.SET)
+
+    clock.current_time += 1
+    assert table.get("short0") is None
+    items = 0
+    for shard in table.get_shards():
+        more = True
+        while more:
+            batch_items, _, more = shard.reap_expired(8)
+            items += batch_items
+    assert items == 9
+    assert table.get_size() == 1
+    assert table.get("long") is not None
+
+
+def insert_from_child(table):
+    for i in range(100):
+        table.insert(f"child{i}", b"%d" % i, 0, len(b"%d" % i), 0, Command.SET)
+
+
+def test_shared_across_processes(shared_table):
+    table = shared_table(1 << 20, num_shards=8, value_size=16)
+    process = multiprocessing.get_context("fork").Process(target=insert_from_child, args=(table,))
+    process.start()
+    process.join()
+
+    assert process.exitcode == 0
+    assert table.get_size() == 100
+    assert table.get("child42") == (b"42", 0, 2)
+
+
+def test_shared_cas_append_and_increment(shared_table):
+    table = shared_table(1 << 20, num_shards=2, value_size=64)
+    table.insert("count", b"7", 5, 1, 0, Command.SET)
+    cas = table.get("count", with_cas=True)[3]
+    assert table.increment("count", 3) == 10
+    assert table.insert("count", b"1", 0, 1, 0, Command.CAS, cas) == Response.EXISTS.value
+
+    assert table.insert("count", b"0", 0, 1, 0, Command.APPEND) == Response.STORED.value
+    assert table.insert("count", b"9", 0, 1, 0, Command.PREPEND) == Response.STORED.value
+    assert table.get("count") == (b"9100", 5, 4)
+    assert table.increment("count", 10000, decrement=True) == 0
+    assert table.increment("missing", 1) == Response.NOT_FOUND.value
@@ -0,0 +1,154 @@
+import tracemalloc
+
+from memcached.hash_table import HashTable, ShardedHashTable, Command, Response
+from memcached.slab_table import SlabHashTable, ITEM_HEADER
+from memcached.slabs import SlabAllocator, NO_CHUNK
+from memcached.expiry import ServerClock
+from memcached.stats import ServerStats
+from memcached.message import Message
+from memcached.server import create_hash_table
+
+
+def test_allocator_size_classes_and_free_lists():
+    slabs = SlabAllocator(max_pages=2, page_size=4096, min_chunk=64, growth_factor=2)
+    assert slabs.chunk_sizes == [64, 128, 256, 512, 1024, 2048, 4096]
+    assert slabs.get_class(64) == 0 and slabs.get_class(65) == 1 and slabs.get_class(4097) is None
+
+    chunks = [slabs.allocate(0) for _ in range(64)]
+    assert len(set(chunks)) == 64 and slabs.get_total_memory() == 4096
+    assert slabs.allocate(4) == 4096
+    # both pages are taken, so only freed chunks can be handed out again 
+    assert slabs.allocate(0) == NO_CHUNK
+    slabs.free(chunks[5])
+    assert slabs.allocate(0) == chunks[5]
+    assert slabs.get_report()[0] == {"class": 0, "chunk_size": 64, "total_pages": 1, "total_chunks": 64, 
+                                     "used_chunks": 64}
+
+
+def test_slab_insert_get_remove():
+    table = SlabHashTable(capacity=4, page_size=4096)
+    table.insert("dogs", b"22", 0, 2, 0, Command.SET)
+    table.insert("cats", b"333", 1, 3, 0, Command.SET)
+    table.insert("horses", b"5", 2, 1, 0, Command.SET)
+    table.insert("dogs", b"1" * 500, 3, 500, 0, Command.SET)
+    assert table.capacity == 8
+    assert table.get("dogs") == (b"1" * 500, 3, 500)
+    assert table.get("horses", with_cas=True) == (b"5", 2, 1, 3)
+
+    assert table.delete("dogs") == Response.DELETED.value
+    assert table.get("dogs") is None and table.get_size() == 2
+    assert table.insert("cats", b"4", 0, 1, 0, Command.APPEND) == Response.STORED.value
+    assert table.increment("cats", 1) == 3335
+    assert table.get("cats") == (b"3335", 1, 4)
+    assert table.memory_used == sum(size * count for size, count in table.get_size_histogram(1).items())
+
+
+def test_slab_evicts_within_size_class():
+    table = SlabHashTable(capacity=16, memory_limit=8192, page_size=4096)
+    for i in range(30):
+        table.insert(f"small{i}", b"x" * 10, 0, 10, 0, Command.SET)
+    table.insert("large", b"y" * 2000, 0, 2000, 0, Command.SET)
+    table.get("small0")
+    for i in range(30, 50):
+        table.insert(f"small{i}", b"x" * 10, 0, 10, 0, Command.SET)
+
+    # small items evict the least recently used small items, never the large one 
+    assert table.get_evictions() > 0
+    assert table.get("large") == (b"y" * 2000, 0, 2000)
+    assert table.get("small0") is not None and table.get("small1") is None
+    assert table.slabs.get_total_memory() == 8192
+
+
+def test_slab_reassigns_pages_to_new_size_classes():
+    table = SlabHashTable(capacity=16, memory_limit=4 * 4096, page_size=4096)
+    for i in range(500):
+        table.insert(f"small{i}", b"x" * 10, 0, 10, 0, Command.SET)
+    assert set(table.slabs.page_classes) == {0} and len(table.slabs.page_classes) == 4
+
+    # a class with no pages takes one from the full class, evicting the items on it
+    size = table.get_size()
+    assert table.insert("large", b"y" * 2000, 0, 2000, 0, Command.SET) == Response.STORED.value
+    assert table.get("large") == (b"y" * 2000, 0, 2000)
+    assert table.get_size() < size and table.slabs.page_classes.count(0) == 3
+    assert table.get_size() > 1
+    assert len(table.scan(0, 4 * 4096)[1]) == table.get_size()
+
+    # pages left empty by deletes go to whichever class runs out next
+    for key, *_ in table.scan(0, 4 * 4096)[1]:
+        table.delete(key)
+    assert table.get_size() == 0
+    for i in range(4):
+        assert table.insert(f"huge{i}", b"z" * 4000, 0, 4000, 0, Command.SET) == Response.STORED.value
+    assert set(table.slabs.page_classes) == {len(table.slabs.chunk_sizes) - 1}
+    assert table.insert("small", b"x", 0, 1, 0, Command.SET) == Response.STORED.value
+    assert table.get("huge0") is None and table.get("huge3") is not None
+
+
+def test_slab_expiry_scan_and_compression():
+    clock = ServerClock()
+    table = SlabHashTable(capacity=8, clock=clock, compress_threshold=100, page_size=4096)
+    for i in range(20):
+        table.insert(f"key{i}", b"%d" % i, 0, len(b"%d" % i), 1 if i % 2 else 0, Command.SET)
+    table.insert("doc", b"abc" * 300, 0, 900, 0, Command.SET)
+    assert table.get("doc") == (b"abc" * 300, 0, 900) and table.memory_used < 20 * 100 + 900
+
+    cursor, keys = 0, []
+    while True:
+        cursor, items = table.scan(cursor, 7)
+        keys += [item[0] for item in items]
+        if cursor == 0:
+            break
+    assert sorted(keys) == sorted([f"key{i}" for i in range(20)] + ["doc"])
+
+    clock.current_time += 1
+    memory_used = table.memory_used
+    items, byte_count, more = table.reap_expired(100)
+    assert (items, more) == (10, False) and byte_count == memory_used - table.memory_used
+    assert table.get_size() == 11 and table.get("key1") is None and table.get("key2") == (b"2", 0, 1)
+
+
+def test_slab_uses_less_python_memory_per_item():
+    def measure(table_class):
+        tracemalloc.start()
+        table = table_class(capacity=8192)
+        for i in range(20000):
+            table.insert(f"key{i}", b"v" * 50, 0, 50, 0, Command.SET)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return memory
+
+    assert measure(SlabHashTable) < 0.75 * measure(HashTable)
+
+
+def test_slab_increment_out_of_memory(client):
+    table = SlabHashTable(capacity=16, memory_limit=4096, page_size=4096)
+    # the counter fills a chunk of the smallest class, so one more digit needs a class with no pages 
+    key = "n" * (table.slabs.chunk_sizes[0] - ITEM_HEADER.size - 19)
+    table.insert(key, b"9" * 19, 0, 19, 0, Command.SET)
+    message = Message(None, client, None, table, None, None)
+    message.receive(b"incr %b 1\r\nget %b\r\n" % (key.encode(), key.encode()))
+    assert client.received() == (b"SERVER_ERROR out of memory storing object\r\n" 
+                                 b"VALUE %b 0 19\r\n%b\r\nEND\r\n" % (key.encode(), b"9" * 19))
+    assert (message.stats.incr_hits, message.stats.incr_misses) == (1, 0)
+
+
+def test_slab_stores_max_size_values():
+    value = b"v" * Message.MAX_ITEM_SIZE
+    key = "k" * 250
+    # a page holds a whole page of value only once it also has room for the header and key 
+    assert SlabHashTable(16).insert(key, value, 0, len(value), 0, Command.SET) == Response.NOT_STORED.value
+
+    hash_table = create_hash_table(16, shards=2, memory_limit=8 * SlabAllocator.PAGE_SIZE, table_engine="slab")
+    assert hash_table.insert(key, value, 5, len(value), 0, Command.SET) == Response.STORED.value
+    assert hash_table.get(key) == (value, 5, len(value))
+    assert hash_table.insert("small", b"x", 0, 1, 0, Command.SET) == Response.STORED.value
+    assert hash_table.get("small") == (b"x", 0, 1)
+
+
+def test_stats_slabs():
+    hash_table = ShardedHashTable(capacity=16, num_shards=2, table_class=SlabHashTable)
+    for i in range(10):
+        hash_table.insert(f"key{i}", b"v", 0, 1, 0, Command.SET)
+    report = dict(ServerStats(hash_table).report("slabs"))
+    assert report["0:used_chunks"] == 10 and report["0:chunk_size"] == SlabAllocator.MIN_CHUNK
+    assert report["active_slabs"] == 1 and report["total_malloced"] == 2 * SlabAllocator.PAGE_SIZE
@@ -0,0 +1,89 @@
+import time
+
+from memcached.hash_table import HashTable, ShardedHashTable, Command, Response
+from memcached.compact_table import CompactHashTable
+from memcached.expiry import ServerClock, server_clock
+from memcached.server import create_hash_table
+from memcached.snapshot import Snapshotter, write_snapshot, restore_snapshot, read_item_count
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "cache.snapshot")
+    # the shared clock is only ticked by servers, so bring it up to date for the expiry check 
+    server_clock.tick()
+    table = ShardedHashTable(16, 4)
+    for i in range(100):
+        table.insert(f"key{i}", b"%d" % i, i, len(b"%d" % i), 0, Command.SET)
+    table.insert("ünïcode", b"value\r\nwith lines", 7, 17, 1000, Command.SET)
+
+    assert write_snapshot(table, path, batch_size=4) == 101
+    assert read_item_count(path) == 101
+
+    for table_engine in ["chained", "compact", "slab"]:
+        restored = create_hash_table(100, table_engine=table_engine, restore_path=path)
+        assert restored.get_size() == 101
+        # sized for the snapshot, so loading it never resized
+        assert restored.get_capacity() == 203
+        assert restored.get("key42") == (b"42", 42, 2)
+        value, flag, byte_count, _, expiry = restored.get_item("ünïcode")
+        assert (value, flag, byte_count) == (b"value\r\nwith lines", 7, 17)
+        assert 999 <= expiry - restored.clock.current_time <= 1001
+
+
+def test_restored_table_scans_in_bounded_steps(tmp_path):
+    path = str(tmp_path / "cache.snapshot")
+    table = HashTable(16)
+    for i in range(20000):
+        table.insert(f"key{i}", b"x", 0, 1, 0, Command.SET)
+    write_snapshot(table, path)
+
+    # the table is sized for every item up front, but a scan step still only walks a bounded base 
+    restored = create_hash_table(100, restore_path=path)
+    assert restored.get_capacity() >= 40001 and restored.base_capacity <= HashTable.MAX_BASE_CAPACITY
+    cursor, items = restored.scan(0, 100)
+    assert cursor != 0 and 0 < len(items) <= HashTable.MAX_BASE_CAPACITY
+
+    keys = {item[0] for item in items}
+    while cursor:
+        cursor, items = restored.scan(cursor, 1000)
+        keys.update(item[0] for item in items)
+    assert len(keys) == 20000
+
+
+def test_snapshot_skips_expired_items(tmp_path):
+    path = str(tmp_path / "cache.snapshot")
+    clock = ServerClock()
+    table = HashTable(16, clock=clock)
+    table.insert("short", b"1", 0, 1, 5, Command.SET)
+    table.insert("long", b"1", 0, 1, 100, Command.SET)
+    table.insert("forever", b"1", 0, 1, 0, Command.SET)
+    write_snapshot(table, path, clock=clock)
+
+    # the snapshot stores unix times, so a restart 10 seconds later drops the short-lived item
+    later_clock = ServerClock()
+    restored = CompactHashTable(16, clock=later_clock)
+    original_time = time.time
+    time.time = lambda: original_time() + 10
+    try:
+        assert restore_snapshot(restored, path, clock=later_clock) == 2
+    finally:
+        time.time = original_time
+    assert restored.get("short") is None
+    assert 89 <= restored.get_item("long")[4] <= 91
+    assert restored.get_item("forever")[4] == 0
+
+
+def test_snapshotter_saves_on_stop(tmp_path):
+    path = str(tmp_path / "cache.snapshot")
+    table = HashTable(16)
+    table.insert("key", b"1234", 0, 4, 0, Command.SET)
+    snapshotter = Snapshotter(table, path, interval=60)
+    snapshotter.start()
+    snapshotter.stop()
+    assert read_item_count(path) == 1
+    assert not (tmp_path / "cache.snapshot.tmp").exists()
+
+
+def test_restore_missing_snapshot_starts_empty(tmp_path):
+    table = create_hash_table(100, restore_path=str(tmp_path / "missing"))
+    assert table.get_size() == 0
@@ -0,0 +1,65 @@
+import threading
+
+from memcached.message import Message
+from memcached.hash_table import ShardedHashTable, Node
+from memcached.stats import ConnectionStats, ServerStats, TimedLock
+from conftest import FakeClient
+
+
+def parse_stats(response):
+    lines = response.decode("utf-8").split("\r\n")
+    assert lines[-2:] == ["END", ""]
+    return dict(line.split(" ")[1:] for line in lines[:-2])
+
+
+def test_latency_histogram_buckets():
+    stats = ConnectionStats()
+    stats.record_latency("get", 500)
+    stats.record_latency("get", 3000)
+    stats.record_latency("get", 10 ** 12)
+    histogram = stats.latencies["get"]
+    assert histogram[0] == 1 and histogram[2] == 1 and histogram[-1] == 1
+
+
+def test_timed_lock_charges_only_contended_waits():
+    stats = ConnectionStats()
+    lock = threading.Lock()
+    with TimedLock(lock, stats):
+        pass
+    assert stats.lock_wait_ns == 0
+
+    lock.acquire()
+    threading.Timer(0.05, lock.release).start()
+    with TimedLock(lock, stats):
+        pass
+    assert stats.lock_wait_ns >= 40 * 1000 * 1000
+
+
+def test_stats_command(client):
+    hash_table = ShardedHashTable(capacity=16, num_shards=2)
+    server_stats = ServerStats(hash_table)
+    message = Message(None, client, None, hash_table, None, None, server_stats)
+    other = Message(None, FakeClient(), None, hash_table, None, None, server_stats)
+
+    message.receive(b"set a 0 0 2\r\nab\r\nset b 0 0 3 noreply\r\nabc\r\nget a b c\r\ndelete c\r\n")
+    other.receive(b"mg a v\r\nmg c v\r\n")
+    other.close()
+    client.received()
+
+    message.receive(b"stats\r\n")
+    stats = parse_stats(client.received())
+    assert stats["cmd_set"] == "2" and stats["cmd_get"] == "5"
+    assert stats["get_hits"] == "3" and stats["get_misses"] == "2"
+    assert stats["delete_misses"] == "1"
+    assert stats["curr_connections"] == "1" and stats["total_connections"] == "2"
+    assert stats["curr_items"] == "2"
+    assert stats["bytes"] == str(2 * Node.ITEM_OVERHEAD + 2 + 3 + 2)
+    assert any(name.startswith("latency:get:") for name in stats)
+    assert any(name.startswith("latency:mg:") for name in stats)
+
+    message.receive(b"stats items\r\n")
+    items = parse_stats(client.received())
+    assert int(items["items:0:number"]) + int(items["items:1:number"]) == 2
+
+    message.receive(b"stats sizes\r\n")
+    assert parse_stats(client.received()) == {"64": "2"}
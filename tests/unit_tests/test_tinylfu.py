@@ -0,0 +1,53 @@
+from memcached.hash_table import HashTable, Command
+from memcached.tinylfu import TinyLFUHashTable
+from memcached.server import create_hash_table
+from benchmarks.hit_ratio import generate_trace, compare_policies
+
+import pytest
+
+
+def test_tinylfu_window_promotes_to_main():
+    table = TinyLFUHashTable(capacity=64)
+    for i in range(300):
+        table.insert(f"key{i}", i, 0, 4, 0, Command.SET)
+    assert table.window_size == table._window_limit() == 3
+    assert table.get_size() == 300
+    # items are iterated from the window first, most recent first 
+    assert [node.key for node in table._iter_nodes()][:4] == ["key299", "key298", "key297", "key296"]
+    assert sum(table.get_size_histogram(64).values()) == 300
+
+    assert table.get("key0") == (0, 0, 4)
+    table.delete("key299")
+    assert table.window_size == 2
+    assert table.get("key299") is None
+
+
+def test_tinylfu_keeps_frequent_items_through_a_scan():
+    value = b"x" * 100
+    lru, tinylfu = HashTable(64, memory_limit=20000), TinyLFUHashTable(64, memory_limit=20000)
+    for table in (lru, tinylfu):
+        for _ in range(5):
+            for i in range(50):
+                if table.get(f"hot{i}") is None:
+                    table.insert(f"hot{i}", value, 0, 100, 0, Command.SET)
+        for i in range(500):
+            table.insert(f"scan{i}", value, 0, 100, 0, Command.SET)
+        assert table.get_evictions() > 0
+        assert table.memory_used <= 20000
+
+    assert sum(lru.get(f"hot{i}") is not None for i in range(50)) == 0
+    assert sum(tinylfu.get(f"hot{i}") is not None for i in range(50)) == 50
+
+
+def test_tinylfu_beats_lru_on_scan_heavy_trace():
+    trace = generate_trace(40000, key_space=2000, zipf_exponent=0.9, scan_every=5000, scan_length=1500, seed=1)
+    report = compare_policies(trace, memory_limit=64 * 1024, value_size=100, policies=["lru", "tinylfu"])
+    assert report["tinylfu"]["hit_ratio"] > report["lru"]["hit_ratio"]
+
+
+def test_create_hash_table_eviction_policy():
+    assert type(create_hash_table(64, eviction_policy="tinylfu")) is TinyLFUHashTable
+    assert all(type(shard) is TinyLFUHashTable for shard in 
+               create_hash_table(64, shards=2, eviction_policy="tinylfu").get_shards())
+    with pytest.raises(ValueError):
+        create_hash_table(64, table_engine="compact", eviction_policy="tinylfu")
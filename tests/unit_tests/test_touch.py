@@ -0,0 +1,79 @@
+import pytest
+
+from memcached.hash_table import HashTable, ShardedHashTable, Command, Response
+from memcached.compact_table import CompactHashTable
+from memcached.slab_table import SlabHashTable
+from memcached.shared_table import SharedHashTable
+from memcached.tinylfu import TinyLFUHashTable
+from memcached.expiry import ServerClock
+from memcached.message import Message
+from memcached.stats import ServerStats
+
+
+@pytest.mark.parametrize("table_class", [HashTable, CompactHashTable, SlabHashTable, TinyLFUHashTable])
+def test_touch(table_class):
+    clock = ServerClock()
+    table = table_class(16, None, clock)
+    table.insert("session", b"data", 3, 4, 10, Command.SET)
+    cas = table.get("session", with_cas=True)[3]
+
+    assert table.touch("missing", 100) is None
+    assert table.touch("session", 100) == (None, 3, 4, cas, 100)
+    clock.current_time = 50
+    assert table.touch("session", 100, with_value=True) == (b"data", 3, 4, cas, 150)
+
+    # the reaper skips the heap entries of earlier expiries
+    clock.current_time = 120
+    assert table.reap_expired(10)[0] == 0
+    assert table.get_item("session") == (b"data", 3, 4, cas, 150)
+    clock.current_time = 150
+    assert table.reap_expired(10)[0] == 1
+    assert table.get_size() == 0
+
+    # 0 removes the expiry, a negative exptime expires the item right away
+    table.insert("session", b"data", 0, 4, 10, Command.SET)
+    assert table.touch("session", 0)[4] == 0
+    clock.current_time = 1000
+    assert table.get("session") == (b"data", 0, 4)
+    assert table.touch("session", -1, with_value=True)[0] == b"data"
+    assert table.get("session") is None
+
+
+def test_shared_touch():
+    clock = ServerClock()
+    table = SharedHashTable(1 << 20, num_shards=2, value_size=64, clock=clock)
+    try:
+        table.insert("session", b"data", 3, 4, 10, Command.SET)
+        assert table.touch("session", 100, with_value=True) == (b"data", 3, 4, 1, 100)
+        clock.current_time = 50
+        assert table.get("session") == (b"data", 3, 4)
+        assert table.touch("missing", 100) is None
+    finally:
+        table.close()
+        table.unlink()
+
+
+def test_touch_and_gat_commands(client):
+    clock = ServerClock()
+    hash_table = ShardedHashTable(16, 2, clock=clock)
+    stats = ServerStats(hash_table)
+    message = Message(None, client, None, hash_table, None, None, stats)
+
+    message.receive(b"set a 1 10 1\r\nx\r\nset b 2 10 2\r\nyy\r\n")
+    assert client.received() == b"STORED\r\nSTORED\r\n"
+    message.receive(b"touch a 100\r\ntouch missing 100\r\ntouch b 100 noreply\r\n")
+    assert client.received() == b"TOUCHED\r\nNOT_FOUND\r\n"
+
+    message.receive(b"gat 200 a missing b\r\ngats 0 b\r\n")
+    cas = hash_table.get("b", with_cas=True)[3]
+    assert client.received() == (b"VALUE a 1 1\r\nx\r\nVALUE b 2 2\r\nyy\r\nEND\r\n"
+                                 b"VALUE b 2 2 %d\r\nyy\r\nEND\r\n" % cas)
+    assert hash_table.get_item("a")[4] == 200
+    assert hash_table.get_item("b")[4] == 0
+
+    report = dict(stats.report())
+    assert (report["cmd_touch"], report["touch_hits"], report["touch_misses"]) == (7, 5, 2)
+    assert (report["cmd_get"], report["get_hits"], report["get_misses"]) == (4, 3, 1)
+
+    message.receive(b"gat 100\r\n")
+    assert client.received().startswith(b"CLIENT_ERROR ")